@@ -0,0 +1,183 @@
+"""
+Admission control for upstream model calls.
+
+The free GitHub Models tier rate-limits hard, so concurrent chats are gated by
+an adaptive concurrency limit with a bounded wait queue (AIMD). Each response
+whose first token arrives within the latency target adds 1/limit of a slot,
+about one slot per limit's worth of fast responses. Each slow response takes
+10% off the limit, and a 429 halves it. Rate-limited calls are retried after
+their Retry-After delay within a per-request budget. Requests that cannot be
+served in time are shed fast with BusyError instead of piling up upstream.
+"""
+
+import asyncio
+import random
+from collections import deque
+from contextlib import asynccontextmanager
+
+BUSY_MESSAGE = (
+    "We're helping a lot of customers right now. Please try again in a few seconds, "
+    "or call us at +1 519-235-0853."
+)
+
+
+class BusyError(Exception):
+    """Raised when a request is shed instead of being sent upstream."""
+
+    def __init__(self, reason: str, retry_after: float = 5):
+        super().__init__(BUSY_MESSAGE)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _status_code(exc: BaseException) -> int | None:
+    """Find an HTTP status code anywhere in an exception's cause chain."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        status = getattr(exc, "status_code", None)
+        if isinstance(status, int):
+            return status
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    return _status_code(exc) == 429
+
+
+def retry_after_seconds(exc: BaseException) -> float | None:
+    """Read the Retry-After header (seconds) from the upstream response, if any."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        response = getattr(exc, "response", None)
+        headers = getattr(response, "headers", None)
+        if headers is not None:
+            for name in ("retry-after-ms", "retry-after"):
+                value = headers.get(name)
+                if value:
+                    try:
+                        seconds = float(value)
+                    except ValueError:
+                        continue
+                    return seconds / 1000 if name == "retry-after-ms" else seconds
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+class AdmissionController:
+    """Adaptive (AIMD) concurrency limit with a bounded, deadline-aware wait queue."""
+
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        max_queue: int = 32,
+        queue_timeout: float = 10,
+        latency_target: float = 4,
+        max_retries: int = 2,
+        retry_budget_seconds: float = 10,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self.retry_budget_seconds = retry_budget_seconds
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self.counters = {"admitted": 0, "shed_queue_full": 0, "shed_timeout": 0,
+                         "throttled": 0, "slow": 0, "retries": 0, "shed_rate_limited": 0}
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self) -> None:
+        if self._has_capacity() and not self._waiters:
+            self.in_flight += 1
+            self.counters["admitted"] += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.counters["shed_queue_full"] += 1
+            raise BusyError("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.counters["shed_timeout"] += 1
+            raise BusyError("queue_timeout")
+        except asyncio.CancelledError:
+            # The caller went away after a slot was handed over - give it back
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.counters["admitted"] += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        # Hand freed slots straight to waiters (the slot transfers, in_flight is re-incremented)
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_first_token(self, latency: float) -> None:
+        """Additive increase for a fast response, a 10% decrease for each slow one."""
+        if latency > self.latency_target:
+            self.counters["slow"] += 1
+            self.limit = max(self.min_limit, self.limit * 0.9)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / max(self.limit, 1))
+            self._wake()
+
+    def on_rate_limited(self) -> None:
+        self.counters["throttled"] += 1
+        self.limit = max(self.min_limit, self.limit / 2)
+
+    def retry_delay(self, exc: BaseException, attempt: int, waited: float, emitted: bool) -> float | None:
+        """Seconds to wait before retrying a failed upstream call, or None to give up.
+
+        Only rate-limited calls that have not streamed anything yet are retried.
+        A rate-limited call that cannot be retried is shed with BusyError.
+        """
+        if not is_rate_limited(exc):
+            return None
+        self.on_rate_limited()
+        delay = retry_after_seconds(exc)
+        if delay is None:
+            delay = 0.5 * 2 ** attempt + random.uniform(0, 0.25)
+        if emitted or attempt >= self.max_retries or waited + delay > self.retry_budget_seconds:
+            self.counters["shed_rate_limited"] += 1
+            raise BusyError("rate_limited", retry_after=max(delay, 1)) from exc
+        self.counters["retries"] += 1
+        return delay
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            **self.counters,
+        }
+
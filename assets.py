@@ -0,0 +1,147 @@
+"""
+Precompressed, cache-validated static assets.
+
+The chat widget is the first thing every visitor to a page embedding it
+downloads. Each asset is read once at startup and compressed once with gzip
+and, if the brotli package is installed, brotli at maximum quality. Every
+request then gets the smallest encoding the client accepts, with no
+per-request work.
+
+The content hash is the asset's version. It is used as the ETag, so a repeat
+visitor revalidates (`Cache-Control: no-cache`) and gets a 304 with no body
+while the file is unchanged. Assets are never cached as immutable: the widget
+URL is pasted into embed snippets on other sites, whose visitors would keep a
+stale widget after a deploy.
+"""
+
+import gzip
+import hashlib
+import os
+from dataclasses import dataclass, field
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+from fastapi.responses import Response
+
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# Preferred first when the client accepts several
+ENCODINGS = ("br", "gzip")
+
+
+def parse_accept_encoding(header: str | None) -> set[str]:
+    """Encodings a client accepts (q > 0) from an Accept-Encoding header."""
+    accepted, rejected = set(), set()
+    wildcard = False
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name == "*":
+            wildcard = quality > 0
+        elif quality > 0:
+            accepted.add(name)
+        else:
+            rejected.add(name)
+    if wildcard:
+        accepted |= set(ENCODINGS) - rejected
+    return accepted
+
+
+def _etag_matches(if_none_match: str | None, version: str) -> bool:
+    """True if any tag in If-None-Match names this version, in any encoding or as a weak tag."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        # Proxies may append their own suffix; "<version>-gzip" still names this content
+        if tag.strip('"').split("-", 1)[0] == version:
+            return True
+    return False
+
+
+@dataclass
+class Asset:
+    name: str
+    media_type: str
+    body: bytes
+    version: str
+    encoded: dict[str, bytes] = field(default_factory=dict)
+
+    def etag(self, encoding: str | None) -> str:
+        return f'"{self.version}-{encoding}"' if encoding else f'"{self.version}"'
+
+
+class AssetStore:
+    """Static files loaded, hashed and compressed once, served with ETag and 304 support."""
+
+    def __init__(self, directory: str = "."):
+        self.directory = directory
+        self._assets: dict[str, Asset] = {}
+        self.responses = {"full": 0, "not_modified": 0, "bytes_sent": 0, "bytes_uncompressed": 0}
+
+    def add(self, name: str, media_type: str = "text/html; charset=utf-8") -> Asset:
+        with open(os.path.join(self.directory, name), "rb") as f:
+            body = f.read()
+        asset = Asset(name=name, media_type=media_type, body=body,
+                      version=hashlib.sha256(body).hexdigest()[:16])
+        asset.encoded["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            asset.encoded["br"] = brotli.compress(body, quality=11)
+        # Tiny files can grow when compressed; never send a larger encoding
+        asset.encoded = {k: v for k, v in asset.encoded.items() if len(v) < len(body)}
+        self._assets[name] = asset
+        return asset
+
+    def get(self, name: str) -> Asset:
+        return self._assets[name]
+
+    def response(self, name: str, headers) -> Response:
+        """Serve an asset for request headers."""
+        asset = self._assets[name]
+        accepted = parse_accept_encoding(headers.get("accept-encoding"))
+        encoding = next((e for e in ENCODINGS if e in accepted and e in asset.encoded), None)
+        response_headers = {
+            "ETag": asset.etag(encoding),
+            "Cache-Control": REVALIDATE_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+        if _etag_matches(headers.get("if-none-match"), asset.version):
+            self.responses["not_modified"] += 1
+            return Response(status_code=304, headers=response_headers)
+
+        body = asset.body
+        if encoding:
+            body = asset.encoded[encoding]
+            response_headers["Content-Encoding"] = encoding
+        self.responses["full"] += 1
+        self.responses["bytes_sent"] += len(body)
+        self.responses["bytes_uncompressed"] += len(asset.body)
+        return Response(content=body, media_type=asset.media_type, headers=response_headers)
+
+    def stats(self) -> dict:
+        return {
+            "assets": {
+                name: {
+                    "version": asset.version,
+                    "bytes": len(asset.body),
+                    **{f"{encoding}_bytes": len(data) for encoding, data in asset.encoded.items()},
+                }
+                for name, asset in self._assets.items()
+            },
+            **self.responses,
+        }
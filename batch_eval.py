@@ -0,0 +1,235 @@
+"""
+Concurrent batch evaluation of the agent.
+
+Usage:
+    python coolman_agent.py --batch data/eval_queries.jsonl --output results.jsonl
+    python coolman_agent.py --batch queries.jsonl --output results.jsonl --concurrency 8 --rate 2
+
+Regression-tests knowledge-base and prompt edits against many customer
+questions at once. Each input line is a JSON object with an optional "id" and
+either a "message" or "turns" (a list of messages sent in order on one
+conversation). Optional checks: "expect_tools" (tools the conversation must
+call) and "expect_text" (substrings, case-insensitive, the final answer must
+contain).
+
+Items run on async workers sharing one agent, under a concurrency cap and a
+rate limit on model turns started per second. Each result is appended to the
+output JSONL as soon as it finishes, with per-turn latency, time to first
+token, token usage and tools called. Rerunning with the same output file
+skips the items already completed against the current knowledge base
+version, so an interrupted run resumes while a run after a knowledge-base edit
+starts over; items that errored are retried, and earlier results whose checks
+failed still fail the run.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from hedging import percentile
+from usage import start_turn
+
+
+class RequestPacer:
+    """Spaces out model turns to at most `rate` starts per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def load_items(path: str) -> list[dict]:
+    """Read the input JSONL, normalizing every item to have an id and a list of turns."""
+    items = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line)
+            turns = item.get("turns") or [item["message"]]
+            items.append({**item, "id": str(item.get("id", number)), "turns": turns})
+    return items
+
+
+def completed_results(path: str, kb_version: str) -> dict[str, dict]:
+    """Results of the items already answered without an error, against kb_version, in an existing output file."""
+    if not os.path.exists(path):
+        return {}
+    done = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by the interruption; that item runs again
+                continue
+            # Answers from an older knowledge base say nothing about the current one
+            if not result.get("error") and result.get("knowledge_base_version") == kb_version:
+                done[result["id"]] = result
+    return done
+
+
+def terminate_last_line(path: str) -> None:
+    """End a line cut short by an interruption, so the next result starts on its own line."""
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+def check(item: dict, turns: list[dict]) -> list[str]:
+    """Failed expectations of an item, given its turn results."""
+    failures = []
+    called = {name for turn in turns for name in turn["tools"]}
+    for tool in item.get("expect_tools", []):
+        if tool not in called:
+            failures.append(f"did not call {tool}")
+    answer = turns[-1]["response"].lower() if turns else ""
+    for text in item.get("expect_text", []):
+        if text.lower() not in answer:
+            failures.append(f"answer lacks {text!r}")
+    return failures
+
+
+async def run_turn(agent, thread, message: str, pacer: RequestPacer) -> dict:
+    await pacer.wait()
+    turn = start_turn()
+    started = time.perf_counter()
+    first_token = None
+    response = ""
+    async for chunk in agent.run_stream(message, thread=thread):
+        if chunk.text:
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            response += chunk.text
+    return {
+        "message": message,
+        "response": response,
+        "latency_s": round(time.perf_counter() - started, 3),
+        "ttft_s": round(first_token, 3) if first_token is not None else None,
+        "round_trips": turn.round_trips,
+        "prompt_tokens": turn.prompt_tokens,
+        "completion_tokens": turn.completion_tokens,
+        "cached_tokens": turn.cached_tokens,
+        "tools": sorted(turn.tool_calls),
+    }
+
+
+async def run_item(agent, item: dict, pacer: RequestPacer, kb_version: str) -> dict:
+    thread = agent.get_new_thread()
+    turns, error = [], None
+    try:
+        for message in item["turns"]:
+            turns.append(await run_turn(agent, thread, message, pacer))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    failures = check(item, turns) if error is None else []
+    return {
+        "id": item["id"],
+        "knowledge_base_version": kb_version,
+        "turns": turns,
+        "latency_s": round(sum(t["latency_s"] for t in turns), 3),
+        "prompt_tokens": sum(t["prompt_tokens"] for t in turns),
+        "completion_tokens": sum(t["completion_tokens"] for t in turns),
+        "tools": sorted({name for t in turns for name in t["tools"]}),
+        "passed": error is None and not failures,
+        "failures": failures,
+        "error": error,
+    }
+
+
+def print_summary(results: list[dict], elapsed: float) -> None:
+    if not results:
+        print("Nothing to run - every item is already in the output file.")
+        return
+    latencies = [t["latency_s"] for r in results for t in r["turns"]]
+    ttfts = [t["ttft_s"] for r in results for t in r["turns"] if t["ttft_s"] is not None]
+    passed = sum(r["passed"] for r in results)
+    errors = [r for r in results if r["error"]]
+    print(f"\n📋 {len(results)} items, {len(latencies)} turns in {elapsed:.1f}s")
+    print(f"  passed {passed}/{len(results)}, errors {len(errors)}")
+    if latencies:
+        print(f"  turn latency p50 {statistics.median(latencies):.2f}s  p95 {percentile(latencies, 0.95):.2f}s")
+    if ttfts:
+        print(f"  first token  p50 {statistics.median(ttfts):.2f}s  p95 {percentile(ttfts, 0.95):.2f}s")
+    print(f"  tokens: {sum(r['prompt_tokens'] for r in results)} prompt, "
+          f"{sum(r['completion_tokens'] for r in results)} completion")
+    for r in results:
+        if not r["passed"]:
+            print(f"  ❌ {r['id']}: {r['error'] or '; '.join(r['failures'])}")
+
+
+async def run_batch(args) -> list[dict]:
+    """Run the items not yet completed; returns the results of every item, including earlier runs'."""
+    from coolman_agent import create_coolman_agent, refresh_knowledge_base
+
+    items = load_items(args.input)
+    kb_version = refresh_knowledge_base()
+    done = completed_results(args.output, kb_version)
+    pending = [item for item in items if item["id"] not in done]
+    # Items completed by an earlier run still count towards the exit status
+    earlier = [done[item["id"]] for item in items if item["id"] in done]
+    if earlier:
+        print(f"⏩ Resuming: {len(earlier)} of {len(items)} items already completed")
+
+    agent = await create_coolman_agent()
+    pacer = RequestPacer(args.rate)
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+    results = []
+
+    terminate_last_line(args.output)
+    with open(args.output, "a") as output:
+        async def worker():
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                result = await run_item(agent, item, pacer, kb_version)
+                # Written as each item finishes, so an interruption loses only items in flight
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+                results.append(result)
+                marker = "✅" if result["passed"] else "❌"
+                print(f"{marker} [{len(results)}/{len(pending)}] {item['id']} ({result['latency_s']:.2f}s)")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(max(1, args.concurrency))))
+    print_summary(results, time.perf_counter() - started)
+    for r in earlier:
+        if not r["passed"]:
+            print(f"  ❌ {r['id']} (earlier run): {'; '.join(r['failures'])}")
+    return earlier + results
+
+
+def parse_args(argv: list[str]):
+    parser = argparse.ArgumentParser(prog="coolman_agent.py --batch", description="Run a batch of queries through the agent")
+    parser.add_argument("input", help="JSONL of queries ({\"message\": ...}) or scripts ({\"turns\": [...]})")
+    parser.add_argument("--output", default="batch_results.jsonl", help="Results JSONL, appended to and resumed from")
+    parser.add_argument("--concurrency", type=int, default=4, help="Items run at once")
+    parser.add_argument("--rate", type=float, default=1.0, help="Model turns started per second (0 for no limit)")
+    return parser.parse_args(argv)
+
+
+async def main(argv: list[str]) -> int:
+    results = await run_batch(parse_args(argv))
+    return 0 if all(r["passed"] for r in results) else 1
@@ -0,0 +1,151 @@
+"""
+Measure the web server's cold start.
+
+Usage:
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --max-live-seconds 3 --max-ready-seconds 15 --output cold_start.json
+
+Reports:
+  * the import time of web_api and its slowest imports (python -X importtime),
+    failing if a deferred heavy module (agent_framework, openai) is imported
+    eagerly again;
+  * against the fake model server: time from launching uvicorn until /health
+    answers (liveness), until /ready (agent created), and until the first
+    chat answer, plus the server's own startup phase report from /health.
+
+Exits non-zero when a check or budget fails, so CI catches startup regressions.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from load_driver import ROOT, stop_servers, wait_until_up
+
+# Must stay out of `import web_api`; they are imported by the background warm-up
+DEFERRED_MODULES = ("agent_framework", "openai")
+
+
+def measure_imports(top: int) -> dict:
+    env = {**os.environ, "GITHUB_TOKEN": os.environ.get("GITHUB_TOKEN", "fake-token")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import web_api"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((name.rstrip(), int(cumulative)))
+    total = next(us for name, us in modules if name.strip() == "web_api")
+    eager = sorted({name.strip().split(".")[0] for name, _ in modules} & set(DEFERRED_MODULES))
+    # Direct imports of web_api are indented by three spaces
+    direct = sorted(((name.strip(), us) for name, us in modules if name.startswith("   ") and not name.startswith("    ")),
+                    key=lambda item: -item[1])
+    return {
+        "web_api_import_ms": round(total / 1000, 1),
+        "slowest_imports_ms": {name: round(us / 1000, 1) for name, us in direct[:top]},
+        "eager_deferred_modules": eager,
+    }
+
+
+def measure_startup(args) -> dict:
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "benchmarks", "fake_model_server.py"),
+        "--port", str(args.model_port), "--ttft", "0.05",
+    ])
+    processes = [fake]
+    try:
+        wait_until_up(f"http://127.0.0.1:{args.model_port}", path="/", timeout=30)
+        env = {
+            **os.environ,
+            "MODEL_BASE_URL": f"http://127.0.0.1:{args.model_port}/inference",
+            "GITHUB_TOKEN": os.environ.get("GITHUB_TOKEN", "fake-token"),
+            "SESSION_BACKEND": "memory",
+        }
+        url = f"http://127.0.0.1:{args.api_port}"
+        launched = time.perf_counter()
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "web_api:app", "--port", str(args.api_port), "--log-level", "warning"],
+            cwd=ROOT, env=env,
+        ))
+
+        def poll(path: str) -> float:
+            deadline = launched + 60
+            while time.perf_counter() < deadline:
+                try:
+                    if httpx.get(f"{url}{path}", timeout=1).status_code == 200:
+                        return time.perf_counter() - launched
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.05)
+            raise RuntimeError(f"{path} did not answer within 60s")
+
+        live = poll("/health")
+        # A visitor arriving right after the server comes up: the request waits for the warm-up
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            chat = pool.submit(httpx.post, f"{url}/chat", json={"message": "Tell me about your fleet cards"}, timeout=60)
+            ready = poll("/ready")
+            chat.result().raise_for_status()
+            first_chat = time.perf_counter() - launched
+        time.sleep(0.5)  # let the background pre-warm record its phase
+        report = httpx.get(f"{url}/health").json().get("startup", {})
+    finally:
+        stop_servers(processes)
+    return {
+        "live_s": round(live, 3),
+        "ready_s": round(ready, 3),
+        "first_chat_s": round(first_chat, 3),
+        "server_phases_ms": report.get("phases_ms", {}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the web server's cold start")
+    parser.add_argument("--top", type=int, default=8, help="Slowest direct imports of web_api to list")
+    parser.add_argument("--max-live-seconds", type=float, help="Fail if /health takes longer to answer")
+    parser.add_argument("--max-ready-seconds", type=float, help="Fail if /ready takes longer to answer")
+    parser.add_argument("--api-port", type=int, default=8770)
+    parser.add_argument("--model-port", type=int, default=8902)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    imports = measure_imports(args.top)
+    print(f"\n📦 import web_api: {imports['web_api_import_ms']}ms")
+    for name, ms in imports["slowest_imports_ms"].items():
+        print(f"  {name:<28}{ms:>8}ms")
+
+    startup = measure_startup(args)
+    print("\n🚀 Cold start (from launching uvicorn)")
+    print(f"  {'live (/health)':<28}{startup['live_s'] * 1000:>8.0f}ms")
+    print(f"  {'ready (/ready)':<28}{startup['ready_s'] * 1000:>8.0f}ms")
+    print(f"  {'first chat answered':<28}{startup['first_chat_s'] * 1000:>8.0f}ms")
+    print("  Server phases:")
+    for phase, ms in startup["server_phases_ms"].items():
+        print(f"    {phase:<26}{ms:>8}ms")
+
+    failures = []
+    if imports["eager_deferred_modules"]:
+        failures.append(f"import web_api loads {', '.join(imports['eager_deferred_modules'])} eagerly")
+    if args.max_live_seconds is not None and startup["live_s"] > args.max_live_seconds:
+        failures.append(f"/health took {startup['live_s']}s (budget {args.max_live_seconds}s)")
+    if args.max_ready_seconds is not None and startup["ready_s"] > args.max_ready_seconds:
+        failures.append(f"/ready took {startup['ready_s']}s (budget {args.max_ready_seconds}s)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"imports": imports, "startup": startup, "failures": failures}, f, indent=2)
+    for failure in failures:
+        print(f"❌ {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Measure what cancelling turns on client disconnect saves upstream.
+
+Usage:
+    python benchmarks/disconnect.py
+    python benchmarks/disconnect.py --visitors 40 --read-seconds 0.5 --tokens-per-second 10
+
+Starts the fake model server and the API, then has visitors ask questions on
+/chat/stream and close the connection after --read-seconds, before the answer
+is complete (after three visitors who read their whole answer). Reports how
+many completion tokens the fake server streamed against what it would have
+streamed had every answer run to the end, how long until every admission
+slot was free again, and the API's own count of cancelled turns and
+estimated tokens saved.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_driver import spawn_servers, stop_servers
+
+# The fake server's default answer length
+ANSWER_TOKENS = 40
+
+
+async def visit(client: httpx.AsyncClient, question: str, read_seconds: float | None) -> None:
+    """Read an answer on /chat/stream, closing the connection after read_seconds."""
+    async def read():
+        async with client.stream("POST", "/chat/stream", json={"message": question}) as response:
+            async for _ in response.aiter_bytes():
+                pass
+    try:
+        await asyncio.wait_for(read(), read_seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def run(url: str, fake_url: str, args) -> dict:
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        # A few complete answers first, for the average answer length the savings are estimated from
+        for i in range(3):
+            await visit(client, f"What products do you sell, question {i}", None)
+        before = (await client.get(f"{fake_url}/stats")).json()
+        # Distinct questions, so none are coalesced or answered from the cache
+        await asyncio.gather(*(
+            visit(client, f"Tell me about heating oil delivery, question {i}", args.read_seconds)
+            for i in range(args.visitors)
+        ))
+        dropped = time.perf_counter()
+        while (await client.get("/health")).json()["admission"]["in_flight"]:
+            await asyncio.sleep(0.01)
+        slots_free_ms = (time.perf_counter() - dropped) * 1000
+        after = (await client.get(f"{fake_url}/stats")).json()
+        health = (await client.get("/health")).json()
+    streamed = after["completion_tokens_streamed"] - before["completion_tokens_streamed"]
+    return {
+        "visitors": args.visitors,
+        "upstream_requests": after["requests"] - before["requests"],
+        "upstream_cancelled": after["cancelled"] - before["cancelled"],
+        "completion_tokens_streamed": streamed,
+        "completion_tokens_without_cancelling": args.visitors * ANSWER_TOKENS,
+        "slots_free_after_ms": round(slots_free_ms, 1),
+        "disconnects": health["disconnects"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--visitors", type=int, default=20)
+    parser.add_argument("--read-seconds", type=float, default=1.0, help="How long each visitor stays")
+    parser.add_argument("--model-port", type=int, default=8907)
+    parser.add_argument("--api-port", type=int, default=8008)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=10.0)
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+    args.tool_call_rate = 0.0
+    args.rate_limit_rate = 0.0
+    args.workers = 1
+    # Enough admission slots that every visitor's turn reaches the model
+    os.environ["UPSTREAM_CONCURRENCY"] = os.environ["UPSTREAM_MAX_CONCURRENCY"] = str(args.visitors)
+
+    processes, url, _ = spawn_servers(args)
+    try:
+        result = asyncio.run(run(url, f"http://127.0.0.1:{args.model_port}", args))
+    finally:
+        stop_servers(processes)
+
+    r = result
+    print(f"\n🔌 {r['visitors']} visitors leaving after {args.read_seconds}s of a "
+          f"{ANSWER_TOKENS / args.tokens_per_second:.0f}s answer")
+    print(f"  upstream: {r['upstream_cancelled']}/{r['upstream_requests']} requests cancelled, "
+          f"{r['completion_tokens_streamed']} completion tokens streamed instead of "
+          f"{r['completion_tokens_without_cancelling']}")
+    print(f"  admission slots free {r['slots_free_after_ms']} ms after the last visitor left")
+    print(f"  API: {json.dumps(r['disconnects'])}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Local OpenAI-compatible stand-in for GitHub Models.
+
+Emulates a streaming chat completions endpoint with configurable
+time-to-first-token, tokens per second, tool calls, 429 responses and
+occasional stalls before the first token, so web_api.py can be load tested
+without spending real quota.
+
+Usage:
+    python benchmarks/fake_model_server.py --port 8901 --ttft 0.4 --tokens-per-second 60
+
+Then point the API at it:
+    MODEL_BASE_URL=http://127.0.0.1:8901/inference GITHUB_TOKEN=fake uvicorn web_api:app
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER_WORDS = (
+    "Thanks for reaching out to Coolman Fuels! We deliver heating oil, propane through our partner "
+    "Red Cap Propane, clear and dyed diesel, gasoline, lubricants and DEF across Huron, Perth, "
+    "Middlesex and Lambton counties. Give us a call at 519-235-0853 to set up automatic degree day "
+    "delivery and never run out of fuel."
+).split()
+
+# Tool to call for a customer message, by keyword; falls back to get_company_info
+TOOL_KEYWORDS = [
+    ("deliver", "check_service_area"),
+    ("area", "get_service_area_details"),
+    ("product", "get_products_list"),
+    ("propane", "get_residential_heating_info"),
+    ("heating", "get_residential_heating_info"),
+    ("fleet", "get_fleet_card_info"),
+    ("credit", "get_credit_application_link"),
+    ("contact", "get_contact_info"),
+]
+
+
+class FakeModelConfig:
+    def __init__(self, ttft=0.3, tokens_per_second=50.0, answer_tokens=40, tool_call_rate=0.5, rate_limit_rate=0.0,
+                 retry_after=1.0, stall_rate=0.0, stall_seconds=5.0):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.tool_call_rate = tool_call_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+
+
+def _text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content)
+
+
+def _pick_tool(user_text: str, tools: list[dict]) -> tuple[str, dict] | None:
+    available = {tool["function"]["name"] for tool in tools if tool.get("type") == "function"}
+    lowered = user_text.lower()
+    for keyword, name in TOOL_KEYWORDS:
+        if keyword in lowered and name in available:
+            break
+    else:
+        name = "get_company_info"
+        if name not in available:
+            return None
+    arguments = {}
+    if name == "check_service_area":
+        arguments["location"] = lowered.rsplit(" to ", 1)[-1].strip(" ?.!") or "Exeter"
+    return name, arguments
+
+
+def create_app(config: FakeModelConfig) -> FastAPI:
+    app = FastAPI(title="Fake Model Server")
+    stats = {"requests": 0, "rate_limited": 0, "tool_calls": 0, "prompt_chars": 0, "stalled": 0, "cancelled": 0,
+             "completion_tokens_streamed": 0}
+
+    @app.api_route("/", methods=["GET", "HEAD"])
+    async def root():
+        return {"status": "ok"}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/inference/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        if random.random() < config.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"code": "RateLimitReached", "message": "Rate limit of requests exceeded."}},
+                status_code=429,
+                headers={"Retry-After": str(config.retry_after)},
+            )
+
+        messages = body.get("messages", [])
+        prompt_chars = sum(len(_text(m)) for m in messages) + len(json.dumps(body.get("tools", [])))
+        stats["prompt_chars"] += prompt_chars
+        prompt_tokens = prompt_chars // 4
+
+        tool = None
+        if messages and messages[-1].get("role") == "user" and body.get("tools"):
+            if random.random() < config.tool_call_rate:
+                tool = _pick_tool(_text(messages[-1]), body["tools"])
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        base = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model")}
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        if not body.get("stream"):
+            await asyncio.sleep(config.ttft + config.answer_tokens / config.tokens_per_second)
+            message = {"role": "assistant", "content": " ".join(ANSWER_WORDS[:config.answer_tokens])}
+            return {
+                "id": completion_id, "object": "chat.completion", "created": base["created"], "model": base["model"],
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": config.answer_tokens,
+                          "total_tokens": prompt_tokens + config.answer_tokens},
+            }
+
+        async def stream():
+            def frame(delta: dict, finish_reason=None) -> str:
+                chunk = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+                return f"data: {json.dumps(chunk)}\n\n"
+
+            ttft = config.ttft
+            if random.random() < config.stall_rate:
+                stats["stalled"] += 1
+                ttft += config.stall_seconds
+            try:
+                await asyncio.sleep(ttft)
+                if tool is not None:
+                    stats["tool_calls"] += 1
+                    name, arguments = tool
+                    call = {"index": 0, "id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+                            "function": {"name": name, "arguments": json.dumps(arguments)}}
+                    yield frame({"role": "assistant", "tool_calls": [call]})
+                    yield frame({}, "tool_calls")
+                    completion_tokens = 10
+                else:
+                    words = [ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(config.answer_tokens)]
+                    for i, word in enumerate(words):
+                        if i:
+                            await asyncio.sleep(1 / config.tokens_per_second)
+                        delta = {"content": word + " "}
+                        if i == 0:
+                            delta["role"] = "assistant"
+                        stats["completion_tokens_streamed"] += 1
+                        yield frame(delta)
+                    yield frame({}, "stop")
+                    completion_tokens = len(words)
+            except asyncio.CancelledError:
+                # The client gave up on this request (a hedge won, or its visitor disconnected)
+                stats["cancelled"] += 1
+                raise
+            if include_usage:
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                         "total_tokens": prompt_tokens + completion_tokens}
+                yield f"data: {json.dumps({**base, 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible model server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--ttft", type=float, default=0.3, help="Seconds before the first streamed chunk")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    parser.add_argument("--tool-call-rate", type=float, default=0.5, help="Fraction of first round trips that call a tool")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Fraction of streams that stall before the first chunk")
+    parser.add_argument("--stall-seconds", type=float, default=5.0, help="Extra seconds a stalled stream waits")
+    args = parser.parse_args()
+
+    config = FakeModelConfig(
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        tool_call_rate=args.tool_call_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Measure how hedged model requests cut the time-to-first-token tail.
+
+Usage:
+    python benchmarks/hedging.py
+    python benchmarks/hedging.py --turns 300 --stall-rate 0.05 --stall-seconds 8 --hedge-after 1
+
+Starts the fake model server with a fraction of streams stalling before their
+first chunk, then sends the same number of questions through an agent without
+hedging and one with HEDGE_AFTER_SECONDS set, and compares time to first
+token percentiles, the hedge rate and which request won. The fake server's
+count of cancelled streams shows the losing requests being closed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import coolman_agent
+from hedging import HedgeStats, percentile
+from load_driver import stop_servers, wait_until_up
+
+QUESTIONS = [
+    "What products do you offer?",
+    "Do you have fleet cards?",
+    "Tell me about automatic heating oil delivery",
+    "What commercial solutions do you have?",
+    "How do I become a new customer?",
+]
+
+
+async def run(turns: int, concurrency: int) -> list[float]:
+    """Time to first answer text of each turn, each on a new thread."""
+    agent = await coolman_agent.create_coolman_agent()
+    queue = asyncio.Queue()
+    for i in range(turns):
+        queue.put_nowait(QUESTIONS[i % len(QUESTIONS)])
+    ttfts = []
+
+    async def worker():
+        while not queue.empty():
+            message = queue.get_nowait()
+            started = time.perf_counter()
+            first_token = None
+            async for chunk in agent.run_stream(message, thread=agent.get_new_thread()):
+                if chunk.text and first_token is None:
+                    first_token = time.perf_counter() - started
+            if first_token is not None:
+                ttfts.append(first_token)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return ttfts
+
+
+async def compare(args, fake_url: str) -> dict:
+    results = {}
+    async with httpx.AsyncClient(base_url=fake_url) as client:
+        for label, hedge_after in (("no_hedging", 0), ("hedging", args.hedge_after)):
+            os.environ["HEDGE_AFTER_SECONDS"] = str(hedge_after)
+            coolman_agent.hedge_stats = HedgeStats()
+            before = (await client.get("/stats")).json()
+            ttfts = await run(args.turns, args.concurrency)
+            after = (await client.get("/stats")).json()
+            results[label] = {
+                "turns": len(ttfts),
+                "ttft_p50_s": round(percentile(ttfts, 0.5), 3),
+                "ttft_p95_s": round(percentile(ttfts, 0.95), 3),
+                "ttft_p99_s": round(percentile(ttfts, 0.99), 3),
+                "ttft_max_s": round(max(ttfts, default=0.0), 3),
+                "upstream_requests": after["requests"] - before["requests"],
+                "stalled": after["stalled"] - before["stalled"],
+                "cancelled": after["cancelled"] - before["cancelled"],
+                "hedging": coolman_agent.hedge_stats.as_dict(),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8905)
+    parser.add_argument("--ttft", type=float, default=0.3, help="Fake server's normal seconds to first chunk")
+    parser.add_argument("--stall-rate", type=float, default=0.05)
+    parser.add_argument("--stall-seconds", type=float, default=5.0)
+    parser.add_argument("--hedge-after", type=float, default=1.0, help="HEDGE_AFTER_SECONDS for the hedged run")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    fake_url = f"http://127.0.0.1:{args.port}"
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_model_server.py"),
+        "--port", str(args.port), "--ttft", str(args.ttft), "--tool-call-rate", "0",
+        "--stall-rate", str(args.stall_rate), "--stall-seconds", str(args.stall_seconds),
+    ])
+    os.environ["MODEL_BASE_URL"] = f"{fake_url}/inference"
+    os.environ.setdefault("GITHUB_TOKEN", "fake")
+    os.environ.pop("HEDGE_BASE_URL", None)
+    try:
+        wait_until_up(fake_url, "/stats")
+        results = asyncio.run(compare(args, fake_url))
+    finally:
+        stop_servers([fake])
+
+    print(f"\n⏱️ {args.turns} turns, {args.stall_rate:.0%} of streams stall {args.stall_seconds}s, "
+          f"hedge after {args.hedge_after}s")
+    print(f"  {'':12} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} {'requests':>9} {'hedged':>7} {'fallback won':>13}")
+    for label, r in results.items():
+        print(f"  {label:12} {r['ttft_p50_s']:>6.2f}s {r['ttft_p95_s']:>6.2f}s {r['ttft_p99_s']:>6.2f}s "
+              f"{r['ttft_max_s']:>6.2f}s {r['upstream_requests']:>9} {r['hedging']['hedged']:>7} "
+              f"{r['hedging']['fallback_wins']:>13}")
+    base, hedged = results["no_hedging"], results["hedging"]
+    if base["ttft_p99_s"]:
+        print(f"  p99 time to first token {1 - hedged['ttft_p99_s'] / base['ttft_p99_s']:.0%} lower, "
+              f"for {hedged['hedging']['hedge_rate']:.1%} extra upstream requests")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
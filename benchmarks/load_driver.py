@@ -0,0 +1,322 @@
+"""
+Load test the chat API with replayed multi-turn conversations.
+
+Each virtual user opens a session and replays one of CONVERSATIONS turn by
+turn against /chat or /chat/stream, keeping the target concurrency until the
+duration is up. Reports latency percentiles, time to first token (streaming),
+throughput, error rate and the server's resident memory.
+
+Usage:
+    # Start the fake model server and the API, then run against them
+    python benchmarks/load_driver.py --spawn --concurrency 20 --duration 30
+
+    # Run against an already running API (e.g. a staging deploy)
+    python benchmarks/load_driver.py --url http://127.0.0.1:8000 --endpoint chat
+
+    # Save a run and compare a later one against it
+    python benchmarks/load_driver.py --spawn --output baseline.json
+    python benchmarks/load_driver.py --spawn --baseline baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Ahead of benchmarks/, whose hedging.py would shadow the module
+sys.path.insert(0, ROOT)
+
+from hedging import percentile
+
+# Mix of cacheable openers, routed lookups and follow-ups that need history
+CONVERSATIONS = [
+    ["What products do you offer?", "Which of those work for a farm?", "How do I order?"],
+    ["Do you deliver to Exeter?", "What's your phone number?"],
+    ["Tell me about propane for my home", "Do you have automatic delivery?", "How does degree day delivery work?"],
+    ["I run a trucking company, tell me about fleet cards", "Can I get dyed diesel too?"],
+    ["How do I apply for credit?", "What do I need to have ready?"],
+    ["Can you deliver heating oil to Mitchell?", "What about Goderich?", "And Sarnia?"],
+    ["What are your hours?"],
+    ["Hi, I need fuel for my farm equipment this spring", "Do you deliver to fields directly?", "Great, how do I set that up?"],
+]
+
+
+def _children(pid: int) -> list[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def rss_mb(pid: int | None) -> float | None:
+    """Resident set size of a local process and its workers, from /proc (Linux only)."""
+    if pid is None:
+        return None
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            if current == pid:
+                return None
+        pending.extend(_children(current))
+    return round(total_kb / 1024, 1)
+
+
+class Results:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.ttfts: list[float] = []
+        self.errors: dict[str, int] = {}
+        self.turns = 0
+        self.conversations = 0
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+async def send_turn(client: httpx.AsyncClient, endpoint: str, message: str, session_id: str | None,
+                    results: Results) -> str | None:
+    """Send one message, record its timings, and return the session id."""
+    payload = {"message": message, "session_id": session_id}
+    started = time.perf_counter()
+    try:
+        if endpoint == "chat":
+            response = await client.post("/chat", json=payload)
+            if response.status_code != 200:
+                results.error(f"http_{response.status_code}")
+                return session_id
+            session_id = response.json()["session_id"]
+        else:
+            async with client.stream("POST", "/chat/stream", json=payload) as response:
+                if response.status_code != 200:
+                    results.error(f"http_{response.status_code}")
+                    return session_id
+                event = None
+                first_token = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[7:]
+                    elif line.startswith("data: "):
+                        data = json.loads(line[6:])
+                        if event == "session":
+                            session_id = data["session_id"]
+                        elif event == "delta" and first_token is None:
+                            first_token = time.perf_counter() - started
+                        elif event == "error":
+                            results.error("busy" if data.get("busy") else "stream_error")
+                            return session_id
+                if first_token is not None:
+                    results.ttfts.append(first_token)
+    except httpx.HTTPError as e:
+        results.error(type(e).__name__)
+        return session_id
+    results.latencies.append(time.perf_counter() - started)
+    results.turns += 1
+    return session_id
+
+
+async def virtual_user(client: httpx.AsyncClient, endpoint: str, deadline: float, think_time: float,
+                       results: Results) -> None:
+    while time.monotonic() < deadline:
+        session_id = None
+        for message in random.choice(CONVERSATIONS):
+            if time.monotonic() >= deadline:
+                return
+            session_id = await send_turn(client, endpoint, message, session_id, results)
+            if think_time:
+                await asyncio.sleep(random.uniform(0, think_time))
+        results.conversations += 1
+
+
+async def run_load(url: str, endpoint: str, concurrency: int, duration: float, think_time: float,
+                   server_pid: int | None) -> dict:
+    results = Results()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        rss_before = rss_mb(server_pid)
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(*(
+            virtual_user(client, endpoint, deadline, think_time, results) for _ in range(concurrency)
+        ))
+        elapsed = time.monotonic() - started
+        try:
+            health = (await client.get("/health")).json()
+        except (httpx.HTTPError, ValueError):
+            health = {}
+
+    failed = sum(results.errors.values())
+    attempts = results.turns + failed
+    report = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 1),
+        "turns": results.turns,
+        "conversations": results.conversations,
+        "throughput_rps": round(results.turns / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(failed / attempts, 4) if attempts else 0.0,
+        "errors": results.errors,
+        "latency_ms": {
+            f"p{p}": round(percentile(results.latencies, p / 100) * 1000, 1) for p in (50, 95, 99)
+        },
+        "server_rss_mb": {"before": rss_before, "after": rss_mb(server_pid)},
+        "server_health": {
+            key: health[key]
+            for key in ("response_cache", "intent_router", "admission", "coalescing", "upstream_connections")
+            if key in health
+        },
+    }
+    if endpoint == "stream":
+        report["ttft_ms"] = {f"p{p}": round(percentile(results.ttfts, p / 100) * 1000, 1) for p in (50, 95, 99)}
+    return report
+
+
+def print_report(report: dict, baseline: dict | None = None) -> None:
+    def row(label: str, value, base=None, lower_is_better=True):
+        line = f"  {label:<22}{value}"
+        if isinstance(value, (int, float)) and isinstance(base, (int, float)) and base:
+            change = (value - base) / base * 100
+            better = change < 0 if lower_is_better else change > 0
+            line += f"   (baseline {base}, {change:+.1f}%{' ✅' if better else ''})"
+        print(line)
+
+    base = baseline or {}
+    print(f"\n📊 {report['endpoint']} endpoint, {report['concurrency']} users, {report['duration_s']}s")
+    row("turns", report["turns"])
+    row("throughput (req/s)", report["throughput_rps"], base.get("throughput_rps"), lower_is_better=False)
+    row("error rate", report["error_rate"], base.get("error_rate"))
+    for p, value in report["latency_ms"].items():
+        row(f"latency {p} (ms)", value, base.get("latency_ms", {}).get(p))
+    for p, value in report.get("ttft_ms", {}).items():
+        row(f"ttft {p} (ms)", value, base.get("ttft_ms", {}).get(p))
+    rss = report["server_rss_mb"]["after"]
+    if rss is not None:
+        row("server RSS (MB)", rss, (base.get("server_rss_mb") or {}).get("after"))
+    if report["errors"]:
+        print(f"  errors: {report['errors']}")
+
+
+def wait_until_up(url: str, path: str = "/health", timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = httpx.get(f"{url}{path}", timeout=2)
+            if response.status_code == 200 and response.json().get("agent_ready", True):
+                return
+        except (httpx.HTTPError, ValueError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def spawn_servers(args) -> tuple[list[subprocess.Popen], str, int]:
+    """Start the fake model server and the API against it; returns (processes, api url, api pid)."""
+    model_port, api_port = args.model_port, args.api_port
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "benchmarks", "fake_model_server.py"),
+        "--port", str(model_port),
+        "--ttft", str(args.ttft),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--tool-call-rate", str(args.tool_call_rate),
+        "--rate-limit-rate", str(args.rate_limit_rate),
+    ])
+    env = {
+        **os.environ,
+        "MODEL_BASE_URL": f"http://127.0.0.1:{model_port}/inference",
+        "GITHUB_TOKEN": os.environ.get("GITHUB_TOKEN", "fake-token"),
+        "WEB_CONCURRENCY": str(args.workers),
+        # Every simulated customer comes from 127.0.0.1
+        "RATE_LIMIT_ENABLED": "false",
+    }
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "web_api:app", "--port", str(api_port), "--log-level", "warning",
+         "--workers", str(args.workers)],
+        cwd=ROOT,
+        env=env,
+    )
+    processes = [fake, api]
+    url = f"http://127.0.0.1:{api_port}"
+    try:
+        wait_until_up(f"http://127.0.0.1:{model_port}", path="/", timeout=30)
+        wait_until_up(url)
+    except Exception:
+        stop_servers(processes)
+        raise
+    return processes, url, api.pid
+
+
+def stop_servers(processes: list[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Coolman Fuels chat API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="API base URL (ignored with --spawn)")
+    parser.add_argument("--endpoint", choices=["stream", "chat", "both"], default="both")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to run each endpoint")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause between turns (seconds)")
+    parser.add_argument("--server-pid", type=int, help="PID of a local API process to report RSS for")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against results saved earlier with --output")
+    parser.add_argument("--seed", type=int, default=1)
+    spawn = parser.add_argument_group("spawned servers")
+    spawn.add_argument("--spawn", action="store_true", help="Start the fake model server and the API locally")
+    spawn.add_argument("--api-port", type=int, default=8765)
+    spawn.add_argument("--model-port", type=int, default=8901)
+    spawn.add_argument("--workers", type=int, default=1, help="API worker processes")
+    spawn.add_argument("--ttft", type=float, default=0.3)
+    spawn.add_argument("--tokens-per-second", type=float, default=50.0)
+    spawn.add_argument("--tool-call-rate", type=float, default=0.5)
+    spawn.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    processes = []
+    url, pid = args.url, args.server_pid
+    if args.spawn:
+        processes, url, pid = spawn_servers(args)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    endpoints = ["stream", "chat"] if args.endpoint == "both" else [args.endpoint]
+    reports = {}
+    try:
+        for endpoint in endpoints:
+            report = asyncio.run(run_load(url, endpoint, args.concurrency, args.duration, args.think_time, pid))
+            reports[endpoint] = report
+            print_report(report, (baseline or {}).get(endpoint))
+    finally:
+        stop_servers(processes)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark the service area location index against the original substring scan.
+
+Usage:
+    python benchmarks/location_lookup.py
+
+Prints the per-lookup latency of both implementations and every query on which
+their classification differs.
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coolman_agent import SERVICE_TERRITORY, get_location_index
+
+QUERIES = [
+    "Exeter", "exeter, ON", "Grand Bend", "Goderitch", "Mitchel", "St Marys",
+    "Saint Mary's", "Lucan", "London", "Forest Hills", "Forest", "Toronto",
+    "Exeter Road, London", "Brinsley", "Sebringville", "Sarnia", "Huron Park",
+    "71321 London Road, Exeter, ON N0M 1S3", "43.35, -81.48", "Zurich",
+]
+ITERATIONS = 2000
+
+
+def legacy_check(location: str) -> str:
+    """The original O(n) two-way substring scan from check_service_area."""
+    location_lower = location.lower().strip()
+    primary_lower = [area.lower() for area in SERVICE_TERRITORY['primary_communities']]
+    boundary_lower = [area.lower() for area in SERVICE_TERRITORY['boundary_communities']]
+    if any(location_lower in area or area in location_lower for area in primary_lower):
+        return "primary"
+    if any(location_lower in area or area in location_lower for area in boundary_lower):
+        return "boundary"
+    return "outside"
+
+
+def main():
+    index = get_location_index()
+
+    def run_legacy():
+        for query in QUERIES:
+            legacy_check(query)
+
+    def run_index():
+        for query in QUERIES:
+            index.classify(query)
+
+    lookups = ITERATIONS * len(QUERIES)
+    legacy_us = timeit.timeit(run_legacy, number=ITERATIONS) / lookups * 1e6
+    index_us = timeit.timeit(run_index, number=ITERATIONS) / lookups * 1e6
+
+    print(f"{'query':<40} {'legacy':<10} {'index':<10} method")
+    for query in QUERIES:
+        old = legacy_check(query)
+        match = index.classify(query)
+        marker = "" if old == match.status else "  <- differs"
+        print(f"{query:<40} {old:<10} {match.status:<10} {match.method} {match.place or ''}{marker}")
+
+    print()
+    print(f"legacy scan:    {legacy_us:7.2f} µs/lookup")
+    print(f"location index: {index_us:7.2f} µs/lookup")
+
+
+if __name__ == "__main__":
+    main()
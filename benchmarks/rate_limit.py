@@ -0,0 +1,115 @@
+"""
+Measure the per-request cost and memory of the per-client rate limiter.
+
+Usage:
+    python benchmarks/rate_limit.py
+    python benchmarks/rate_limit.py --keys 100000 --calls 500000
+
+Times RateLimiter.acquire with one, a thousand and --keys active clients (a
+chat message takes two: its session's bucket and its IP's), measures the
+memory per bucket, then checks the behaviour the limits exist for: a script
+sending as fast as it can gets its burst and then 429s with a Retry-After,
+a customer on another session is unaffected, and idle buckets expire.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limit import RateLimiter
+
+
+def time_acquire(keys: int, calls: int) -> float:
+    """Nanoseconds per acquire, spread over `keys` clients that never run out of tokens."""
+    limiter = RateLimiter(rate=1e9, burst=1e9)
+    names = [f"203.0.{i // 256 % 256}.{i % 256}#{i}" for i in range(keys)]
+    for name in names:
+        limiter.acquire(name)
+    order = [random.choice(names) for _ in range(calls)]
+    started = time.perf_counter()
+    for name in order:
+        limiter.acquire(name)
+    return (time.perf_counter() - started) / calls * 1e9
+
+
+def bytes_per_key(keys: int) -> float:
+    limiter = RateLimiter(rate=1, burst=10, max_keys=keys)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(keys):
+        limiter.acquire(f"session-{i:032x}")
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / keys
+
+
+def abuse(seconds: float) -> dict:
+    """A script hammering one session next to a customer sending a message every few seconds."""
+    limiter = RateLimiter(rate=10 / 60, burst=5)
+    script = {"allowed": 0, "limited": 0, "retry_after_s": 0.0}
+    customer = {"allowed": 0, "limited": 0}
+    started = time.monotonic()
+    next_customer = started
+    while time.monotonic() - started < seconds:
+        retry_after = limiter.acquire("script-session")
+        if retry_after:
+            script["limited"] += 1
+            script["retry_after_s"] = round(retry_after, 1)
+        else:
+            script["allowed"] += 1
+        if time.monotonic() >= next_customer:
+            customer["limited" if limiter.acquire("customer-session") else "allowed"] += 1
+            next_customer += seconds / 4
+    return {"script": script, "customer": customer}
+
+
+def expiry(keys: int) -> dict:
+    """Buckets refill completely in burst / rate seconds; after that they are dropped."""
+    limiter = RateLimiter(rate=10, burst=10)
+    for i in range(keys):
+        limiter.acquire(f"client-{i}")
+    filled = len(limiter)
+    time.sleep(limiter.idle_ttl * 2)
+    limiter.acquire("one-more")
+    return {"keys_before": filled, "keys_after_idle": len(limiter), "expired": limiter.expired}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--keys", type=int, default=100_000, help="Active clients for the largest run")
+    parser.add_argument("--calls", type=int, default=300_000)
+    parser.add_argument("--abuse-seconds", type=float, default=1.0)
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    results = {
+        "acquire_ns": {str(keys): round(time_acquire(keys, args.calls)) for keys in (1, 1000, args.keys)},
+        "bytes_per_key": round(bytes_per_key(args.keys)),
+        "abuse": abuse(args.abuse_seconds),
+        "expiry": expiry(args.keys),
+    }
+
+    print("\n🚦 Rate limiter")
+    for keys, ns in results["acquire_ns"].items():
+        print(f"  acquire with {int(keys):>7} active clients: {ns:5} ns "
+              f"({2 * ns / 1000:.2f} µs per chat message, session + IP)")
+    print(f"  memory: {results['bytes_per_key']} bytes per active client")
+    script, customer = results["abuse"]["script"], results["abuse"]["customer"]
+    print(f"  script for {args.abuse_seconds}s: {script['allowed']} allowed, {script['limited']} limited "
+          f"(Retry-After {script['retry_after_s']}s); customer: {customer['allowed']} allowed, "
+          f"{customer['limited']} limited")
+    e = results["expiry"]
+    print(f"  expiry: {e['keys_before']} buckets -> {e['keys_after_idle']} after idling ({e['expired']} expired)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
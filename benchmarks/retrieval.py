@@ -0,0 +1,165 @@
+"""
+Measure knowledge-base retrieval on a fixed set of customer questions.
+
+Usage:
+    python benchmarks/retrieval.py
+    python benchmarks/retrieval.py --top-k 3 --verbose
+    python benchmarks/retrieval.py --live    # needs GITHUB_TOKEN (and MODEL_BASE_URL for another endpoint)
+
+Offline (the default), reports how long the index takes to build and query,
+and for every question whether the retrieved excerpts come from the tool that
+answers it. A question whose excerpts cover it can be answered in one model
+round trip instead of two (the tool call, then the answer), which gives the
+estimated round trips per turn before and after.
+
+With --live, each question is sent through an agent without and one with
+KB_RETRIEVAL, comparing the round trips and prompt tokens the model actually
+used.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import coolman_agent
+from retrieval import BM25Index, RetrievalStats
+from usage import start_turn
+
+# (question, tools whose output answers it - any one of them)
+QUERIES = [
+    ("What is your phone number?", {"get_contact_info", "get_company_info"}),
+    ("What's your email address?", {"get_contact_info", "get_company_info"}),
+    ("Where is your office?", {"get_contact_info", "get_company_info"}),
+    ("Are you open on weekends?", {"get_contact_info", "get_company_info"}),
+    ("How long have you been in business?", {"get_company_info"}),
+    ("Weren't you called Dave Moore Fuels before?", {"get_company_info"}),
+    ("Do you sell propane?", {"get_products_list", "get_residential_heating_info"}),
+    ("Who delivers your propane?", {"get_products_list", "get_residential_heating_info"}),
+    ("What can I use propane for?", {"get_products_list", "get_residential_heating_info"}),
+    ("What's the difference between clear and dyed diesel?", {"get_products_list"}),
+    ("Do you carry antifreeze or washer fluid?", {"get_products_list"}),
+    ("What brand of lubricants do you sell?", {"get_products_list", "get_commercial_solutions"}),
+    ("Can I get DEF in drums?", {"get_products_list", "get_commercial_solutions"}),
+    ("Is DEF available at your pumps?", {"get_products_list", "get_commercial_solutions", "get_fleet_card_info"}),
+    ("What size tank for gasoline on a farm?", {"get_products_list"}),
+    ("Do you deliver heating oil for my furnace?", {"get_residential_heating_info", "get_products_list"}),
+    ("Can you set up automatic degree day delivery?", {"get_residential_heating_info", "get_services_list"}),
+    ("What happens if I run out of fuel at night?", {"get_services_list", "get_residential_heating_info"}),
+    ("How much notice do you need for a delivery?", {"get_services_list", "get_residential_heating_info"}),
+    ("Do you rent fuel tanks and pumps?", {"get_services_list", "get_commercial_solutions"}),
+    ("What services do you offer?", {"get_services_list"}),
+    ("I'm a new customer, do I need a tank inspection?", {"get_new_customer_requirements", "get_residential_heating_info"}),
+    ("Who can inspect my oil tank?", {"get_new_customer_requirements", "get_residential_heating_info"}),
+    ("What's the phone number for Avon Heating?", {"get_new_customer_requirements", "get_residential_heating_info"}),
+    ("How do I switch my furnace oil to you?", {"get_new_customer_requirements", "get_residential_heating_info"}),
+    ("Do you have fleet cards?", {"get_fleet_card_info"}),
+    ("Can I use my Comdata card at your cardlock?", {"get_fleet_card_info"}),
+    ("Where are your cardlock locations?", {"get_fleet_card_info", "get_company_info", "get_service_area_details"}),
+    ("How many Petro-Pass locations are there?", {"get_fleet_card_info"}),
+    ("What industries do you serve?", {"get_commercial_solutions"}),
+    ("Do you supply construction companies with diesel?", {"get_commercial_solutions", "get_products_list"}),
+    ("Do you sell double-walled tanks?", {"get_commercial_solutions"}),
+    ("How do I apply for credit?", {"get_credit_application_link"}),
+    ("Which counties do you serve?", {"get_service_area_details"}),
+    ("What towns are in your service area?", {"get_service_area_details"}),
+    ("What's the northern boundary of your territory?", {"get_service_area_details"}),
+    ("hi", set()),
+    ("thanks, that's all", set()),
+]
+
+
+def offline(top_k: int, verbose: bool) -> dict:
+    index = BM25Index(coolman_agent.knowledge_chunks())
+    started = time.perf_counter()
+    for _ in range(100):
+        for question, _ in QUERIES:
+            index.search(question, top_k)
+    query_us = (time.perf_counter() - started) / (100 * len(QUERIES)) * 1e6
+
+    covered = answerable = excerpts_sent = false_positives = 0
+    for question, expected in QUERIES:
+        results = index.search(question, top_k)
+        sources = {chunk.source for _, chunk in results}
+        if expected:
+            answerable += 1
+            covered += bool(sources & expected)
+        elif results:
+            false_positives += 1
+        excerpts_sent += bool(results)
+        if verbose:
+            marker = "✅" if (bool(sources & expected) if expected else not results) else "❌"
+            print(f"{marker} {question}")
+            for score, chunk in results:
+                print(f"     {score:5.2f}  {chunk.source}: {chunk.title}")
+
+    # Without retrieval each knowledge question takes a tool call and a second round trip
+    before = (2 * answerable + len(QUERIES) - answerable) / len(QUERIES)
+    after = (2 * (answerable - covered) + covered + len(QUERIES) - answerable) / len(QUERIES)
+    return {
+        "chunks": len(index.chunks),
+        "build_ms": round(index.build_seconds * 1000, 2),
+        "query_us": round(query_us, 1),
+        "questions": len(QUERIES),
+        "covered": covered,
+        "answerable": answerable,
+        "coverage": round(covered / answerable, 3),
+        "off_topic_with_excerpts": false_positives,
+        "estimated_round_trips_before": round(before, 2),
+        "estimated_round_trips_after": round(after, 2),
+    }
+
+
+async def live(top_k: int) -> dict:
+    results = {}
+    for label, enabled in (("without", "false"), ("with", "true")):
+        os.environ["KB_RETRIEVAL"] = enabled
+        os.environ["KB_RETRIEVAL_TOP_K"] = str(top_k)
+        coolman_agent.retrieval_stats = RetrievalStats()
+        agent = await coolman_agent.create_coolman_agent()
+        round_trips = prompt_tokens = tool_calls = 0
+        for question, _ in QUERIES:
+            turn = start_turn()
+            await agent.run(question, thread=agent.get_new_thread())
+            round_trips += turn.round_trips
+            prompt_tokens += turn.prompt_tokens
+            tool_calls += sum(turn.tool_calls.values())
+        results[label] = {
+            "round_trips_per_turn": round(round_trips / len(QUERIES), 2),
+            "prompt_tokens_per_turn": round(prompt_tokens / len(QUERIES)),
+            "tool_calls": tool_calls,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--verbose", action="store_true", help="Show the excerpts retrieved for each question")
+    parser.add_argument("--live", action="store_true", help="Also compare real round trips through the model")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    report = {"offline": offline(args.top_k, args.verbose)}
+    r = report["offline"]
+    print(f"\n🔎 {r['chunks']} chunks indexed in {r['build_ms']} ms, {r['query_us']} µs per query")
+    print(f"  excerpts cover {r['covered']}/{r['answerable']} knowledge questions ({r['coverage']:.0%}), "
+          f"{r['off_topic_with_excerpts']} off-topic messages got excerpts")
+    print(f"  estimated round trips per turn: {r['estimated_round_trips_before']} -> {r['estimated_round_trips_after']}")
+
+    if args.live:
+        report["live"] = asyncio.run(live(args.top_k))
+        for label, result in report["live"].items():
+            print(f"  live {label:7} retrieval: {result['round_trips_per_turn']} round trips/turn, "
+                  f"{result['prompt_tokens_per_turn']} prompt tokens/turn, {result['tool_calls']} tool calls")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark the SQLite session backend.
+
+Usage:
+    python benchmarks/session_store.py [--sessions 500] [--turns 6]
+
+Measures what persistence costs on and off the request path: the per-turn
+bookkeeping done while answering (on the path), and the batched flush and
+lazy load that run in a worker thread (off the path, or once per session
+after a restart).
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent_framework import AgentThread, ChatMessage, Role
+
+from session_backends import SQLiteSessionBackend
+from session_store import SessionStore
+
+QUESTION = "Do you deliver heating oil to Mitchell, and can I set up automatic delivery?"
+ANSWER = (
+    "Yes! Mitchell is in our primary service area. We offer automatic degree day delivery "
+    "for heating oil, so you never have to watch the tank. Call 519-235-0853 to get set up. "
+) * 3
+
+
+async def make_thread(turns: int) -> AgentThread:
+    thread = AgentThread()
+    for _ in range(turns):
+        await thread.on_new_messages([
+            ChatMessage(role=Role.USER, text=QUESTION),
+            ChatMessage(role=Role.ASSISTANT, text=ANSWER),
+        ])
+    return thread
+
+
+def summary(label: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p50 = statistics.median(samples) * 1e6
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6
+    print(f"  {label:<32} p50 {p50:9.1f} µs   p99 {p99:9.1f} µs")
+
+
+async def run(sessions: int, turns: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        backend = SQLiteSessionBackend(os.path.join(directory, "sessions.db"))
+        memory_store = SessionStore()
+        store = SessionStore(backend=backend)
+        store.deserialize_thread = AgentThread.deserialize
+
+        ids, memory_ids = [], []
+        for _ in range(sessions):
+            thread = await make_thread(turns)
+            ids.append(store.create(thread))
+            memory_ids.append(memory_store.create(thread))
+
+        # On the request path: end-of-turn bookkeeping, with and without persistence
+        in_memory, persisted = [], []
+        for session_id, memory_id in zip(ids, memory_ids):
+            started = time.perf_counter()
+            await memory_store.update_size(memory_id)
+            in_memory.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            await store.update_size(session_id)
+            persisted.append(time.perf_counter() - started)
+
+        print(f"\n📦 {sessions} sessions x {turns} turns")
+        print("On the request path:")
+        summary("end of turn, memory only", in_memory)
+        summary("end of turn, sqlite backend", persisted)
+
+        print("Off the request path:")
+        started = time.perf_counter()
+        saved = await store.flush()
+        elapsed = time.perf_counter() - started
+        print(f"  {'first flush (whole history)':<32} {elapsed * 1000:9.1f} ms for {saved} sessions "
+              f"({elapsed / saved * 1e6:.1f} µs each)")
+
+        # A typical flush only appends the turn each session just had
+        for session_id in ids:
+            thread = store.get(session_id)
+            await thread.on_new_messages([
+                ChatMessage(role=Role.USER, text=QUESTION),
+                ChatMessage(role=Role.ASSISTANT, text=ANSWER),
+            ])
+            await store.update_size(session_id)
+        started = time.perf_counter()
+        saved = await store.flush()
+        elapsed = time.perf_counter() - started
+        print(f"  {'next flush (one new turn)':<32} {elapsed * 1000:9.1f} ms for {saved} sessions "
+              f"({elapsed / saved * 1e6:.1f} µs each)")
+
+        # Simulate a restart: a fresh store loads every session lazily
+        restarted = SessionStore(backend=backend)
+        restarted.deserialize_thread = AgentThread.deserialize
+        loads = []
+        for session_id in ids:
+            started = time.perf_counter()
+            thread = await restarted.load(session_id)
+            loads.append(time.perf_counter() - started)
+            assert len(await thread.message_store.list_messages()) == 2 * (turns + 1)
+        summary("lazy load after restart", loads)
+        hits = []
+        for session_id in ids:
+            started = time.perf_counter()
+            await restarted.load(session_id)
+            hits.append(time.perf_counter() - started)
+        summary("load of a cached session", hits)
+        backend.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite session backend")
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=6)
+    args = parser.parse_args()
+    asyncio.run(run(args.sessions, args.turns))
+
+
+if __name__ == "__main__":
+    main()
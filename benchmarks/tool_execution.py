@@ -0,0 +1,98 @@
+"""
+Measure concurrent tool execution for a model response that calls several tools.
+
+Usage:
+    python benchmarks/tool_execution.py
+    python benchmarks/tool_execution.py --tools 4 --latency 0.3
+
+Simulates lookups that wait on I/O (e.g. prices, tank levels) and runs one
+response's calls the way agent_framework does - concurrently, through the
+tool middleware. Compares plain synchronous tools, which run on the event loop
+one after another, with the same tools declared @io_tool: the total time of
+the calls, and the worst delay of a timer on the event loop meanwhile (how
+long every other chat on the server would have been stalled). Also checks that
+a tool exceeding its timeout returns a note instead of holding the turn.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent_framework import FunctionInvocationContext, ai_function
+
+from middleware import ToolTimeoutMiddleware
+from tool_execution import ToolExecutionStats, io_tool
+
+
+def make_lookup(name: str, latency: float):
+    def lookup(account: str) -> str:
+        time.sleep(latency)
+        return f"{name} for {account}: ok"
+    lookup.__name__ = name
+    return lookup
+
+
+async def call(tool, middleware: ToolTimeoutMiddleware, arguments: dict):
+    """Invoke a tool through the timeout middleware, as the agent's function loop does."""
+    context = FunctionInvocationContext(function=tool, arguments=tool.input_model(**arguments))
+
+    async def final(ctx):
+        ctx.result = await tool.invoke(arguments=ctx.arguments)
+
+    await middleware.process(context, final)
+    return context.result
+
+
+async def loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Worst delay of a periodic timer on the event loop until stop is set."""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def run_batch(tools, middleware) -> tuple[float, float, list]:
+    stop = asyncio.Event()
+    lag = asyncio.create_task(loop_lag(stop))
+    await asyncio.sleep(0.02)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(call(tool, middleware, {"account": "A-100"}) for tool in tools))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return elapsed, await lag, results
+
+
+async def main_async(args) -> None:
+    names = [f"lookup_{i}" for i in range(args.tools)]
+    middleware = ToolTimeoutMiddleware(ToolExecutionStats())
+
+    inline = [ai_function(make_lookup(name, args.latency)) for name in names]
+    offloaded = [ai_function(io_tool()(make_lookup(name, args.latency))) for name in names]
+    for label, tools in (("synchronous", inline), ("@io_tool", offloaded)):
+        elapsed, lag, _ = await run_batch(tools, middleware)
+        print(f"  {label:12} {len(tools)} calls in {elapsed * 1000:7.1f} ms, "
+              f"event loop stalled up to {lag * 1000:7.1f} ms")
+
+    slow = ai_function(io_tool(timeout=args.latency)(make_lookup("slow_lookup", args.latency * 5)))
+    elapsed, _, results = await run_batch([slow, *offloaded], middleware)
+    print(f"  timeout      slow tool cut off after {elapsed * 1000:.1f} ms: {results[0][:50]}...")
+    print(f"  stats: {middleware.stats.as_dict()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tools", type=int, default=3, help="Tool calls in the model response")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds each simulated lookup waits")
+    args = parser.parse_args()
+    print(f"\n🛠️ {args.tools} tool calls of {args.latency}s each")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
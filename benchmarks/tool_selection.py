@@ -0,0 +1,199 @@
+"""
+Measure per-turn tool subsetting on a fixed set of customer questions.
+
+Usage:
+    python benchmarks/tool_selection.py
+    python benchmarks/tool_selection.py --trim-instructions --verbose
+    python benchmarks/tool_selection.py --live    # needs GITHUB_TOKEN (and MODEL_BASE_URL for another endpoint)
+
+Offline (the default), reports for every question which tools the selector
+offers and whether they include the tool a correct answer needs (the
+accuracy proxy: a question whose tool was left out can't be answered from the
+knowledge base), and the estimated input tokens of tool schemas plus
+instructions per model round trip, with the full set and with subsetting.
+
+With --live, each question is also sent through an agent with the full tool
+set and one with subsetting, comparing the prompt tokens the model reports
+and how often the model actually calls the expected tool.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coolman_agent import AGENT_TOOLS, SYSTEM_INSTRUCTIONS, create_tool_selector
+from history_compaction import CHARS_PER_TOKEN
+from tool_selection import trim_instructions
+
+# (question, previous question or None, tools a correct answer needs - any one of them)
+QUERIES = [
+    ("what's your email", None, {"get_contact_info"}),
+    ("What is your phone number?", None, {"get_contact_info"}),
+    ("What are your hours?", None, {"get_contact_info"}),
+    ("Where are you located?", None, {"get_contact_info"}),
+    ("How can I contact someone about an order?", None, {"get_contact_info"}),
+    ("Do you deliver to Exeter?", None, {"check_service_area"}),
+    ("Can you deliver heating oil to Seaforth?", None, {"check_service_area"}),
+    ("Is Stratford in your service area?", None, {"check_service_area"}),
+    ("I live near Grand Bend, can you come out to me?", None, {"check_service_area"}),
+    ("What about Goderich?", "Do you deliver to Exeter?", {"check_service_area"}),
+    ("and St. Marys?", "Do you deliver to Mitchell?", {"check_service_area"}),
+    ("Which areas do you cover?", None, {"get_service_area_details", "check_service_area"}),
+    ("What counties is your territory in?", None, {"get_service_area_details"}),
+    ("What products do you sell?", None, {"get_products_list"}),
+    ("Do you carry dyed diesel?", None, {"get_products_list"}),
+    ("Do you have DEF?", None, {"get_products_list"}),
+    ("What lubricants do you have?", None, {"get_products_list"}),
+    ("Do you sell antifreeze or washer fluid?", None, {"get_products_list"}),
+    ("What services do you offer?", None, {"get_services_list"}),
+    ("Can I get automatic delivery?", None, {"get_services_list", "get_residential_heating_info"}),
+    ("Do you offer an equal payment plan?", None, {"get_services_list"}),
+    ("Do you rent fuel tanks and pumps?", None, {"get_services_list"}),
+    ("Tell me about your fleet cards", None, {"get_fleet_card_info"}),
+    ("Where can I use the Petro-Pass cardlock?", None, {"get_fleet_card_info"}),
+    ("Do you accept Comdata?", None, {"get_fleet_card_info"}),
+    ("I heat my house with propane, can you help?", None, {"get_residential_heating_info"}),
+    ("Should I use propane or heating oil for my home?", None, {"get_residential_heating_info"}),
+    ("How big is a furnace oil tank?", None, {"get_residential_heating_info"}),
+    ("I'm a new customer, what do I need?", None, {"get_new_customer_requirements"}),
+    ("Do I need a tank inspection before my first delivery?", None, {"get_new_customer_requirements"}),
+    ("Who can inspect my tank?", None, {"get_new_customer_requirements"}),
+    ("How do I switch to Coolman for furnace oil?", None, {"get_new_customer_requirements"}),
+    ("What do you offer for commercial customers?", None, {"get_commercial_solutions"}),
+    ("I run a farm, what can you do for me?", None, {"get_commercial_solutions"}),
+    ("We have a construction business with 10 trucks", None, {"get_commercial_solutions", "get_fleet_card_info"}),
+    ("How do I apply for credit?", None, {"get_credit_application_link"}),
+    ("Can I open an account?", None, {"get_credit_application_link"}),
+    ("Where is your privacy policy?", None, {"navigate_website"}),
+    ("Send me the link to the residential page", None, {"navigate_website"}),
+    ("Tell me about Coolman Fuels", None, {"get_company_info"}),
+    ("How long have you been in business?", None, {"get_company_info"}),
+    ("Hi there!", None, set()),
+    ("Thanks, that's all", None, set()),
+    ("How much does it cost?", "Do you sell propane?", set()),
+    ("I need fuel delivered to my farm in Mitchell and want to set up a credit account", None,
+     {"check_service_area", "get_credit_application_link"}),
+]
+
+
+def tool_schema_tokens() -> dict[str, int]:
+    """Estimated prompt tokens of each tool's JSON schema, as the agent sends it."""
+    from agent_framework import ai_function
+
+    return {
+        tool.__name__: len(json.dumps(ai_function(tool).to_json_schema_spec())) // CHARS_PER_TOKEN
+        for tool in AGENT_TOOLS
+    }
+
+
+def run_offline(args) -> list[dict]:
+    selector = create_tool_selector()
+    schema_tokens = tool_schema_tokens()
+    full_tools = sum(schema_tokens.values())
+    full_instructions = len(SYSTEM_INSTRUCTIONS) // CHARS_PER_TOKEN
+
+    results = []
+    for question, previous, expected in QUERIES:
+        # The previous turn's expected tool stands in for the tool it called
+        recent = ()
+        if previous:
+            recent = next((e for q, p, e in QUERIES if q == previous), ())
+        selected = selector.select(question, previous, recent)
+        offered = set(selected) if selected is not None else set(schema_tokens)
+        instructions = SYSTEM_INSTRUCTIONS
+        if selected is not None and args.trim_instructions:
+            instructions = trim_instructions(SYSTEM_INSTRUCTIONS, selected)
+        results.append({
+            "question": question,
+            "selected": selected,
+            "covered": not expected or bool(expected & offered),
+            "tokens": sum(schema_tokens[name] for name in offered) + len(instructions) // CHARS_PER_TOKEN,
+        })
+
+    full = full_tools + full_instructions
+    subset = [r for r in results if r["selected"] is not None]
+    covered = sum(r["covered"] for r in results)
+    avg_tokens = sum(r["tokens"] for r in results) / len(results)
+    print(f"\n🧰 {len(results)} questions, {len(schema_tokens)} tools")
+    print(f"  {'tool schemas, full set':<34}{full_tools:>6} tokens")
+    print(f"  {'instructions, full':<34}{full_instructions:>6} tokens")
+    print(f"  {'subset turns':<34}{len(subset):>6} ({len(subset) / len(results):.0%}), "
+          f"avg {sum(len(r['selected']) for r in subset) / max(1, len(subset)):.1f} tools")
+    print(f"  {'expected tool offered':<34}{covered:>6} / {len(results)} ({covered / len(results):.0%})")
+    print(f"  {'tools + instructions per round trip':<34}{full:>6} full -> {avg_tokens:.0f} "
+          f"subset ({1 - avg_tokens / full:.0%} saved)")
+    for r in results:
+        if args.verbose or not r["covered"]:
+            marker = "  " if r["covered"] else "❌"
+            offered = ", ".join(r["selected"]) if r["selected"] is not None else "FULL SET"
+            print(f"  {marker} {r['question'][:50]:<52}{r['tokens']:>5}  {offered}")
+    return results
+
+
+async def run_agent(agent, question: str, previous: str | None) -> tuple[int, set[str]]:
+    """Prompt tokens and tools called for a question (after its previous question, if any)."""
+    thread = agent.get_new_thread()
+    if previous:
+        await agent.run(previous, thread=thread)
+    response = await agent.run(question, thread=thread)
+    called = {
+        content.name
+        for message in response.messages
+        for content in message.contents
+        if getattr(content, "type", None) == "function_call"
+    }
+    usage = response.usage_details
+    return (usage.input_token_count or 0) if usage else 0, called
+
+
+async def run_live(args) -> dict:
+    from coolman_agent import create_coolman_agent
+
+    agents = {}
+    for mode, enabled in (("full", "false"), ("subset", "true")):
+        os.environ["TOOL_SUBSETTING"] = enabled
+        os.environ["TOOL_SUBSETTING_TRIM_INSTRUCTIONS"] = "true" if args.trim_instructions else "false"
+        agents[mode] = await create_coolman_agent()
+
+    report = {}
+    for mode, agent in agents.items():
+        tokens, correct = 0, 0
+        for question, previous, expected in QUERIES:
+            prompt_tokens, called = await run_agent(agent, question, previous)
+            tokens += prompt_tokens
+            correct += bool(called & expected) if expected else not called
+            report.setdefault(question, {})[mode] = sorted(called)
+        report[mode] = {"prompt_tokens": tokens, "correct": correct}
+        print(f"  {mode:<8} prompt tokens {tokens:>8}   expected tool called {correct}/{len(QUERIES)}")
+    for question, *_ in QUERIES:
+        if report[question]["full"] != report[question]["subset"]:
+            print(f"  ≠ {question[:50]:<52} full {report[question]['full']} subset {report[question]['subset']}")
+    full_tokens = report["full"]["prompt_tokens"]
+    if full_tokens:
+        print(f"  prompt tokens saved: {1 - report['subset']['prompt_tokens'] / full_tokens:.0%}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-turn tool subsetting on a fixed question set")
+    parser.add_argument("--trim-instructions", action="store_true", help="Also trim the instruction sections")
+    parser.add_argument("--live", action="store_true", help="Also run every question through the model")
+    parser.add_argument("--verbose", action="store_true", help="List every question, not only misses")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {"offline": run_offline(args)}
+    if args.live:
+        print("\n🤖 Live comparison")
+        results["live"] = asyncio.run(run_live(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Single-flight coalescing of identical in-flight questions.
+
+When many new visitors ask the same opening question at once, only the first
+request (the leader) generates an answer upstream. The generation runs in its
+own task and publishes its events to a Flight; every request for the same key
+- the leader included - replays the events so far and then follows along live.
+A flight counts its subscribers: one leaving (its client disconnected) doesn't
+affect the others, but once every one has left the generation is cancelled.
+"""
+
+import asyncio
+from typing import AsyncIterator
+
+
+class FlightError(Exception):
+    """The shared generation a request was waiting on did not complete."""
+
+
+class Flight:
+    """One shared generation whose (event, data) stream fans out to all subscribers."""
+
+    def __init__(self):
+        self.events: list[tuple[str, dict]] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.subscribers = 0
+        # Cancelled because every subscriber left before it finished
+        self.abandoned = False
+        self._changed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def start(self, events: AsyncIterator[tuple[str, dict]], on_done) -> None:
+        self._task = asyncio.create_task(self._pump(events, on_done))
+
+    async def _pump(self, events: AsyncIterator[tuple[str, dict]], on_done) -> None:
+        try:
+            async for event in events:
+                self.events.append(event)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = FlightError("Shared generation was cancelled")
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            on_done()
+            self._notify()
+
+    async def wait(self) -> None:
+        """Wait until the generation has finished, or been cancelled."""
+        while not self.done:
+            await self._changed.wait()
+
+    async def subscribe(self) -> AsyncIterator[tuple[str, dict]]:
+        """Replay the events published so far, then follow new ones until done."""
+        index = 0
+        self.subscribers += 1
+        try:
+            while True:
+                while index < len(self.events):
+                    yield self.events[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done and self._task is not None:
+                # Nobody is waiting for the answer any more
+                self.abandoned = True
+                self._task.cancel()
+
+
+class SingleFlight:
+    """Registry of in-flight generations keyed on the normalized question."""
+
+    def __init__(self):
+        self._flights: dict[str, Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    def join(self, key: str) -> tuple[Flight, bool]:
+        """Return the flight for a key and whether the caller must start it."""
+        flight = self._flights.get(key)
+        # An abandoned flight is being cancelled; start a new one rather than share its error
+        if flight is not None and not flight.abandoned:
+            self.coalesced += 1
+            return flight, False
+        flight = Flight()
+        self._flights[key] = flight
+        self.started += 1
+        return flight, True
+
+    def run(self, key: str, flight: Flight, events: AsyncIterator[tuple[str, dict]]) -> None:
+        """Start the leader's generation; the key is released when it finishes."""
+        def release():
+            if flight.abandoned:
+                self.abandoned += 1
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.start(events, release)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "generations": self.started,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
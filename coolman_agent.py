@@ -10,6 +10,10 @@ Last Updated: December 2025
 """
 
 import asyncio
+import functools
+import hashlib
+import inspect
+import json
 from typing import Annotated
 import os
 from dotenv import load_dotenv
@@ -17,9 +21,16 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-from agent_framework import ChatAgent
-from agent_framework.openai import OpenAIChatClient
-from openai import AsyncOpenAI
+# agent_framework and openai are imported where the agent is created: they are
+# most of the web server's cold start, and the knowledge base doesn't need them
+from hedging import HedgeStats
+from history_compaction import CompactionStats
+from location_index import LocationIndex, load_gazetteer
+from retrieval import BM25Index, Chunk, RetrievalStats, describe, split_sections
+from tool_execution import ToolExecutionStats
+from tool_selection import ToolSelectionStats, ToolSelector
+from upstream import get_upstream_http_client, model_base_url
+from usage import UsageLedger, start_turn
 
 # ============================================================================
 # COOLMAN FUELS KNOWLEDGE BASE
@@ -124,9 +135,25 @@ SERVICE_TERRITORY = {
         "south": "Lucan to London boundary (Highway 4 corridor)",
         "west": "Lake Huron shoreline from Goderich to Thedford",
     },
+    # Other names customers use for communities we serve
+    "aliases": {
+        "Lucan": "Lucan Biddulph",
+        "Biddulph": "Lucan Biddulph",
+        "South Huron": "Exeter",
+        "Stephen": "Crediton",
+        "Hay": "Zurich",
+        "Central Huron": "Clinton",
+        "Huron East": "Seaforth",
+        "West Perth": "Mitchell",
+        "Lambton Shores": "Grand Bend",
+        "North Middlesex": "Parkhill",
+        "Saint Marys": "St. Marys",
+        "London": "London (North)",
+    },
     # Internal territory reference - not shared with customers
     "approximate_coverage_km2": 2500,
     "service_radius_km": 40,  # From Exeter HQ
+    "hq_coordinates": (43.3473, -81.4800),  # Exeter HQ (lat, lon)
 }
 
 PRODUCTS = {
@@ -255,10 +282,168 @@ INDUSTRIES_SERVED = [
     "Mining & Forestry", "Manufacturing", "Aviation", "Marine"
 ]
 
+def knowledge_base_version() -> str:
+    """Return a short fingerprint of the knowledge base, used to invalidate cached answers."""
+    knowledge_base = {
+        "company_info": COMPANY_INFO,
+        "service_territory": SERVICE_TERRITORY,
+        "products": PRODUCTS,
+        "services": SERVICES,
+        "fleet_cards": FLEET_CARDS,
+        "industries_served": INDUSTRIES_SERVED,
+    }
+    encoded = json.dumps(knowledge_base, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+class ToolResultCache:
+    """Pre-rendered outputs of the knowledge-base tools.
+    
+    Each registered tool is rendered once per argument variant, so a tool call
+    becomes a dictionary lookup. Outputs are stamped with the knowledge base
+    version and re-rendered by refresh() only when the data has changed.
+    """
+    
+    def __init__(self):
+        self._renderers = {}
+        self._outputs = {}
+        self.version = None
+        self.renders = 0
+    
+    def register(self, name: str, renderer, variants=()):
+        self._renderers[name] = (renderer, tuple(variants))
+        self.version = None
+    
+    def refresh(self, force: bool = False) -> bool:
+        """Re-render every tool output if the knowledge base has changed."""
+        version = knowledge_base_version()
+        if version == self.version and not force:
+            return False
+        
+        outputs = {}
+        for name, (renderer, variants) in self._renderers.items():
+            if variants:
+                outputs[name] = {arg: renderer(arg) for arg in variants}
+            else:
+                outputs[name] = {None: renderer()}
+        self._outputs = outputs
+        self.version = version
+        self.renders += 1
+        return True
+    
+    def lookup(self, name: str, arg=None) -> str:
+        if self.version is None:
+            self.refresh()
+        try:
+            return self._outputs[name][arg]
+        except KeyError:
+            # Unlisted argument values are rare - render them directly
+            renderer, _ = self._renderers[name]
+            return renderer() if arg is None else renderer(arg)
+
+tool_results = ToolResultCache()
+
+def refresh_knowledge_base() -> str:
+    """Re-render tool outputs if the knowledge base changed and return its version."""
+    tool_results.refresh()
+    return tool_results.version
+
+# Optional offline place coordinates for towns not listed in SERVICE_TERRITORY
+GAZETTEER = load_gazetteer()
+_location_index = None
+_location_index_version = None
+
+def get_location_index() -> LocationIndex:
+    """Return the service area index, rebuilding it when the knowledge base changes."""
+    global _location_index, _location_index_version
+    if tool_results.version is None:
+        tool_results.refresh()
+    if _location_index is None or _location_index_version != tool_results.version:
+        _location_index = LocationIndex(SERVICE_TERRITORY, GAZETTEER)
+        _location_index_version = tool_results.version
+    return _location_index
+
+# Tools whose text is written out rather than rendered from the dictionaries above
+LONG_TOOL_TEXTS = (
+    "get_contact_info",
+    "get_residential_heating_info",
+    "get_new_customer_requirements",
+    "get_commercial_solutions",
+    "get_fleet_card_info",
+    "get_credit_application_link",
+)
+
+def knowledge_chunks() -> list[Chunk]:
+    """Split the customer-facing knowledge base into retrieval chunks, each tagged with the tool covering it."""
+    company = {k: v for k, v in COMPANY_INFO.items() if not isinstance(v, (dict, list))}
+    company["cardlock_locations"] = COMPANY_INFO["cardlock_locations"]
+    chunks = [
+        Chunk("get_company_info", "About Coolman Fuels", describe(company)),
+        Chunk("get_products_list", "Propane delivery partner",
+              describe(COMPANY_INFO["partnerships"]["propane_delivery"])),
+        Chunk("get_new_customer_requirements", "Tank inspection for new customers",
+              describe(COMPANY_INFO["tank_inspection_requirements"], skip=("primary_recommendation",))),
+        Chunk("get_commercial_solutions", "Industries served", describe(INDUSTRIES_SERVED)),
+    ]
+    for product in PRODUCTS.values():
+        chunks.append(Chunk("get_products_list", product["name"], describe(product, skip=("name",))))
+    chunks.append(Chunk("get_services_list", "Services overview", tool_results.lookup("get_services_list", "all")))
+    for service in SERVICES.values():
+        # Services we don't advertise are only discussed when a customer calls
+        if service.get("advertise", True):
+            chunks.append(Chunk("get_services_list", service["name"], describe(service, skip=("name",))))
+    for key, card in FLEET_CARDS.items():
+        title = card["name"] if isinstance(card, dict) else key.replace("_", " ").capitalize()
+        chunks.append(Chunk("get_fleet_card_info", title, describe(card, skip=("name",))))
+    # Aliases, coordinates and the coverage figures are internal
+    for key in ("primary_communities", "boundary_communities", "counties_served", "boundaries"):
+        title = "Service area: " + key.replace("_", " ")
+        chunks.append(Chunk("get_service_area_details", title, describe(SERVICE_TERRITORY[key])))
+    for name in LONG_TOOL_TEXTS:
+        title = name.removeprefix("get_").replace("_", " ").capitalize()
+        chunks.extend(split_sections(tool_results.lookup(name), name, title))
+    return chunks
+
+_retrieval_index = None
+_retrieval_index_version = None
+# Knowledge-base retrieval (only recorded when KB_RETRIEVAL is on)
+retrieval_stats = RetrievalStats()
+
+def get_retrieval_index() -> BM25Index:
+    """Return the knowledge-base retrieval index, rebuilding it when the knowledge base changes."""
+    global _retrieval_index, _retrieval_index_version
+    if tool_results.version is None:
+        tool_results.refresh()
+    if _retrieval_index is None or _retrieval_index_version != tool_results.version:
+        _retrieval_index = BM25Index(knowledge_chunks())
+        _retrieval_index_version = tool_results.version
+        retrieval_stats.index_chunks = len(_retrieval_index.chunks)
+        retrieval_stats.index_build_ms = _retrieval_index.build_seconds * 1000
+    return _retrieval_index
+
+def precomputed(*variants):
+    """Serve a knowledge-base tool from pre-rendered outputs, one per argument variant."""
+    def decorator(func):
+        tool_results.register(func.__name__, func, variants)
+        params = list(inspect.signature(func).parameters.values())
+        default = params[0].default if params and params[0].default is not inspect.Parameter.empty else None
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if args:
+                arg = args[0]
+            elif kwargs:
+                arg = next(iter(kwargs.values()))
+            else:
+                arg = default
+            return tool_results.lookup(func.__name__, arg)
+        return wrapper
+    return decorator
+
 # ============================================================================
 # AGENT TOOLS - Functions the AI can use to help customers
 # ============================================================================
 
+@precomputed()
 def get_company_info() -> str:
     """Get general information about Coolman Fuels company."""
     primary_areas = ", ".join(SERVICE_TERRITORY['primary_communities'][:10])
@@ -276,6 +461,7 @@ def get_company_info() -> str:
     Coverage: ~{SERVICE_TERRITORY['approximate_coverage_km2']} km² across Huron, Perth, Middlesex, and Lambton counties
     """
 
+@precomputed("all", "fuel", "residential", "commercial")
 def get_products_list(
     category: Annotated[str, "Product category: 'all', 'fuel', 'residential', or 'commercial'"] = "all"
 ) -> str:
@@ -292,6 +478,7 @@ def get_products_list(
     
     return result
 
+@precomputed("all", "delivery", "payment")
 def get_services_list(
     service_type: Annotated[str, "Service type: 'all', 'delivery', or 'payment'"] = "all"
 ) -> str:
@@ -317,6 +504,7 @@ def get_services_list(
     
     return result
 
+@precomputed()
 def get_contact_info() -> str:
     """Get contact information for Coolman Fuels."""
     return f"""
@@ -338,18 +526,26 @@ def check_service_area(
     location: Annotated[str, "The city or town to check for service availability"]
 ) -> str:
     """Check if a location is within Coolman Fuels' service area using detailed territory data."""
-    location_lower = location.lower().strip()
-    
-    # Check primary service communities
-    primary_lower = [area.lower() for area in SERVICE_TERRITORY['primary_communities']]
-    boundary_lower = [area.lower() for area in SERVICE_TERRITORY['boundary_communities']]
+    match = get_location_index().classify(location)
+    if match.method == "ambiguous":
+        options = " or ".join(match.suggestions)
+        return f"""🤔 **Did you mean {options}?**
+
+"{location}" is close to more than one place we know. Please confirm the town name so we can check delivery for you.
+
+📞 Or call us at {COMPANY_INFO['phone']} and we'll confirm service for your address!
+"""
     
-    # Check for exact or partial matches
-    is_primary = any(location_lower in area or area in location_lower for area in primary_lower)
-    is_boundary = any(location_lower in area or area in location_lower for area in boundary_lower)
+    # Typos are answered under the community name we matched
+    note = ""
+    if match.method == "fuzzy":
+        note = f"(Assuming you meant {match.place}.)\n\n"
+        location = match.place
+    elif match.method == "distance" and match.place:
+        note = f"📏 {match.place} is about {match.distance_km:g} km from our Exeter HQ.\n\n"
     
-    if is_primary:
-        return f"""✅ **Great news! {location} is within our PRIMARY service area!**
+    if match.status == "primary":
+        return note + f"""✅ **Great news! {location} is within our PRIMARY service area!**
 
 We provide full delivery service to {location} including:
 • Residential: Propane, heating oil
@@ -362,8 +558,8 @@ We provide full delivery service to {location} including:
 📞 Call us at {COMPANY_INFO['phone']} to schedule a delivery!
 """
     
-    elif is_boundary:
-        return f"""🔄 **{location} - Let's confirm your service!**
+    elif match.status == "boundary":
+        return note + f"""🔄 **{location} - Let's confirm your service!**
 
 This area is on the edge of our regular delivery routes:
 • We may be able to serve you depending on your exact location
@@ -376,7 +572,7 @@ This area is on the edge of our regular delivery routes:
 """
     
     else:
-        return f"""📍 **{location} is outside our service area.**
+        return note + f"""📍 **{location} is outside our service area.**
 
 We serve Southwestern Ontario including:
 {', '.join(SERVICE_TERRITORY['primary_communities'][:10])}, and surrounding areas.
@@ -389,6 +585,7 @@ Our partner Core Fuels / Red Cap Propane may be able to help!
 📞 519-272-0090 | 🔗 corefuels.ca
 """
 
+@precomputed()
 def get_service_area_details() -> str:
     """Get detailed information about Coolman Fuels' service territory and boundaries."""
     primary = ", ".join(SERVICE_TERRITORY['primary_communities'][:15])
@@ -424,6 +621,7 @@ def get_service_area_details() -> str:
 📞 Questions about your area? Call {COMPANY_INFO['phone']}
 """
 
+@precomputed()
 def get_fleet_card_info() -> str:
     """Get information about fleet cards and cardlock fueling."""
     return f"""
@@ -446,6 +644,7 @@ def get_fleet_card_info() -> str:
     **Compatible External Cards:** You can also use compatible cards like BVD Petroleum card, US-based Comdata, and EFS card at our locations.
     """
 
+@precomputed()
 def get_residential_heating_info() -> str:
     """Get information about residential heating solutions (propane and heating oil)."""
     return """
@@ -482,6 +681,7 @@ def get_residential_heating_info() -> str:
     📞 Contact us for propane OR heating oil: +1 519-235-0853 or sales@coolmanfuels.ca
     """
 
+@precomputed()
 def get_new_customer_requirements() -> str:
     """Get information about requirements for new propane, furnace oil, or generator delivery accounts."""
     return """
@@ -508,6 +708,7 @@ def get_new_customer_requirements() -> str:
     📞 Questions? Call us at +1 519-235-0853 or email sales@coolmanfuels.ca
     """
 
+@precomputed()
 def get_commercial_solutions() -> str:
     """Get information about commercial fuel solutions."""
     industries = ', '.join(INDUSTRIES_SERVED)
@@ -543,6 +744,7 @@ def get_commercial_solutions() -> str:
     Contact us at {COMPANY_INFO['phone']} for customized solutions!
     """
 
+@precomputed()
 def get_credit_application_link() -> str:
     """Get the link to the credit application form."""
     return """
@@ -554,6 +756,7 @@ def get_credit_application_link() -> str:
     For questions about credit terms, call us at +1 519-235-0853
     """
 
+@precomputed("home", "commercial", "residential", "credit", "privacy", "terms")
 def navigate_website(
     page: Annotated[str, "The page to navigate to: 'home', 'commercial', 'residential', 'credit', 'privacy', 'terms'"]
 ) -> str:
@@ -643,18 +846,67 @@ competitors unless specifically asked.
 # MAIN AGENT SETUP
 # ============================================================================
 
-async def create_coolman_agent():
-    """Create and return the Coolman Fuels AI agent."""
+# Prompt size measurements from the history compaction stage, shared by all agents
+compaction_stats = CompactionStats()
+# Tool subsetting outcomes (only recorded when TOOL_SUBSETTING is on)
+tool_selection_stats = ToolSelectionStats()
+# Hedged model calls (only recorded when HEDGE_AFTER_SECONDS is set)
+hedge_stats = HedgeStats()
+# Tool calls in flight and timeouts
+tool_execution_stats = ToolExecutionStats()
+
+AGENT_TOOLS = [
+    get_company_info,
+    get_products_list,
+    get_services_list,
+    get_contact_info,
+    check_service_area,
+    get_service_area_details,
+    get_fleet_card_info,
+    get_residential_heating_info,
+    get_new_customer_requirements,
+    get_commercial_solutions,
+    get_credit_application_link,
+    navigate_website,
+]
+
+def create_tool_selector() -> ToolSelector:
+    """Tool selector over the agent's tools, recognizing community names in messages."""
+    return ToolSelector(
+        [tool.__name__ for tool in AGENT_TOOLS],
+        max_tools=int(os.environ.get("TOOL_SUBSET_MAX_TOOLS", "6")),
+        find_place=lambda message: get_location_index().find_place(message),
+    )
+
+async def create_coolman_agent(max_retries: int = 2):
+    """Create and return the Coolman Fuels AI agent.
+    
+    max_retries is passed to the OpenAI SDK; the web API sets it to 0 because
+    its admission layer retries rate-limited calls itself.
+    """
     
     # Get GitHub token from environment variable
     github_token = os.environ.get("GITHUB_TOKEN")
     if not github_token:
         raise ValueError("Please set the GITHUB_TOKEN environment variable with your GitHub Personal Access Token")
     
-    # Initialize OpenAI client with GitHub Models endpoint
+    from agent_framework import ChatAgent
+    from agent_framework.openai import OpenAIChatClient
+    from openai import AsyncOpenAI
+    from middleware import (
+        HedgingMiddleware, HistoryCompactionMiddleware, RetrievalMiddleware, ToolMetricsMiddleware,
+        ToolSubsetMiddleware, ToolTimeoutMiddleware, UpstreamMetricsMiddleware,
+    )
+    
+    # Render the knowledge-base tool outputs up front (no-op if nothing changed)
+    tool_results.refresh()
+    
+    # Initialize OpenAI client with GitHub Models endpoint over the shared keep-alive pool
     openai_client = AsyncOpenAI(
-        base_url="https://models.github.ai/inference",
+        base_url=model_base_url(),
         api_key=github_token,
+        http_client=get_upstream_http_client(),
+        max_retries=max_retries,
     )
     
     # Create the chat client
@@ -663,29 +915,80 @@ async def create_coolman_agent():
         model_id="openai/gpt-4.1-mini"  # Free-tier GitHub model, great for customer support
     )
     
+    # Keep the last few turns verbatim and condense older ones to cap prompt size
+    history_compaction = HistoryCompactionMiddleware(
+        keep_turns=int(os.environ.get("HISTORY_KEEP_TURNS", "4")),
+        max_tokens=int(os.environ.get("HISTORY_TOKEN_BUDGET", "3000")),
+        stats=compaction_stats,
+    )
+    prompt_middleware = [history_compaction]
+    
+    # Optionally send only the tools (and instruction sections) each turn needs
+    if os.environ.get("TOOL_SUBSETTING", "false").lower() == "true":
+        prompt_middleware.insert(0, ToolSubsetMiddleware(
+            create_tool_selector(),
+            trim=os.environ.get("TOOL_SUBSETTING_TRIM_INSTRUCTIONS", "false").lower() == "true",
+            stats=tool_selection_stats,
+        ))
+    
+    # Optionally add the knowledge-base excerpts for each question, saving most tool round trips
+    if os.environ.get("KB_RETRIEVAL", "false").lower() == "true":
+        get_retrieval_index()
+        prompt_middleware.append(RetrievalMiddleware(
+            get_retrieval_index, top_k=int(os.environ.get("KB_RETRIEVAL_TOP_K", "4")), stats=retrieval_stats,
+        ))
+    
+    # Optionally race model calls that stream nothing for a while against a fallback model or endpoint
+    model_middleware = []
+    hedge_after = float(os.environ.get("HEDGE_AFTER_SECONDS", "0"))
+    if hedge_after > 0:
+        fallback_client = OpenAIChatClient(
+            async_client=AsyncOpenAI(
+                base_url=os.environ.get("HEDGE_BASE_URL") or model_base_url(),
+                api_key=os.environ.get("HEDGE_API_KEY") or github_token,
+                http_client=get_upstream_http_client(),
+                # A hedge is itself the retry; the primary request is still running
+                max_retries=0,
+            ),
+            model_id=os.environ.get("HEDGE_MODEL") or chat_client.model_id,
+        )
+        hedge_stats.max_in_flight = int(os.environ.get("HEDGE_MAX_IN_FLIGHT", "4"))
+        model_middleware.append(HedgingMiddleware(fallback_client, hedge_after, hedge_stats))
+    
     # Create the agent with all tools
     agent = ChatAgent(
         chat_client=chat_client,
         name="Coolman Fuels Assistant",
         instructions=SYSTEM_INSTRUCTIONS,
-        tools=[
-            get_company_info,
-            get_products_list,
-            get_services_list,
-            get_contact_info,
-            check_service_area,
-            get_service_area_details,
-            get_fleet_card_info,
-            get_residential_heating_info,
-            get_new_customer_requirements,
-            get_commercial_solutions,
-            get_credit_application_link,
-            navigate_website,
+        # Prompt shaping runs first so the upstream timings cover only the model call
+        middleware=[
+            *prompt_middleware, UpstreamMetricsMiddleware(), *model_middleware,
+            ToolMetricsMiddleware(), ToolTimeoutMiddleware(tool_execution_stats),
         ],
+        tools=AGENT_TOOLS,
     )
     
     return agent
 
+# ============================================================================
+# THREAD HELPERS
+# ============================================================================
+
+async def get_thread_messages(thread) -> list:
+    """Return the messages stored in a conversation thread (empty for a new thread)."""
+    if thread.message_store is None:
+        return []
+    return list(await thread.message_store.list_messages())
+
+async def record_exchange(thread, user_message: str, response_text: str):
+    """Append a question and an answer produced outside the model to a thread."""
+    from agent_framework import ChatMessage, Role
+    
+    await thread.on_new_messages([
+        ChatMessage(role=Role.USER, text=user_message),
+        ChatMessage(role=Role.ASSISTANT, text=response_text),
+    ])
+
 async def chat_with_agent():
     """Interactive chat session with the Coolman Fuels agent."""
     print("=" * 60)
@@ -699,6 +1002,7 @@ async def chat_with_agent():
     
     agent = await create_coolman_agent()
     thread = agent.get_new_thread()
+    usage_ledger = UsageLedger()
     
     while True:
         try:
@@ -710,13 +1014,21 @@ async def chat_with_agent():
             if user_input.lower() in ['quit', 'exit', 'bye', 'goodbye']:
                 print("\nAssistant: Thank you for visiting Coolman Fuels! If you have any")
                 print("questions, call us at +1 519-235-0853. Have a great day! 👋")
+                cli_usage = (await usage_ledger.report(1))["endpoints"].get("cli", {})
+                print(f"\n🔢 This conversation: {cli_usage.get('round_trips', 0)} round trips, "
+                      f"{cli_usage.get('prompt_tokens', 0)} prompt / {cli_usage.get('completion_tokens', 0)} completion tokens")
                 break
             
             print("\nAssistant: ", end="", flush=True)
-            async for chunk in agent.run_stream(user_input, thread=thread):
-                if chunk.text:
-                    print(chunk.text, end="", flush=True)
+            turn = start_turn()
+            try:
+                async for chunk in agent.run_stream(user_input, thread=thread):
+                    if chunk.text:
+                        print(chunk.text, end="", flush=True)
+            finally:
+                usage_ledger.record_turn(None, "cli", turn)
             print("\n")
+            print(f"   {turn.summary()}\n")
             
         except KeyboardInterrupt:
             print("\n\nGoodbye! Contact us at +1 519-235-0853 for any questions.")
@@ -756,5 +1068,8 @@ if __name__ == "__main__":
     
     if len(sys.argv) > 1 and sys.argv[1] == "--demo":
         asyncio.run(demo_responses())
+    elif len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        from batch_eval import main as run_batch
+        sys.exit(asyncio.run(run_batch(sys.argv[2:])))
     else:
         asyncio.run(chat_with_agent())
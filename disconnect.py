@@ -0,0 +1,102 @@
+"""
+Stop generating answers nobody is waiting for.
+
+A visitor who closes the tab mid-answer used to leave the turn running: the
+model stream was read to the end, burning completion tokens and holding an
+admission slot other customers were queued for. cancel_on_disconnect runs a
+turn in its own task and watches the ASGI connection; when the client goes
+away the task is cancelled, which closes the upstream stream at once and
+releases the slot. The chat WebSocket gets the same effect by cancelling its
+answer task when the socket closes, and a coalesced generation is only
+cancelled once every request sharing it has gone (coalesce.py).
+
+What the model had written by then is recorded in the session's thread, so
+the next message sees the conversation as the customer saw it. The tokens
+saved are estimated as the average length of a completed turn less what was
+already generated, both counted in streamed chunks: the model streams about
+one completion token per chunk, text or tool call, where the answer's length
+in characters would also leave out the tool-call rounds before it.
+"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable
+
+import metrics
+
+
+async def wait_for_disconnect(receive: Callable[[], Awaitable[dict]]) -> None:
+    """Return once the ASGI server reports the client has disconnected."""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def cancel_on_disconnect(
+    receive: Callable[[], Awaitable[dict]], events: AsyncIterator[tuple[str, dict]]
+) -> AsyncIterator[tuple[str, dict]]:
+    """Relay a turn's events, cancelling the turn as soon as the client disconnects.
+
+    The turn runs in its own task, so it is cancelled while it waits on the
+    model rather than at the next event sent to the gone client. The relay
+    simply ends after a disconnect; errors from the turn are re-raised.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for event in events:
+                queue.put_nowait(event)
+        finally:
+            queue.put_nowait(None)
+
+    async def watch():
+        await wait_for_disconnect(receive)
+        producer.cancel()
+
+    producer = asyncio.create_task(produce())
+    watcher = asyncio.create_task(watch())
+    try:
+        while (event := await queue.get()) is not None:
+            yield event
+        if not producer.cancelled():
+            # Re-raise the turn's exception, if it failed
+            await producer
+    finally:
+        watcher.cancel()
+        producer.cancel()
+
+
+@dataclass
+class DisconnectStats:
+    completed_turns: int = 0
+    # Chunks streamed by completed turns, about one completion token each
+    completed_tokens: int = 0
+    # Model turns cancelled because the client disconnected before the answer was complete
+    cancelled_turns: int = 0
+    partial_answers_recorded: int = 0
+    # Estimated completion tokens the cancelled turns did not generate
+    tokens_saved: int = 0
+
+    def average_answer_tokens(self) -> float:
+        return self.completed_tokens / self.completed_turns if self.completed_turns else 0.0
+
+    def record_completed(self, streamed_tokens: int) -> None:
+        self.completed_turns += 1
+        self.completed_tokens += streamed_tokens
+
+    def record_cancelled(self, partial_answer: str, streamed_tokens: int) -> None:
+        self.cancelled_turns += 1
+        if partial_answer:
+            self.partial_answers_recorded += 1
+        saved = max(0, round(self.average_answer_tokens()) - streamed_tokens)
+        self.tokens_saved += saved
+        metrics.CANCELLED_TURNS.inc()
+        metrics.SAVED_TOKENS.inc(saved)
+
+    def as_dict(self) -> dict:
+        return {
+            "cancelled_turns": self.cancelled_turns,
+            "partial_answers_recorded": self.partial_answers_recorded,
+            "tokens_saved": self.tokens_saved,
+            "average_answer_tokens": round(self.average_answer_tokens(), 1),
+        }
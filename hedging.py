@@ -0,0 +1,168 @@
+"""
+Hedged model requests.
+
+GitHub Models occasionally stalls for seconds before streaming the first
+token, and the customer watches the typing indicator the whole time. When a
+model call has streamed nothing within HEDGE_AFTER_SECONDS, a second request
+for the same prompt goes to a fallback model (HEDGE_MODEL) or endpoint
+(HEDGE_BASE_URL). Whichever streams its first chunk first is used and the
+other is cancelled, closing its connection so it stops generating.
+
+The threshold should sit near the healthy p95 time to first chunk, so only the
+slow tail is hedged and the extra upstream load stays a few percent. A cap on
+hedges in flight keeps an endpoint-wide slowdown from doubling traffic to it.
+The hedge rate, which request won and the recent first-chunk percentiles are
+reported in /health, so the tail can be compared with hedging on and off.
+"""
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable
+
+import metrics
+
+_END = object()
+# Recent round trips kept for the first-chunk percentiles
+RECENT_ROUND_TRIPS = 1000
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+@dataclass
+class HedgeStats:
+    round_trips: int = 0
+    hedged: int = 0
+    primary_wins: int = 0
+    fallback_wins: int = 0
+    # Not hedged because max_in_flight hedges were already running
+    skipped: int = 0
+    failures: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 4
+    first_chunk_seconds: deque = field(default_factory=lambda: deque(maxlen=RECENT_ROUND_TRIPS))
+
+    def record(self, outcome: str) -> None:
+        """Count a hedged round trip's outcome: primary, fallback or failed."""
+        if outcome == "primary":
+            self.primary_wins += 1
+        elif outcome == "fallback":
+            self.fallback_wins += 1
+        else:
+            self.failures += 1
+        metrics.HEDGES.labels(winner=outcome).inc()
+
+    def as_dict(self) -> dict:
+        recent = list(self.first_chunk_seconds)
+        return {
+            "round_trips": self.round_trips,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.round_trips, 4) if self.round_trips else 0.0,
+            "primary_wins": self.primary_wins,
+            "fallback_wins": self.fallback_wins,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "first_chunk_p50_ms": round(percentile(recent, 0.5) * 1000, 1),
+            "first_chunk_p95_ms": round(percentile(recent, 0.95) * 1000, 1),
+            "first_chunk_p99_ms": round(percentile(recent, 0.99) * 1000, 1),
+        }
+
+
+async def _next_or_end(iterator):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _END
+
+
+async def _cancel(task: asyncio.Task, iterator) -> None:
+    """Stop a losing request: cancel its pending read and close its stream."""
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+
+async def _race(primary, primary_first: asyncio.Task, fallback, fallback_first: asyncio.Task, stats: HedgeStats):
+    """The stream whose first chunk arrives first, and that chunk; the other is cancelled.
+
+    A request that fails before streaming anything loses; the error is raised
+    only if both fail (the primary's, as it is the one the caller expects).
+    """
+    pending = {primary_first: ("primary", primary), fallback_first: ("fallback", fallback)}
+    errors = {}
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # On a tie the primary wins
+            for task in sorted(done, key=lambda t: pending[t][0] != "primary"):
+                name, iterator = pending.pop(task)
+                if task.exception() is not None:
+                    errors[name] = task.exception()
+                    continue
+                for loser, (_, loser_iterator) in pending.items():
+                    await _cancel(loser, loser_iterator)
+                stats.record(name)
+                return iterator, task.result()
+    except asyncio.CancelledError:
+        for task, (_, iterator) in pending.items():
+            await _cancel(task, iterator)
+        raise
+    stats.record("failed")
+    raise errors.get("primary") or errors["fallback"]
+
+
+async def _hedge(primary, primary_first: asyncio.Task, start_fallback, stats: HedgeStats):
+    try:
+        fallback = start_fallback()
+    except Exception as e:
+        # A misconfigured fallback must not fail the request; keep waiting on the primary
+        print(f"⚠️ Could not start a hedged model request: {e}")
+        stats.record("failed")
+        return primary, await primary_first
+    fallback_first = asyncio.ensure_future(_next_or_end(fallback))
+    return await _race(primary, primary_first, fallback, fallback_first, stats)
+
+
+async def hedged_stream(
+    primary: AsyncIterator,
+    start_fallback: Callable[[], AsyncIterator],
+    hedge_after: float,
+    stats: HedgeStats,
+) -> AsyncIterator:
+    """Stream primary, racing it against start_fallback() if nothing arrives within hedge_after seconds."""
+    started = time.perf_counter()
+    stats.round_trips += 1
+    primary_first = asyncio.ensure_future(_next_or_end(primary))
+    try:
+        done, _ = await asyncio.wait({primary_first}, timeout=hedge_after)
+        if done or stats.in_flight >= stats.max_in_flight:
+            if not done:
+                stats.skipped += 1
+            stream, first = primary, await primary_first
+        else:
+            stats.hedged += 1
+            stats.in_flight += 1
+            try:
+                stream, first = await _hedge(primary, primary_first, start_fallback, stats)
+            finally:
+                stats.in_flight -= 1
+    except asyncio.CancelledError:
+        # The caller went away while we waited; don't leave the primary request running
+        await _cancel(primary_first, primary)
+        raise
+    stats.first_chunk_seconds.append(time.perf_counter() - started)
+    if first is _END:
+        return
+    yield first
+    async for update in stream:
+        yield update
@@ -0,0 +1,129 @@
+"""
+Conversation history compaction for the Coolman Fuels agent.
+
+Every model round trip resends the whole thread history. The compaction
+middleware (HistoryCompactionMiddleware in middleware.py) keeps the last few
+turns verbatim, folds older turns into a short system-note
+summary (tool calls and tool results from those turns are dropped), and then
+trims further until the estimated prompt fits a token budget. The thread
+itself is never modified - only what is sent upstream.
+"""
+
+from dataclasses import dataclass
+
+# Rough characters-per-token ratio for English text with GPT tokenizers
+CHARS_PER_TOKEN = 4
+# Length an older message is cut to when folded into the summary
+SUMMARY_LINE_CHARS = 160
+
+
+def message_role(message) -> str:
+    return str(getattr(message.role, "value", message.role))
+
+
+def _message_chars(message) -> int:
+    total = 0
+    for content in getattr(message, "contents", None) or []:
+        text = getattr(content, "text", None)
+        if text is None:
+            text = getattr(content, "result", None) or getattr(content, "arguments", None) or ""
+        total += len(str(text))
+    return total
+
+
+def estimate_tokens(messages, instructions: str | None = None) -> int:
+    """Estimate the prompt tokens of a message list plus the system instructions."""
+    chars = sum(_message_chars(m) for m in messages)
+    if instructions:
+        chars += len(instructions)
+    return chars // CHARS_PER_TOKEN
+
+
+def _summarize(messages) -> list[str]:
+    """One short line per customer question and assistant answer in older turns."""
+    lines = []
+    for message in messages:
+        role = message_role(message)
+        text = (message.text or "").strip()
+        if role not in ("user", "assistant") or not text:
+            continue
+        text = " ".join(text.split())
+        if len(text) > SUMMARY_LINE_CHARS:
+            text = text[:SUMMARY_LINE_CHARS].rstrip() + "…"
+        speaker = "Customer" if role == "user" else "Assistant"
+        lines.append(f"- {speaker}: {text}")
+    return lines
+
+
+def _summary_message(lines: list[str]):
+    from agent_framework import ChatMessage, Role
+
+    text = "Summary of earlier conversation (older turns condensed):\n" + "\n".join(lines)
+    return ChatMessage(role=Role.SYSTEM, text=text)
+
+
+def compact_messages(messages, keep_turns: int, max_tokens: int, instructions: str | None = None) -> list:
+    """Return a compacted copy of a prompt's messages.
+
+    A turn starts at a customer message and includes the tool calls, tool
+    results and answer that follow it. Leading system messages are kept.
+    """
+    messages = list(messages)
+    head_len = 0
+    while head_len < len(messages) and message_role(messages[head_len]) == "system":
+        head_len += 1
+    head, body = messages[:head_len], messages[head_len:]
+
+    turn_starts = [i for i, m in enumerate(body) if message_role(m) == "user"]
+    keep_turns = max(1, keep_turns)
+    split = turn_starts[-keep_turns] if len(turn_starts) > keep_turns else 0
+    summary_lines = _summarize(body[:split])
+    recent = body[split:]
+
+    def build():
+        summary = [_summary_message(summary_lines)] if summary_lines else []
+        return head + summary + recent
+
+    compacted = build()
+    # Over budget: drop the oldest summary lines first, then whole verbatim turns
+    while estimate_tokens(compacted, instructions) > max_tokens:
+        if summary_lines:
+            summary_lines.pop(0)
+        else:
+            starts = [i for i, m in enumerate(recent) if message_role(m) == "user"]
+            if len(starts) <= 1:
+                break
+            recent = recent[starts[1]:]
+        compacted = build()
+    return compacted
+
+
+@dataclass
+class CompactionStats:
+    """Prompt size measurements across model round trips."""
+    round_trips: int = 0
+    compacted_round_trips: int = 0
+    last_prompt_tokens: int = 0
+    max_prompt_tokens: int = 0
+    total_prompt_tokens: int = 0
+    total_tokens_saved: int = 0
+
+    def record(self, before: int, after: int) -> None:
+        self.round_trips += 1
+        if after < before:
+            self.compacted_round_trips += 1
+            self.total_tokens_saved += before - after
+        self.last_prompt_tokens = after
+        self.max_prompt_tokens = max(self.max_prompt_tokens, after)
+        self.total_prompt_tokens += after
+
+    def as_dict(self) -> dict:
+        return {
+            "round_trips": self.round_trips,
+            "compacted_round_trips": self.compacted_round_trips,
+            "last_prompt_tokens": self.last_prompt_tokens,
+            "avg_prompt_tokens": round(self.total_prompt_tokens / self.round_trips) if self.round_trips else 0,
+            "max_prompt_tokens": self.max_prompt_tokens,
+            "total_tokens_saved": self.total_tokens_saved,
+        }
+
@@ -0,0 +1,152 @@
+"""
+Deterministic intent router for simple customer questions.
+
+Questions like "what's your phone number" or "do you deliver to Exeter" map
+one-to-one onto a tool, yet cost one or two model round trips. The router
+scores a message against keyword/regex patterns for a handful of intents and,
+above a confidence threshold, answers from a template built on the knowledge
+base. Anything ambiguous, long, or unrecognized goes to the model as before.
+Patterns are anchored on "your"/"you" or a question form, and messages about
+the customer's own details ("change the phone number on my account") are
+never routed.
+"""
+
+import re
+import textwrap
+from dataclasses import dataclass
+
+from coolman_agent import COMPANY_INFO, check_service_area, get_contact_info, get_location_index
+from response_cache import normalize_message
+
+# Messages longer than this are probably more than a simple lookup
+MAX_WORDS = 12
+LONG_MESSAGE_PENALTY = 0.8
+# "phone number and email" asks for more than one thing
+COMPOUND_PENALTY = 0.6
+_COMPOUND = re.compile(r"\b(?:and|also|plus|or)\b")
+# The customer's own details, not ours: "update my email address"
+_ABOUT_CUSTOMER = re.compile(r"\b(?:my|mine|our|change|changed|changing|update|updated|updating)\b")
+
+# (pattern on the normalized message, confidence)
+INTENT_PATTERNS = {
+    "phone": [
+        (r"^(?:whats |what is )?(?:your |the )?(?:phone|telephone)(?: number)?$", 0.97),
+        (r"^(?:how do i|how can i|can i) (?:call|phone) (?:you|coolman)", 0.9),
+        (r"^(?:whats|what is|can i get|can i have|could i get) (?:your|the) (?:phone|telephone) (?:number|#)", 0.9),
+        (r"\b(?:your|coolmans) (?:phone|telephone) (?:number|#)\b", 0.85),
+    ],
+    "email": [
+        (r"^(?:whats |what is )?(?:your |the )?e ?mail(?: address)?$", 0.97),
+        (r"^(?:whats|what is|can i get|can i have|could i get) (?:your|the) e ?mail(?: address)?\b", 0.9),
+        (r"\b(?:your|coolmans) e ?mail address\b", 0.85),
+    ],
+    "hours": [
+        (r"^(?:what are )?(?:your )?(?:business |office )?hours$", 0.97),
+        (r"^(?:when are you|are you) open\b", 0.9),
+        (r"\b(?:your|coolmans) (?:opening|business|office) hours\b", 0.85),
+    ],
+    "address": [
+        (r"^where are you(?: located| based)?$", 0.97),
+        (r"^(?:whats |what is )?(?:your )?(?:address|location)$", 0.95),
+        (r"\bwhere (?:is|are) (?:your|coolman)\b.*\b(?:office|located|location|yard)\b", 0.85),
+    ],
+    "contact": [
+        (r"^contact(?: info| information| details| us)?$", 0.97),
+        (r"^how (?:do|can) i (?:contact|reach) (?:you|coolman)", 0.9),
+    ],
+}
+
+_SERVICE_AREA = re.compile(
+    r"^(?:do|can|will) you (?:guys )?(?:deliver|service|serve|come|go)(?: out)? (?:to|in|into|near|around) (?P<place>.+?)[?.!]*$"
+    r"|^is (?P<place2>.+?) (?:in|within|part of) your (?:service|delivery) (?:area|territory|zone)[?.!]*$",
+    re.IGNORECASE,
+)
+
+_COMPILED = {
+    intent: [(re.compile(pattern), confidence) for pattern, confidence in patterns]
+    for intent, patterns in INTENT_PATTERNS.items()
+}
+
+
+@dataclass(frozen=True)
+class RoutedAnswer:
+    intent: str
+    confidence: float
+    answer: str
+
+
+def _template(intent: str) -> str:
+    phone = COMPANY_INFO["phone"]
+    if intent == "phone":
+        return f"📞 You can reach Coolman Fuels at **{phone}** - we offer {COMPANY_INFO['hours'].lower()}."
+    if intent == "email":
+        return f"✉️ You can email us at **{COMPANY_INFO['email']}**, or call **{phone}** if you'd like to talk to someone right away."
+    if intent == "hours":
+        return f"We offer **{COMPANY_INFO['hours'].lower()}** - call us any time at **{phone}**. 📞"
+    if intent == "address":
+        return f"📍 We're located at **{COMPANY_INFO['location']}**. Call us at **{phone}** for directions or to place an order."
+    return textwrap.dedent(get_contact_info()).strip()
+
+
+class IntentRouter:
+    """Answers high-confidence simple intents locally, without a model call."""
+
+    def __init__(self, threshold: float = 0.8):
+        self.threshold = threshold
+        self.routed: dict[str, int] = {}
+        self.passed_through = 0
+
+    def classify(self, message: str) -> tuple[str | None, float, str | None]:
+        """Return (intent, confidence, service area place) for a message."""
+        words = len(message.split())
+        penalty = LONG_MESSAGE_PENALTY if words > MAX_WORDS else 1.0
+
+        place_match = _SERVICE_AREA.match(message.strip())
+        if place_match:
+            place = (place_match.group("place") or place_match.group("place2")).strip()
+            # Only answer locally when the index knows the whole place by name; a typo, or a
+            # town followed by somewhere we can't place ("Exeter, New Hampshire"), goes to the model
+            known = get_location_index().lookup(place) is not None
+            return "service_area", (0.95 if known else 0.5) * penalty, place
+
+        normalized = normalize_message(message)
+        if _ABOUT_CUSTOMER.search(normalized):
+            return None, 0.0, None
+        if _COMPOUND.search(normalized):
+            penalty *= COMPOUND_PENALTY
+        scores = {}
+        for intent, patterns in _COMPILED.items():
+            best = max((confidence for pattern, confidence in patterns if pattern.search(normalized)), default=0.0)
+            if best:
+                scores[intent] = best
+        if not scores:
+            return None, 0.0, None
+        if len(scores) > 1:
+            # "phone number and hours" - several intents, let the model combine them
+            intent = max(scores, key=scores.get)
+            return intent, 0.5 * penalty, None
+        intent, confidence = next(iter(scores.items()))
+        return intent, confidence * penalty, None
+
+    def route(self, message: str) -> RoutedAnswer | None:
+        """Return a templated answer, or None if the message should go to the model."""
+        intent, confidence, place = self.classify(message)
+        if intent is None or confidence < self.threshold:
+            self.passed_through += 1
+            return None
+
+        if intent == "service_area":
+            answer = check_service_area(place).strip()
+        else:
+            answer = _template(intent)
+        self.routed[intent] = self.routed.get(intent, 0) + 1
+        return RoutedAnswer(intent, confidence, answer)
+
+    def stats(self) -> dict:
+        routed = sum(self.routed.values())
+        total = routed + self.passed_through
+        return {
+            "routed": dict(self.routed),
+            "passed_through": self.passed_through,
+            "routed_ratio": round(routed / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,242 @@
+"""
+Location lookup index for service area checks.
+
+Community names, aliases and (optionally) an offline gazetteer of place
+coordinates are normalized once into hash lookups. Typos are resolved with a
+symmetric-delete index of bounded edit distance, so a lookup stays well under a
+millisecond. Many real towns are a letter or two away from one of ours
+(Milton / Walton, Drayton / Granton), so a typo must keep the first letter,
+names under eight letters allow a single edit, and three-letter names and
+aliases are never fuzzy-matched; when several places are that close, the
+customer is asked which one they meant. Places that are only in the gazetteer
+are classified by their distance from Exeter HQ against the territory's
+service radius.
+
+In a comma-separated address only the last part naming a place is looked up,
+and only if nothing but the province, "Canada" or a postal code follows it:
+"12 Main St, Exeter, ON N0M 1S0" is our Exeter, but "Exeter, New Hampshire"
+and "London, England" are somewhere else.
+"""
+
+import csv
+import math
+import os
+import re
+from dataclasses import dataclass
+
+# Maximum edit distance accepted for a typo; names shorter than LONG_NAME_LENGTH allow only one edit
+MAX_EDIT_DISTANCE = 2
+LONG_NAME_LENGTH = 8
+# Names and aliases this short (e.g. "Hay") are only matched exactly
+MIN_FUZZY_LENGTH = 4
+# Gazetteer places this far past the service radius are still "call to confirm"
+BOUNDARY_MARGIN_KM = 10
+
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.csv")
+
+_PARENTHETICAL = re.compile(r"\(.*?\)")
+_NON_WORD = re.compile(r"[^\w\s]")
+_COORDINATES = re.compile(r"^\s*(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+_POSTAL_CODE = re.compile(r"^[a-z]\d[a-z]$|^\d[a-z]\d$")
+_PROVINCE_TOKENS = {"on", "ont", "ontario", "canada"}
+_FILLER_TOKENS = {"near", "in", "around", "outside", "the", "town", "village", "township", "of"}
+
+
+def normalize_place(name: str) -> str:
+    """Normalize a place name: case, punctuation, 'St.' spelling, province suffixes."""
+    text = _PARENTHETICAL.sub(" ", name.lower())
+    text = text.replace("’", "").replace("'", "")
+    tokens = _NON_WORD.sub(" ", text).split()
+    tokens = ["saint" if t in ("st", "ste") else t for t in tokens]
+    while tokens and (tokens[-1] in _PROVINCE_TOKENS or _POSTAL_CODE.match(tokens[-1])):
+        tokens.pop()
+    while tokens and tokens[0] in _FILLER_TOKENS:
+        tokens.pop(0)
+    return " ".join(tokens)
+
+
+def _deletes(word: str, max_distance: int) -> set[str]:
+    """All strings reachable from a word by up to max_distance deletions."""
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Levenshtein distance, or max_distance + 1 once it is known to exceed the bound."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+def load_gazetteer(path: str | None = None) -> dict[str, tuple[float, float]]:
+    """Load place coordinates from a name,lat,lon CSV; missing file means no gazetteer."""
+    path = path or os.environ.get("GAZETTEER_PATH", DEFAULT_GAZETTEER_PATH)
+    if not path or not os.path.exists(path):
+        return {}
+    gazetteer = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            gazetteer[row["name"]] = (float(row["lat"]), float(row["lon"]))
+    return gazetteer
+
+
+@dataclass(frozen=True)
+class LocationMatch:
+    status: str                 # "primary", "boundary", "outside" or "unknown" (ambiguous typo)
+    place: str | None = None    # Canonical community or gazetteer place that matched
+    method: str = "none"        # "exact", "alias", "fuzzy", "ambiguous", "distance" or "none"
+    distance_km: float | None = None
+    suggestions: tuple[str, ...] = ()   # Places an ambiguous typo is close to
+
+
+class LocationIndex:
+    """Prebuilt index classifying a free-text location against the service territory."""
+
+    def __init__(self, territory: dict, gazetteer: dict[str, tuple[float, float]] | None = None):
+        self.radius_km = territory["service_radius_km"]
+        self.hq = tuple(territory["hq_coordinates"])
+        self._exact: dict[str, tuple[str, str, str]] = {}   # key -> (status, place, method)
+        self._places: dict[str, tuple[float, float]] = {}   # key -> coordinates
+        self._deletes: dict[str, set[str]] = {}
+
+        for status, names in (("primary", territory["primary_communities"]),
+                              ("boundary", territory["boundary_communities"])):
+            for name in names:
+                self._add(normalize_place(name), (status, name, "exact"))
+        for alias, name in territory.get("aliases", {}).items():
+            status = "primary" if name in territory["primary_communities"] else "boundary"
+            self._add(normalize_place(alias), (status, name, "alias"))
+
+        for name, coordinates in (gazetteer or {}).items():
+            key = normalize_place(name)
+            self._places[key] = coordinates
+            if key not in self._exact:
+                self._add_deletes(key)
+        self._place_names = {normalize_place(name): name for name in (gazetteer or {})}
+
+    def _add(self, key: str, entry: tuple[str, str, str]) -> None:
+        self._exact.setdefault(key, entry)
+        self._add_deletes(key)
+
+    def _add_deletes(self, key: str) -> None:
+        if len(key) < MIN_FUZZY_LENGTH:
+            return
+        for variant in _deletes(key, MAX_EDIT_DISTANCE):
+            self._deletes.setdefault(variant, set()).add(key)
+
+    def _by_distance(self, key: str, place: str, method: str) -> LocationMatch:
+        lat, lon = self._places[key]
+        distance = haversine_km(self.hq[0], self.hq[1], lat, lon)
+        return self._classify_point(distance, place, method)
+
+    def _classify_point(self, distance: float, place: str | None, method: str) -> LocationMatch:
+        if distance <= self.radius_km:
+            status = "primary"
+        elif distance <= self.radius_km + BOUNDARY_MARGIN_KM:
+            status = "boundary"
+        else:
+            status = "outside"
+        return LocationMatch(status, place, method, round(distance, 1))
+
+    def _fuzzy(self, key: str) -> list[str]:
+        """Indexed keys of distinct places within the edit-distance bound, closest first.
+
+        Listed communities come before gazetteer places at the same distance.
+        """
+        if len(key) < MIN_FUZZY_LENGTH:
+            return []
+        bound = 1 if len(key) < LONG_NAME_LENGTH else MAX_EDIT_DISTANCE
+        candidates = set()
+        for variant in _deletes(key, bound):
+            candidates |= self._deletes.get(variant, set())
+        ranked = []
+        for candidate in candidates:
+            if candidate[0] != key[0]:
+                continue
+            distance = edit_distance(key, candidate, bound)
+            if distance <= bound:
+                ranked.append((distance, candidate not in self._exact, candidate))
+        matches, places = [], set()
+        for _, _, candidate in sorted(ranked):
+            place = self._lookup(candidate).place
+            if place not in places:
+                places.add(place)
+                matches.append(candidate)
+        return matches
+
+    def _lookup(self, key: str) -> LocationMatch | None:
+        if key in self._exact:
+            return LocationMatch(*self._exact[key])
+        if key in self._places:
+            return self._by_distance(key, self._place_names[key], "distance")
+        return None
+
+    def classify(self, location: str) -> LocationMatch:
+        """Classify a town name, a comma-separated address, or a 'lat, lon' point."""
+        point = _COORDINATES.match(location)
+        if point:
+            distance = haversine_km(self.hq[0], self.hq[1], float(point.group(1)), float(point.group(2)))
+            return self._classify_point(distance, None, "distance")
+
+        # Try the whole string, then the town of an address: its last part once the
+        # province and postal code are stripped. Anything else after it (a state, a
+        # county, another country) means the place isn't ours.
+        keys = [normalize_place(location)]
+        if "," in location:
+            parts = [normalize_place(part) for part in location.split(",")]
+            parts = [part for part in parts if part]
+            if parts:
+                keys.append(parts[-1])
+        keys = [k for k in dict.fromkeys(keys) if k]
+
+        for key in keys:
+            match = self._lookup(key)
+            if match:
+                return match
+        for key in keys:
+            candidates = self._fuzzy(key)
+            if len(candidates) > 1:
+                # Close to several places: ask rather than guess
+                suggestions = tuple(self._lookup(candidate).place for candidate in candidates)
+                return LocationMatch("unknown", method="ambiguous", suggestions=suggestions)
+            if candidates:
+                match = self._lookup(candidates[0])
+                return LocationMatch(match.status, match.place, "fuzzy", match.distance_km)
+        return LocationMatch("outside")
+
+    def lookup(self, location: str) -> LocationMatch | None:
+        """Match the whole location by name, alias or gazetteer entry; no typos or address parts."""
+        return self._lookup(normalize_place(location))
+
+    def find_place(self, text: str, max_words: int = 3) -> str | None:
+        """Return the first known place named anywhere in free text (exact names and aliases only)."""
+        tokens = normalize_place(text).split()
+        for start in range(len(tokens)):
+            for length in range(min(max_words, len(tokens) - start), 0, -1):
+                key = " ".join(tokens[start:start + length])
+                match = self._lookup(key)
+                if match:
+                    return match.place
+        return None
@@ -0,0 +1,112 @@
+"""
+Prometheus metrics for the chat API.
+
+Latency is broken down by stage so slowness can be pinned on our process or
+on the upstream model: whole requests and time to first token per endpoint,
+each upstream model round trip and each tool execution (recorded by the
+middleware in middleware.py), hedged model calls by winner, and turns cancelled
+when the client disconnected (disconnect.py). Token usage comes from the
+usage chunk the model streams at the end of every round trip. Counters kept
+elsewhere (session evictions) are read at scrape time.
+
+With several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory so /metrics aggregates every worker (the scrape-time session
+counters then cover only the worker that answers the scrape).
+"""
+
+import os
+import time
+from typing import AsyncIterator, Callable
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily
+
+# Chat turns take seconds; tools and cached answers take microseconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+TOOL_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+
+REQUEST_SECONDS = Histogram(
+    "coolman_request_seconds", "Chat request latency, end to end", ["endpoint"], buckets=LATENCY_BUCKETS
+)
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "coolman_time_to_first_token_seconds", "Time until the first answer text of a chat request",
+    ["endpoint"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_ROUND_TRIP_SECONDS = Histogram(
+    "coolman_upstream_round_trip_seconds", "Duration of one model call, until its stream ends", buckets=LATENCY_BUCKETS
+)
+UPSTREAM_FIRST_CHUNK_SECONDS = Histogram(
+    "coolman_upstream_first_chunk_seconds", "Time until a model call streams its first chunk", buckets=LATENCY_BUCKETS
+)
+TOOL_SECONDS = Histogram("coolman_tool_seconds", "Tool execution time", ["tool"], buckets=TOOL_BUCKETS)
+TOKENS = Counter("coolman_tokens", "Model tokens used", ["kind"])
+ERRORS = Counter("coolman_errors", "Failed chat requests and tool calls", ["type"])
+HEDGES = Counter("coolman_hedges", "Model calls hedged with a fallback request, by which one streamed first", ["winner"])
+CANCELLED_TURNS = Counter("coolman_cancelled_turns", "Model turns cancelled because the client disconnected")
+SAVED_TOKENS = Counter(
+    "coolman_saved_tokens", "Estimated completion tokens not generated because the client disconnected"
+)
+
+
+def record_usage(details) -> None:
+    """Count the prompt and completion tokens of one model round trip."""
+    if details is None:
+        return
+    if details.input_token_count:
+        TOKENS.labels(kind="prompt").inc(details.input_token_count)
+    if details.output_token_count:
+        TOKENS.labels(kind="completion").inc(details.output_token_count)
+    cached = (details.additional_counts or {}).get("prompt/cached_tokens")
+    if cached:
+        TOKENS.labels(kind="cached").inc(cached)
+
+
+async def observe_turn(endpoint: str, events: AsyncIterator[tuple[str, dict]]) -> AsyncIterator[tuple[str, dict]]:
+    """Pass a turn's (event, data) stream through, recording its latency and time to first token."""
+    started = time.perf_counter()
+    first_token = True
+    async for event, data in events:
+        if first_token and event == "delta":
+            first_token = False
+            TIME_TO_FIRST_TOKEN_SECONDS.labels(endpoint=endpoint).observe(time.perf_counter() - started)
+        yield event, data
+    REQUEST_SECONDS.labels(endpoint=endpoint).observe(time.perf_counter() - started)
+
+
+def record_error(error_type: str) -> None:
+    ERRORS.labels(type=error_type).inc()
+
+
+class SessionEvictionCollector:
+    """Exposes the session store's eviction counts, read at scrape time."""
+
+    def __init__(self, stats_fn: Callable[[], dict]):
+        self._stats_fn = stats_fn
+
+    def collect(self):
+        family = CounterMetricFamily("coolman_session_evictions", "Sessions evicted from the store", labels=["reason"])
+        for reason, count in self._stats_fn().get("evictions", {}).items():
+            family.add_metric([reason], count)
+        yield family
+
+
+_scrape_time_collectors = []
+
+
+def register_session_store(store) -> None:
+    collector = SessionEvictionCollector(store.stats)
+    _scrape_time_collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Return the metrics page and its content type."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in _scrape_time_collectors:
+            registry.register(collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,252 @@
+"""
+Agent middleware: history compaction, tool subsetting, knowledge-base
+retrieval, metrics timing, token accounting, hedged model calls and tool
+timeouts.
+
+These subclass agent_framework's middleware base classes, so they live apart
+from history_compaction.py, tool_selection.py, retrieval.py, metrics.py,
+usage.py, hedging.py and tool_execution.py and are
+only imported when the agent is created. That keeps agent_framework (and openai) out of the web server's
+import path, which is most of a cold start.
+"""
+
+import asyncio
+import copy
+import json
+import time
+
+from agent_framework import (
+    BaseChatClient, ChatContext, ChatMessage, ChatMiddleware, FunctionInvocationContext, FunctionMiddleware, Role,
+)
+
+import metrics
+import usage
+from hedging import HedgeStats, hedged_stream
+from history_compaction import CHARS_PER_TOKEN, CompactionStats, message_role, compact_messages, estimate_tokens
+from retrieval import RetrievalStats, format_excerpts
+from tool_execution import TIMEOUT_RESULT, ToolExecutionStats, tool_timeout
+from tool_selection import ToolSelectionStats, ToolSelector, trim_instructions
+
+
+class HistoryCompactionMiddleware(ChatMiddleware):
+    """Chat middleware that compacts the history sent on each model round trip."""
+
+    def __init__(self, keep_turns: int = 4, max_tokens: int = 3000, stats: CompactionStats | None = None):
+        self.keep_turns = keep_turns
+        self.max_tokens = max_tokens
+        self.stats = stats or CompactionStats()
+
+    async def process(self, context: ChatContext, next):
+        instructions = getattr(context.chat_options, "instructions", None)
+        before = estimate_tokens(context.messages, instructions)
+        if before > self.max_tokens or sum(message_role(m) == "user" for m in context.messages) > self.keep_turns:
+            context.messages = compact_messages(context.messages, self.keep_turns, self.max_tokens, instructions)
+        after = estimate_tokens(context.messages, instructions)
+        self.stats.record(before, after)
+        await next(context)
+
+
+class ToolSubsetMiddleware(ChatMiddleware):
+    """Chat middleware that sends only the tools (and optionally instructions) a turn needs."""
+
+    def __init__(self, selector: ToolSelector, trim: bool = False, stats: ToolSelectionStats | None = None):
+        self.selector = selector
+        self.trim = trim
+        self.stats = stats or ToolSelectionStats()
+        self._schema_tokens: dict[str, int] = {}
+        self._trimmed: dict[tuple[str, frozenset], str] = {}
+
+    def _tool_tokens(self, tool) -> int:
+        name = getattr(tool, "name", None)
+        if name not in self._schema_tokens:
+            spec = tool.to_json_schema_spec() if hasattr(tool, "to_json_schema_spec") else {}
+            self._schema_tokens[name] = len(json.dumps(spec)) // CHARS_PER_TOKEN
+        return self._schema_tokens[name]
+
+    async def process(self, context: ChatContext, next):
+        tools = list(context.chat_options.tools or [])
+        selected = self._select(context.messages) if tools else None
+        if selected is not None:
+            kept = [tool for tool in tools if getattr(tool, "name", None) in selected]
+            saved = sum(self._tool_tokens(tool) for tool in tools if getattr(tool, "name", None) not in selected)
+            instructions_saved = 0
+            instructions = context.chat_options.instructions
+            if self.trim and instructions:
+                key = (instructions, frozenset(selected))
+                if key not in self._trimmed:
+                    self._trimmed[key] = trim_instructions(instructions, selected)
+                context.chat_options.instructions = self._trimmed[key]
+                instructions_saved = (len(instructions) - len(self._trimmed[key])) // CHARS_PER_TOKEN
+            context.chat_options.tools = kept
+            self.stats.record(len(tools), len(kept), saved, instructions_saved)
+        else:
+            self.stats.record(len(tools), len(tools))
+        await next(context)
+
+    def _select(self, messages) -> list[str] | None:
+        """Select from the last question, the one before it and the tools called in between."""
+        user_indexes = [i for i, m in enumerate(messages) if message_role(m) == "user"]
+        if not user_indexes:
+            return None
+        last = user_indexes[-1]
+        previous = user_indexes[-2] if len(user_indexes) > 1 else None
+        # Tool calls since the previous question: last turn's, plus this turn's earlier round trips
+        recent_tools = {
+            content.name
+            for message in messages[previous if previous is not None else last:]
+            for content in getattr(message, "contents", None) or []
+            if getattr(content, "type", None) == "function_call"
+        }
+        return self.selector.select(
+            messages[last].text or "",
+            messages[previous].text if previous is not None else None,
+            recent_tools,
+        )
+
+
+class RetrievalMiddleware(ChatMiddleware):
+    """Chat middleware adding knowledge-base excerpts for a new question to its first round trip."""
+
+    def __init__(self, get_index, top_k: int = 4, stats: RetrievalStats | None = None):
+        self.get_index = get_index
+        self.top_k = top_k
+        self.stats = stats or RetrievalStats()
+
+    async def process(self, context: ChatContext, next):
+        messages = context.messages
+        # Later round trips of a turn follow tool results, and already have what the model asked for
+        if messages and message_role(messages[-1]) == "user":
+            chunks = [chunk for _, chunk in self.get_index().search(messages[-1].text or "", self.top_k)]
+            tokens = 0
+            if chunks:
+                excerpts = format_excerpts(chunks)
+                tokens = len(excerpts) // CHARS_PER_TOKEN
+                # Just before the question, so the instructions and history stay a cacheable prefix
+                context.messages = [*messages[:-1], ChatMessage(role=Role.SYSTEM, text=excerpts), messages[-1]]
+            self.stats.record_turn(len(chunks), tokens)
+        self.stats.round_trips += 1
+        await next(context)
+
+
+def triggering_tools(messages) -> list[str]:
+    """Tools whose results a round trip answers: the calls ending the last assistant message."""
+    for message in reversed(messages):
+        role = message_role(message)
+        if role == "user":
+            return []
+        if role == "assistant":
+            return [
+                content.name for content in getattr(message, "contents", None) or []
+                if getattr(content, "type", None) == "function_call"
+            ]
+    return []
+
+
+class UpstreamMetricsMiddleware(ChatMiddleware):
+    """Chat middleware timing each model round trip and accounting its tokens."""
+
+    async def process(self, context: ChatContext, next):
+        started = time.perf_counter()
+        triggered_by = triggering_tools(context.messages)
+        try:
+            await next(context)
+        except Exception:
+            metrics.ERRORS.labels(type="upstream").inc()
+            usage.record_round_trip(None, triggered_by)
+            raise
+        if context.is_streaming and context.result is not None:
+            context.result = self._observe_stream(context.result, started, triggered_by)
+        else:
+            details = getattr(context.result, "usage_details", None)
+            metrics.UPSTREAM_ROUND_TRIP_SECONDS.observe(time.perf_counter() - started)
+            metrics.record_usage(details)
+            usage.record_round_trip(details, triggered_by)
+
+    async def _observe_stream(self, stream, started: float, triggered_by: list[str]):
+        first = True
+        details = None
+        try:
+            async for update in stream:
+                if first:
+                    first = False
+                    metrics.UPSTREAM_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - started)
+                for content in update.contents or []:
+                    if getattr(content, "type", None) == "usage":
+                        details = content.details
+                        metrics.record_usage(details)
+                yield update
+        except Exception:
+            metrics.ERRORS.labels(type="upstream").inc()
+            raise
+        finally:
+            metrics.UPSTREAM_ROUND_TRIP_SECONDS.observe(time.perf_counter() - started)
+            usage.record_round_trip(details, triggered_by)
+
+
+class HedgingMiddleware(ChatMiddleware):
+    """Chat middleware racing a streaming model call that stalls against a fallback request.
+
+    Placed after UpstreamMetricsMiddleware, so the timings and token usage
+    recorded are those of whichever request streamed first.
+    """
+
+    def __init__(self, fallback_client, hedge_after: float, stats: HedgeStats | None = None):
+        self.fallback_client = fallback_client
+        self.hedge_after = hedge_after
+        self.stats = stats or HedgeStats()
+
+    async def process(self, context: ChatContext, next):
+        await next(context)
+        if context.is_streaming and context.result is not None:
+            context.result = hedged_stream(
+                context.result, lambda: self._fallback_stream(context), self.hedge_after, self.stats
+            )
+
+    def _fallback_stream(self, context: ChatContext):
+        # The undecorated client call, as at the end of the middleware pipeline: function
+        # invocation and middleware already wrap the primary request and must not run twice
+        chat_options = copy.copy(context.chat_options)
+        chat_options.model_id = self.fallback_client.model_id
+        return BaseChatClient.get_streaming_response(
+            self.fallback_client, list(context.messages), chat_options=chat_options, **context.kwargs
+        )
+
+
+class ToolMetricsMiddleware(FunctionMiddleware):
+    """Function middleware timing every tool invocation by tool name."""
+
+    async def process(self, context: FunctionInvocationContext, next):
+        started = time.perf_counter()
+        usage.record_tool_call(context.function.name)
+        try:
+            await next(context)
+        except Exception:
+            metrics.ERRORS.labels(type="tool").inc()
+            raise
+        finally:
+            metrics.TOOL_SECONDS.labels(tool=context.function.name).observe(time.perf_counter() - started)
+
+
+class ToolTimeoutMiddleware(FunctionMiddleware):
+    """Function middleware bounding every tool call by its timeout.
+
+    A call that runs out of time gets a note for the model as its result, so
+    the turn carries on with the other tools' results.
+    """
+
+    def __init__(self, stats: ToolExecutionStats | None = None):
+        self.stats = stats or ToolExecutionStats()
+
+    async def process(self, context: FunctionInvocationContext, next):
+        name = context.function.name
+        self.stats.started()
+        timed_out = False
+        try:
+            await asyncio.wait_for(next(context), tool_timeout(name))
+        except asyncio.TimeoutError:
+            timed_out = True
+            metrics.ERRORS.labels(type="tool_timeout").inc()
+            print(f"⏱️ Tool {name} timed out after {tool_timeout(name):g}s")
+            context.result = TIMEOUT_RESULT.format(tool=name)
+        finally:
+            self.stats.finished(timed_out)
@@ -0,0 +1,115 @@
+"""
+Per-client rate limiting for the chat endpoints.
+
+Every chat message can spend a share of the GitHub Models quota that all
+customers draw on, and every new session takes room in the session store, so
+a script hammering /chat or /session/new hurts everyone else. Each client gets
+token buckets: one per client IP for creating sessions, and one per session and
+one per IP for messages (the per-IP limit is looser, since an office shares
+one address). A bucket holds up to `burst` tokens and refills at `rate` tokens
+per second; a request that finds it empty gets a 429 with the seconds until
+the next token as Retry-After.
+
+A bucket is two floats. Buckets are kept in least-recently-used order and
+dropped once they have been idle long enough to refill completely - a full
+bucket behaves exactly like a missing one - so memory follows the clients
+active in the last few minutes. The limits are per worker process.
+"""
+
+import time
+from collections import OrderedDict
+
+RATE_LIMITED_MESSAGE = (
+    "You're sending messages faster than we can answer them. Please wait a moment and try again, "
+    "or call us at +1 519-235-0853."
+)
+
+
+class RateLimiter:
+    """Token buckets keyed by client, with idle buckets expiring in LRU order."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # Seconds for an empty bucket to refill; a bucket idle this long is full and can be dropped
+        self.idle_ttl = burst / rate if rate > 0 else 0.0
+        # key -> [tokens, last update]
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()
+        self.allowed = 0
+        self.limited = 0
+        self.expired = 0
+
+    def acquire(self, key: str) -> float:
+        """Take a token for key: 0 if allowed, otherwise the seconds until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._expire(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[key] = [float(self.burst), now]
+        else:
+            bucket[0] = self._tokens(bucket, now)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            self.allowed += 1
+            return 0.0
+        self.limited += 1
+        return (1 - bucket[0]) / self.rate
+
+    def retry_after(self, key: str) -> float:
+        """Like acquire(), but only looks: the bucket and the counters are left as they are."""
+        if self.rate <= 0:
+            return 0.0
+        bucket = self._buckets.get(key)
+        tokens = self.burst if bucket is None else self._tokens(bucket, time.monotonic())
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def _tokens(self, bucket: list[float], now: float) -> float:
+        return min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+    def _expire(self, now: float) -> None:
+        # The least recently used buckets are at the front; stop at the first one still in use
+        while self._buckets:
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if now - updated < self.idle_ttl:
+                return
+            del self._buckets[key]
+            self.expired += 1
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_minute": round(self.rate * 60, 2),
+            "burst": self.burst,
+            "keys": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "expired": self.expired,
+        }
+
+
+def acquire_all(buckets: list[tuple[RateLimiter, str]]) -> list[float]:
+    """Take a token from every (limiter, key) bucket, or from none of them.
+
+    Returns each bucket's seconds until a token is available, all 0 if the
+    tokens were taken. A request rejected by one limit doesn't use up its
+    allowance under the others.
+    """
+    waits = [limiter.retry_after(key) for limiter, key in buckets]
+    if any(waits):
+        for (limiter, _), wait in zip(buckets, waits):
+            if wait:
+                limiter.limited += 1
+        return waits
+    for limiter, key in buckets:
+        limiter.acquire(key)
+    return waits
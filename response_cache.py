@@ -0,0 +1,97 @@
+"""
+Response cache for first-turn chat messages.
+
+Most widget traffic is the same handful of opening questions, so answers to
+first-turn messages are cached by a normalized form of the message. Entries
+expire after a TTL, the least recently used entry is evicted when the cache is
+full, and the whole cache is dropped whenever the knowledge base version
+changes.
+"""
+
+import re
+import time
+from collections import OrderedDict
+from typing import Callable
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """Normalize a customer message so trivial variations share a cache key."""
+    text = message.lower().replace("’", "'").replace("'", "")
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class ResponseCache:
+    """LRU + TTL cache of agent answers keyed on the normalized message."""
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: float = 3600,
+        version_fn: Callable[[], str] | None = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._version_fn = version_fn
+        self._version = version_fn() if version_fn else None
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_version(self) -> None:
+        """Drop every entry if the knowledge base has changed since it was cached."""
+        if self._version_fn is None:
+            return
+        version = self._version_fn()
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+            self.invalidations += 1
+
+    def get(self, message: str) -> str | None:
+        """Return the cached answer for a message, or None on a miss."""
+        self._check_version()
+        key = normalize_message(message)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, response = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, message: str, response: str) -> None:
+        """Cache an answer, evicting the least recently used entry if full."""
+        key = normalize_message(message)
+        if not key or not response or self.max_entries <= 0:
+            return
+
+        self._check_version()
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
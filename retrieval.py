@@ -0,0 +1,200 @@
+"""
+Keyword retrieval over the knowledge base.
+
+Every tool call costs a whole extra model round trip: the model asks for
+get_residential_heating_info, we run it, and the model is called again with
+the result. The knowledge base is small, so it is split into short chunks
+(one per product, service, fleet card and partner, and one per section of the
+longer tool texts) and indexed with BM25. RetrievalMiddleware (middleware.py)
+adds the best few chunks for the customer's question to the first round trip
+of each turn, so most questions are answered without a tool call. The tools
+stay available for anything the chunks don't cover.
+
+The index is rebuilt when the knowledge base version changes; building it
+takes a few milliseconds.
+"""
+
+import math
+import re
+import time
+from dataclasses import dataclass
+
+# BM25 term frequency saturation and length normalization
+K1 = 1.5
+B = 0.75
+# A question whose best chunk scores below this gets no chunks at all
+MIN_SCORE = 2.0
+# Chunks scoring below this fraction of the best one are left out
+RELATIVE_MIN_SCORE = 0.4
+
+STOPWORDS = frozenset("""
+a about an and any are as at be by can could do does for from get got have how i if in is it its just like me my
+need of on or our please so some tell than that the their them then there these they this to us want was we what
+when where which who will with would you your
+""".split())
+
+# Words customers use for things the knowledge base words differently, added to the query
+SYNONYMS = {
+    "office": "address location",
+    "located": "address location",
+    "open": "hours",
+    "weekend": "hours 24/7",
+    "closed": "hours",
+    "business": "established",
+    "old": "established",
+    "furnace": "heating oil",
+    "card": "cardlock",
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_HEADING = re.compile(r"^\W*\*\*(.+?)\*\*:?\s*$")
+
+EXCERPTS_HEADER = (
+    "Knowledge base excerpts for the customer's next message. If they answer it, reply from them "
+    "directly without calling a tool; otherwise use your tools. The same rules apply as for tool results."
+)
+
+
+def stem(token: str) -> str:
+    """Crude suffix stripping, enough to match 'deliveries' to 'delivery' and 'heating' to 'heat'."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 5 and token.endswith("ing"):
+        return token[:-3]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    text = text.lower().replace("’", "").replace("'", "")
+    return [stem(token) for token in _TOKEN.findall(text) if token not in STOPWORDS]
+
+
+def expand_query(query: str) -> list[str]:
+    tokens = tokenize(query)
+    return tokens + [synonym for token in tokens if token in SYNONYMS for synonym in tokenize(SYNONYMS[token])]
+
+
+@dataclass
+class Chunk:
+    # The tool whose output covers the same facts
+    source: str
+    title: str
+    text: str
+
+
+def describe(entry, skip=()) -> str:
+    """Knowledge-base data as 'Key: value' lines, nested dicts indented and lists comma-joined."""
+    if not isinstance(entry, dict):
+        return ", ".join(map(str, entry)) if isinstance(entry, (list, tuple)) else str(entry)
+    lines = []
+    for key, value in entry.items():
+        if key in skip:
+            continue
+        label = key.replace("_", " ").capitalize()
+        if isinstance(value, dict):
+            nested = describe(value, skip).replace("\n", "\n  ")
+            lines.append(f"{label}:\n  {nested}")
+        elif isinstance(value, list) and value and isinstance(value[0], dict):
+            lines.append(f"{label}:\n" + "\n".join("- " + describe(v, skip).replace("\n", "; ") for v in value))
+        else:
+            lines.append(f"{label}: {describe(value)}")
+    return "\n".join(lines)
+
+
+def split_sections(text: str, source: str, title: str) -> list[Chunk]:
+    """Split a tool's text at its bold headings, one chunk per section."""
+    sections = []
+    current_title, lines = title, []
+    for line in text.strip().splitlines():
+        line = line.strip()
+        heading = _HEADING.match(line)
+        if heading:
+            if lines:
+                sections.append((current_title, lines))
+            current_title, lines = heading.group(1).strip(" :"), []
+        elif line:
+            lines.append(line)
+    if lines:
+        sections.append((current_title, lines))
+    return [Chunk(source, section_title, "\n".join(section_lines)) for section_title, section_lines in sections]
+
+
+class BM25Index:
+    """Okapi BM25 over a list of chunks, with an inverted index of term frequencies."""
+
+    def __init__(self, chunks: list[Chunk]):
+        started = time.perf_counter()
+        self.chunks = chunks
+        self._postings: dict[str, list[tuple[int, int]]] = {}
+        self._lengths = []
+        for i, chunk in enumerate(chunks):
+            # The title counts as part of the text, so "Propane" matches its own chunk
+            tokens = tokenize(f"{chunk.title}\n{chunk.text}")
+            self._lengths.append(len(tokens))
+            counts: dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                self._postings.setdefault(token, []).append((i, count))
+        self._average_length = sum(self._lengths) / len(chunks) if chunks else 0.0
+        self._idf = {
+            token: math.log(1 + (len(chunks) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for token, postings in self._postings.items()
+        }
+        self.build_seconds = time.perf_counter() - started
+
+    def scores(self, query: str) -> dict[int, float]:
+        scores: dict[int, float] = {}
+        for token in set(expand_query(query)):
+            idf = self._idf.get(token)
+            if idf is None:
+                continue
+            for i, count in self._postings[token]:
+                norm = K1 * (1 - B + B * self._lengths[i] / self._average_length)
+                scores[i] = scores.get(i, 0.0) + idf * count * (K1 + 1) / (count + norm)
+        return scores
+
+    def search(self, query: str, k: int = 4) -> list[tuple[float, Chunk]]:
+        """The best k chunks for a query, leaving out weak matches."""
+        ranked = sorted(self.scores(query).items(), key=lambda item: -item[1])[:k]
+        if not ranked or ranked[0][1] < MIN_SCORE:
+            return []
+        cutoff = ranked[0][1] * RELATIVE_MIN_SCORE
+        return [(score, self.chunks[i]) for i, score in ranked if score >= cutoff]
+
+
+def format_excerpts(chunks: list[Chunk]) -> str:
+    return EXCERPTS_HEADER + "".join(f"\n\n### {chunk.title}\n{chunk.text}" for chunk in chunks)
+
+
+@dataclass
+class RetrievalStats:
+    turns: int = 0
+    round_trips: int = 0
+    # Turns whose first round trip carried excerpts
+    turns_with_excerpts: int = 0
+    chunks_sent: int = 0
+    tokens_sent: int = 0
+    index_chunks: int = 0
+    index_build_ms: float = 0.0
+
+    def record_turn(self, chunks: int, tokens: int) -> None:
+        self.turns += 1
+        if chunks:
+            self.turns_with_excerpts += 1
+            self.chunks_sent += chunks
+            self.tokens_sent += tokens
+
+    def as_dict(self) -> dict:
+        return {
+            "turns": self.turns,
+            "round_trips": self.round_trips,
+            "round_trips_per_turn": round(self.round_trips / self.turns, 2) if self.turns else 0.0,
+            "turns_with_excerpts": self.turns_with_excerpts,
+            "avg_chunks_sent": round(self.chunks_sent / self.turns_with_excerpts, 1) if self.turns_with_excerpts else 0.0,
+            "avg_tokens_sent": round(self.tokens_sent / self.turns_with_excerpts) if self.turns_with_excerpts else 0,
+            "index_chunks": self.index_chunks,
+            "index_build_ms": round(self.index_build_ms, 2),
+        }
@@ -0,0 +1,160 @@
+"""
+Persistent backends for chat sessions.
+
+The in-memory SessionStore is a cache in front of a backend, so conversations
+survive restarts and Render sleeping the service. Backends are synchronous
+and called from a worker thread (asyncio.to_thread), never on the event loop.
+Thread histories only ever grow, so each message is stored once as its own
+row (the JSON of ChatMessage.to_dict()) and a flush appends just the new ones.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def open_database(path: str) -> sqlite3.Connection:
+    """Open a SQLite file in WAL mode for use from worker threads, creating its directory."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Worker processes share the file; wait for another writer's lock instead of failing
+    connection = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA busy_timeout=10000")
+    connection.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL only risks the last batch on power loss, never corruption
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class SessionBackend:
+    """Interface for session persistence; SESSION_BACKEND=memory uses none."""
+
+    def load(self, session_id: str) -> tuple[list[dict], int, float] | None:
+        """Return (serialized messages, turns, last update as a Unix time) for a session, or None."""
+        raise NotImplementedError
+
+    def save_many(self, sessions: list[tuple[str, int, list[dict], int]]) -> None:
+        """Append messages for many sessions in one batch.
+
+        Each item is (session id, sequence number of the first new message,
+        new serialized messages, turns).
+        """
+        raise NotImplementedError
+
+    def message_count(self, session_id: str) -> int:
+        """Number of messages stored for a session (0 if unknown)."""
+        raise NotImplementedError
+
+    def delete_expired(self, idle_ttl_seconds: float) -> int:
+        """Delete sessions not updated within the idle timeout; returns the count."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Sessions in a single SQLite table, in WAL mode so reads never wait on writes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+        # One connection shared by the worker threads; sqlite3 objects are not thread safe
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = open_database(self.path)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " turns INTEGER NOT NULL DEFAULT 0,"
+                " updated_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " session_id TEXT NOT NULL,"
+                " seq INTEGER NOT NULL,"
+                " message TEXT NOT NULL,"
+                " PRIMARY KEY (session_id, seq)) WITHOUT ROWID"
+            )
+            self._connection = connection
+        return self._connection
+
+    def load(self, session_id: str) -> tuple[list[dict], int, float] | None:
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT turns, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            messages = connection.execute(
+                "SELECT message FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return [json.loads(message) for (message,) in messages], row[0], row[1]
+
+    def save_many(self, sessions: list[tuple[str, int, list[dict], int]]) -> None:
+        now = time.time()
+        session_rows = [(session_id, turns, now) for session_id, _, _, turns in sessions]
+        message_rows = [
+            (session_id, first_seq + i, json.dumps(message))
+            for session_id, first_seq, messages, _ in sessions
+            for i, message in enumerate(messages)
+        ]
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(
+                    "INSERT INTO sessions (session_id, turns, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET turns = excluded.turns, updated_at = excluded.updated_at",
+                    session_rows,
+                )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO messages (session_id, seq, message) VALUES (?, ?, ?)", message_rows
+                )
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def message_count(self, session_id: str) -> int:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT MAX(seq) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def delete_expired(self, idle_ttl_seconds: float) -> int:
+        cutoff = time.time() - idle_ttl_seconds
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(
+                "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE updated_at < ?)",
+                (cutoff,),
+            )
+            deleted = connection.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,)).rowcount
+            connection.execute("COMMIT")
+        return deleted
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+def create_session_backend() -> SessionBackend | None:
+    """Build the backend selected by SESSION_BACKEND (sqlite or memory)."""
+    kind = os.environ.get("SESSION_BACKEND", "sqlite").lower()
+    if kind == "memory":
+        return None
+    if kind != "sqlite":
+        raise ValueError(f"Unknown SESSION_BACKEND '{kind}' (expected 'sqlite' or 'memory')")
+    return SQLiteSessionBackend(os.environ.get("SESSION_DB_PATH", "data/sessions.db"))
@@ -0,0 +1,298 @@
+"""
+Bounded in-memory store for chat sessions.
+
+Sessions are kept in least-recently-used order. A session is evicted when it
+has been idle longer than the idle timeout, or when the estimated size of all
+conversation histories exceeds the memory budget (least recently used first).
+A background sweeper enforces the idle timeout between requests.
+
+With a persistent backend the store is a write-back cache: sessions missing
+from memory (after a restart or a memory eviction) are loaded lazily on first
+access, and threads changed by a turn are written in batches by a background
+flusher, off the request path.
+
+When several worker processes share the backend (shared=True), any worker may
+serve a session's next message. Each turn is then written through before the
+response completes, and a cached thread is reloaded when another worker has
+added messages to it since.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from coolman_agent import get_thread_messages
+
+# Rough per-message overhead of the ChatMessage / content objects themselves
+MESSAGE_OVERHEAD_BYTES = 256
+# Rough memory of a session before its first message: entry, thread and message store (~400 measured)
+SESSION_OVERHEAD_BYTES = 512
+
+
+@dataclass
+class SessionEntry:
+    thread: object
+    created_at: float
+    last_access: float
+    size_bytes: int = 0
+    turns: int = 0
+
+
+async def estimate_thread_bytes(thread) -> int:
+    """Estimate the memory held by a thread's message history."""
+    total = 0
+    for message in await get_thread_messages(thread):
+        total += MESSAGE_OVERHEAD_BYTES
+        for content in getattr(message, "contents", None) or []:
+            text = getattr(content, "text", None)
+            if text is None:
+                # Tool calls and tool results carry their payload elsewhere
+                text = getattr(content, "result", None) or getattr(content, "arguments", None) or ""
+            total += len(str(text).encode("utf-8"))
+    return total
+
+
+class SessionStore:
+    """LRU session store capped by idle time and estimated history size."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, idle_ttl_seconds: float = 3600, backend=None,
+                 shared: bool = False):
+        self.max_bytes = max_bytes
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.shared = shared and backend is not None
+        self._sessions: OrderedDict[str, SessionEntry] = OrderedDict()
+        self._total_bytes = 0
+        self.evictions = {"idle": 0, "memory": 0}
+        self.backend = backend
+        # Restores a thread from its serialized state; set to the agent's deserialize_thread
+        self.deserialize_thread = None
+        # (thread, turns) changed since the last flush, kept even if evicted from memory
+        self._dirty: dict[str, tuple[object, int]] = {}
+        # Messages per session already in the backend; flushes append only the rest
+        self._persisted: dict[str, int] = {}
+        # Turns in progress per session; these sessions are never evicted
+        self._pinned: dict[str, int] = {}
+        self.persistence = {"loaded": 0, "load_misses": 0, "stale_reloads": 0, "flushes": 0, "saved": 0,
+                            "flush_errors": 0, "expired_deleted": 0}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def create(self, thread) -> str:
+        """Store a new thread and return its session id."""
+        session_id = os.urandom(16).hex()
+        now = time.monotonic()
+        self._sessions[session_id] = SessionEntry(thread=thread, created_at=now, last_access=now,
+                                                  size_bytes=SESSION_OVERHEAD_BYTES)
+        # Sessions that never send a message still count against the budget
+        self._total_bytes += SESSION_OVERHEAD_BYTES
+        self._enforce_memory_limit(keep=session_id)
+        return session_id
+
+    def get(self, session_id: str | None):
+        """Return the thread for a session and mark it as recently used."""
+        if not session_id:
+            return None
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.last_access > self.idle_ttl_seconds:
+            self._evict(session_id, "idle")
+            return None
+        entry.last_access = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return entry.thread
+
+    async def load(self, session_id: str | None):
+        """Like get(), but falls back to the persistent backend for sessions not in memory."""
+        thread = self.get(session_id)
+        if not session_id or self.backend is None or self.deserialize_thread is None:
+            return thread
+        if thread is not None:
+            if not self.shared or session_id in self._dirty:
+                return thread
+            stored = await asyncio.to_thread(self.backend.message_count, session_id)
+            if stored <= self._persisted.get(session_id, 0):
+                return thread
+            # Another worker answered since this copy was cached
+            self._drop(session_id)
+            self.persistence["stale_reloads"] += 1
+
+        pending = self._dirty.get(session_id)
+        if pending is not None:
+            # Evicted from memory before its last turn was written; still current
+            thread, turns = pending
+        else:
+            row = await asyncio.to_thread(self.backend.load, session_id)
+            if row is None or time.time() - row[2] > self.idle_ttl_seconds:
+                self.persistence["load_misses"] += 1
+                return None
+            messages, turns, _ = row
+            thread = await self.deserialize_thread({"chat_message_store_state": {"messages": messages}})
+            if session_id in self._sessions:
+                # Another request loaded it while we were reading
+                return self.get(session_id)
+            self._persisted[session_id] = len(messages)
+            self.persistence["loaded"] += 1
+
+        now = time.monotonic()
+        entry = SessionEntry(thread=thread, created_at=now, last_access=now, turns=turns)
+        entry.size_bytes = SESSION_OVERHEAD_BYTES + await estimate_thread_bytes(thread)
+        self._sessions[session_id] = entry
+        self._total_bytes += entry.size_bytes
+        self._enforce_memory_limit(keep=session_id)
+        return thread
+
+    async def update_size(self, session_id: str) -> None:
+        """Re-estimate a session's history size after a turn and enforce the memory cap."""
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return
+        size = SESSION_OVERHEAD_BYTES + await estimate_thread_bytes(entry.thread)
+        self._total_bytes += size - entry.size_bytes
+        entry.size_bytes = size
+        entry.turns += 1
+        if self.backend is not None:
+            self._dirty[session_id] = (entry.thread, entry.turns)
+            if self.shared:
+                # The next message may go to another worker; make this turn visible first
+                await self.flush()
+        self._enforce_memory_limit(keep=session_id)
+
+    def pin(self, session_id: str) -> None:
+        """Keep a session in memory while a turn is running on its thread.
+
+        An evicted entry would miss the turn's update_size(), so the turn
+        would never be marked for writing to the backend.
+        """
+        self._pinned[session_id] = self._pinned.get(session_id, 0) + 1
+
+    def unpin(self, session_id: str) -> None:
+        count = self._pinned.pop(session_id, 0) - 1
+        if count > 0:
+            self._pinned[session_id] = count
+
+    def _enforce_memory_limit(self, keep: str | None = None) -> None:
+        # Least recently used first, skipping the active session and any with a turn in progress
+        for session_id in list(self._sessions):
+            if self._total_bytes <= self.max_bytes or len(self._sessions) <= 1:
+                break
+            if session_id != keep and session_id not in self._pinned:
+                self._evict(session_id, "memory")
+
+    def _evict(self, session_id: str, reason: str) -> None:
+        if self._drop(session_id):
+            self.evictions[reason] += 1
+
+    def _drop(self, session_id: str) -> bool:
+        entry = self._sessions.pop(session_id, None)
+        if entry is None:
+            return False
+        self._total_bytes -= entry.size_bytes
+        if session_id not in self._dirty:
+            self._persisted.pop(session_id, None)
+        return True
+
+    def sweep(self) -> int:
+        """Evict every session that has been idle past the timeout."""
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        expired = [sid for sid, entry in self._sessions.items()
+                   if entry.last_access < cutoff and sid not in self._pinned]
+        for session_id in expired:
+            self._evict(session_id, "idle")
+        return len(expired)
+
+    async def run_sweeper(self, interval_seconds: float = 60) -> None:
+        """Background task that periodically evicts idle sessions."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            self.sweep()
+            if self.backend is not None:
+                try:
+                    deleted = await asyncio.to_thread(self.backend.delete_expired, self.idle_ttl_seconds)
+                    self.persistence["expired_deleted"] += deleted
+                except Exception as e:
+                    print(f"⚠️ Failed to delete expired sessions: {e}")
+
+    async def flush(self) -> int:
+        """Write every session changed since the last flush to the backend in one batch."""
+        if self.backend is None or not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        batch = []
+        for session_id, (thread, turns) in dirty.items():
+            messages = await get_thread_messages(thread)
+            first_seq = self._persisted.get(session_id, 0)
+            batch.append((session_id, first_seq, messages[first_seq:], turns))
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+        except Exception as e:
+            # Retry on the next flush, unless a newer turn has already re-marked the session
+            for session_id, pending in dirty.items():
+                self._dirty.setdefault(session_id, pending)
+            self.persistence["flush_errors"] += 1
+            print(f"⚠️ Failed to persist {len(batch)} sessions: {e}")
+            return 0
+        for session_id, first_seq, messages, _ in batch:
+            if session_id in self._sessions or session_id in self._dirty:
+                self._persisted[session_id] = max(self._persisted.get(session_id, 0), first_seq + len(messages))
+            else:
+                self._persisted.pop(session_id, None)
+        self.persistence["flushes"] += 1
+        self.persistence["saved"] += len(batch)
+        return len(batch)
+
+    def _write_batch(self, batch: list) -> None:
+        # Runs in a worker thread; messages already appended to a thread are never mutated
+        self.backend.save_many([
+            (session_id, first_seq, [message.to_dict() for message in messages], turns)
+            for session_id, first_seq, messages, turns in batch
+        ])
+
+    async def run_flusher(self, interval_seconds: float = 2) -> None:
+        """Background task that periodically writes changed sessions to the backend."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await self.flush()
+
+    async def close(self) -> None:
+        """Write pending changes, then release the backend."""
+        await self.flush()
+        self.clear()
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.close)
+
+    def clear(self) -> None:
+        self._sessions.clear()
+        self._persisted.clear()
+        self._total_bytes = 0
+
+    def session_stats(self, session_id: str) -> dict | None:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        return {
+            "size_bytes": entry.size_bytes,
+            "turns": entry.turns,
+            "age_seconds": round(now - entry.created_at, 1),
+            "idle_seconds": round(now - entry.last_access, 1),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "total_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "largest_session_bytes": max((e.size_bytes for e in self._sessions.values()), default=0),
+            "evictions": dict(self.evictions),
+            "backend": type(self.backend).__name__ if self.backend is not None else "memory",
+            "shared": self.shared,
+            "pending_writes": len(self._dirty),
+            **self.persistence,
+        }
@@ -0,0 +1,57 @@
+"""
+Startup phase timing for the web server.
+
+Records how long each cold-start phase takes - interpreter and server boot
+before our code runs, our imports, the deferred agent_framework import,
+agent creation and connection pre-warming - so a slow start can be traced to
+a phase and regressions caught (see benchmarks/cold_start.py).
+"""
+
+import os
+import time
+
+
+def process_age_seconds() -> float | None:
+    """Seconds since this process started, from /proc (Linux only)."""
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name may contain spaces; fields resume after its closing parenthesis
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    started_after_boot = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    return max(0.0, uptime - started_after_boot)
+
+
+class StartupReport:
+    """Durations of consecutive startup phases, in the order they complete."""
+
+    def __init__(self):
+        self._last = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        # Time spent before this object existed: interpreter start, uvicorn and its imports
+        boot = process_age_seconds()
+        if boot is not None:
+            self.phases["process_boot"] = boot
+
+    def mark(self, phase: str) -> float:
+        """Record the time since the previous mark as the duration of a phase."""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+        return self.phases[phase]
+
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+    def as_dict(self) -> dict:
+        return {
+            "phases_ms": {phase: round(seconds * 1000, 1) for phase, seconds in self.phases.items()},
+            "total_ms": round(self.total() * 1000, 1),
+        }
+
+    def summary(self) -> str:
+        parts = ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.phases.items())
+        return f"⏱️ Startup {self.total() * 1000:.0f}ms ({parts})"
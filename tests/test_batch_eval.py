@@ -0,0 +1,76 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import batch_eval
+import coolman_agent
+
+
+class FakeAgent:
+    """Answers every message with the same text, counting the turns it ran."""
+
+    def __init__(self, answer="We deliver to Exeter."):
+        self.answer = answer
+        self.turns = 0
+
+    def get_new_thread(self):
+        return object()
+
+    async def run_stream(self, message, thread=None):
+        self.turns += 1
+        yield SimpleNamespace(text=self.answer)
+
+
+def write_jsonl(path, rows):
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+
+
+def result(item_id, passed, error=None, version="v1"):
+    return {"id": item_id, "knowledge_base_version": version, "turns": [], "passed": passed,
+            "failures": [] if passed else ["did not call x"], "error": error}
+
+
+@pytest.fixture
+def batch(tmp_path, monkeypatch):
+    """Point the batch at a fake agent and knowledge base version; returns (queries, output, agent)."""
+    agent = FakeAgent()
+
+    async def create_agent():
+        return agent
+
+    monkeypatch.setattr(coolman_agent, "create_coolman_agent", create_agent)
+    monkeypatch.setattr(coolman_agent, "refresh_knowledge_base", lambda: "v1")
+    queries = tmp_path / "queries.jsonl"
+    write_jsonl(queries, [{"id": "1", "message": "Do you deliver to Exeter?", "expect_text": ["Exeter"]}])
+    return queries, tmp_path / "results.jsonl", agent
+
+
+def run(queries, output):
+    return asyncio.run(batch_eval.main([str(queries), "--output", str(output), "--rate", "0"]))
+
+
+def test_completed_results_skips_errors_old_versions_and_cut_lines(tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_text(json.dumps(result("1", True)) + "\n" + json.dumps(result("2", False, error="Boom")) + "\n"
+                      + json.dumps(result("3", True, version="v0")) + "\n" + '{"id": "4", "tur')
+    assert set(batch_eval.completed_results(str(output), "v1")) == {"1"}
+
+
+@pytest.mark.parametrize("earlier_passed, status", [(True, 0), (False, 1)])
+def test_resumed_run_exits_with_the_earlier_results(batch, earlier_passed, status):
+    queries, output, agent = batch
+    write_jsonl(output, [result("1", earlier_passed)])
+    assert run(queries, output) == status
+    assert agent.turns == 0
+
+
+def test_rerun_after_a_knowledge_base_edit_answers_again(batch, monkeypatch):
+    queries, output, agent = batch
+    write_jsonl(output, [result("1", False)])
+    monkeypatch.setattr(coolman_agent, "refresh_knowledge_base", lambda: "v2")
+    assert run(queries, output) == 0
+    assert agent.turns == 1
+    latest = json.loads(output.read_text().splitlines()[-1])
+    assert (latest["knowledge_base_version"], latest["passed"]) == ("v2", True)
@@ -0,0 +1,54 @@
+import pytest
+
+from coolman_agent import COMPANY_INFO
+from intent_router import IntentRouter
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(threshold=0.8)
+
+
+@pytest.mark.parametrize("message", [
+    "How do I change the phone number on my account?",
+    "I need to update my email address",
+    "My phone number changed",
+    "Can you update our email address on file?",
+])
+def test_questions_about_the_customers_own_details_go_to_the_model(router, message):
+    assert router.route(message) is None
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("What's your phone number?", "phone"),
+    ("What is the phone number?", "phone"),
+    ("Can I get your email address", "email"),
+    ("email address?", "email"),
+    ("What are your business hours", "hours"),
+    ("Where is your office located?", "address"),
+])
+def test_simple_lookups_are_routed(router, message, intent):
+    routed = router.route(message)
+    assert routed is not None and routed.intent == intent
+
+
+def test_unanchored_mentions_are_not_routed(router):
+    intent, confidence, _ = router.classify("phone number please")
+    assert confidence < router.threshold
+
+
+def test_phone_template_reads_naturally(router):
+    answer = router.route("What's your phone number?").answer
+    assert COMPANY_INFO["phone"] in answer
+    assert "available 24/7 availability" not in answer
+    assert answer.endswith("we offer 24/7 availability.")
+
+
+def test_town_elsewhere_goes_to_the_model(router):
+    assert router.route("Do you deliver to Exeter, New Hampshire?") is None
+
+
+def test_known_town_is_routed(router):
+    routed = router.route("Do you deliver to Exeter, ON?")
+    assert routed is not None
+    assert "PRIMARY" in routed.answer
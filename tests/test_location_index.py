@@ -0,0 +1,72 @@
+import pytest
+
+from coolman_agent import SERVICE_TERRITORY, check_service_area, get_location_index
+from location_index import LocationIndex
+
+
+@pytest.fixture(scope="module")
+def index():
+    return get_location_index()
+
+
+@pytest.mark.parametrize("town", ["Milton", "Bolton", "Alton", "Drayton", "Milverton"])
+def test_out_of_area_towns_are_not_fuzzy_matched(index, town):
+    # Each is two edits or a different first letter away from one of our communities
+    match = index.classify(town)
+    assert match.method != "fuzzy"
+    assert match.status == "outside"
+
+
+def test_milton_is_not_assumed_to_be_walton():
+    answer = check_service_area("Milton")
+    assert "Walton" not in answer
+    assert "outside our service area" in answer
+
+
+def test_three_letter_alias_is_only_matched_exactly(index):
+    assert index.classify("Bay").status == "outside"
+    assert index.classify("Hay").place == "Zurich"
+
+
+@pytest.mark.parametrize("typo, place", [
+    ("Exter", "Exeter"),
+    ("Clintin", "Clinton"),
+    ("Seaforht", "Seaforth"),
+    ("Ailsa Crag", "Ailsa Craig"),
+])
+def test_typos_of_listed_communities_still_match(index, typo, place):
+    match = index.classify(typo)
+    assert (match.method, match.place) == ("fuzzy", place)
+
+
+def test_short_names_allow_one_edit(index):
+    # Seven letters: "Clntn" is two edits from Clinton
+    assert index.classify("Clntn").method == "none"
+
+
+def test_typo_near_several_places_asks_which_one(index):
+    match = index.classify("Huron Pask")
+    assert match.method == "ambiguous"
+    assert set(match.suggestions) == {"Huron Park", "Seaforth"}
+    assert "Did you mean" in check_service_area("Huron Pask")
+
+
+def test_first_letter_must_match():
+    territory = {**SERVICE_TERRITORY, "primary_communities": ["Walton"], "boundary_communities": [], "aliases": {}}
+    assert LocationIndex(territory).classify("Halton").method == "none"
+    assert LocationIndex(territory).classify("Waltn").place == "Walton"
+
+
+@pytest.mark.parametrize("location", ["Exeter, New Hampshire", "Exeter, Devon, UK", "London, England"])
+def test_towns_elsewhere_are_not_ours(index, location):
+    assert index.classify(location).status == "outside"
+
+
+@pytest.mark.parametrize("location, place", [
+    ("Exeter, ON", "Exeter"),
+    ("Exeter, Ontario, Canada", "Exeter"),
+    ("12 Main St, Exeter, ON N0M 1S0", "Exeter"),
+])
+def test_addresses_in_ontario_match_their_town(index, location, place):
+    match = index.classify(location)
+    assert (match.status, match.place) == ("primary", place)
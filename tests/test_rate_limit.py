@@ -0,0 +1,77 @@
+import pytest
+
+from rate_limit import RateLimiter, acquire_all
+
+
+def test_burst_then_retry_after():
+    limiter = RateLimiter(rate=1, burst=3)
+    assert [limiter.acquire("client") for _ in range(3)] == [0, 0, 0]
+    retry_after = limiter.acquire("client")
+    assert 0 < retry_after <= 1
+    assert limiter.stats()["allowed"] == 3
+    assert limiter.stats()["limited"] == 1
+
+
+def test_clients_have_separate_buckets():
+    limiter = RateLimiter(rate=1, burst=1)
+    assert limiter.acquire("script") == 0
+    assert limiter.acquire("script") > 0
+    assert limiter.acquire("customer") == 0
+
+
+def test_zero_rate_disables_the_limit():
+    limiter = RateLimiter(rate=0, burst=0)
+    assert all(limiter.acquire("client") == 0 for _ in range(100))
+    assert limiter.retry_after("client") == 0
+
+
+def test_retry_after_leaves_the_bucket_alone():
+    limiter = RateLimiter(rate=1, burst=1)
+    assert limiter.retry_after("client") == 0
+    assert len(limiter) == 0
+    assert limiter.acquire("client") == 0
+    assert limiter.retry_after("client") > 0
+    assert limiter.stats()["limited"] == 0
+
+
+def test_idle_buckets_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("rate_limit.time.monotonic", lambda: now[0])
+    limiter = RateLimiter(rate=10, burst=10)
+    for i in range(5):
+        limiter.acquire(f"client-{i}")
+    now[0] += limiter.idle_ttl + 1
+    limiter.acquire("one-more")
+    assert len(limiter) == 1
+    assert limiter.expired == 5
+
+
+def test_least_recently_used_bucket_is_dropped_at_max_keys():
+    limiter = RateLimiter(rate=1, burst=1, max_keys=2)
+    limiter.acquire("a")
+    limiter.acquire("b")
+    limiter.acquire("a")
+    limiter.acquire("c")
+    assert limiter.retry_after("a") > 0
+    assert limiter.retry_after("b") == 0
+
+
+def test_acquire_all_takes_from_every_bucket():
+    sessions, ips = RateLimiter(rate=1, burst=2), RateLimiter(rate=1, burst=2)
+    assert acquire_all([(sessions, "session"), (ips, "ip")]) == [0, 0]
+    assert sessions.stats()["allowed"] == ips.stats()["allowed"] == 1
+
+
+@pytest.mark.parametrize("exhausted", ["session", "ip"])
+def test_a_message_rejected_by_one_limit_uses_none_of_the_other(exhausted):
+    sessions, ips = RateLimiter(rate=1, burst=1), RateLimiter(rate=1, burst=1)
+    empty = sessions if exhausted == "session" else ips
+    other = ips if exhausted == "session" else sessions
+    empty.acquire(exhausted)
+
+    waits = acquire_all([(sessions, "session"), (ips, "ip")])
+    assert max(waits) > 0
+    assert empty.stats()["limited"] == 1
+    # The other bucket still has its token
+    assert other.retry_after("ip" if exhausted == "session" else "session") == 0
+    assert other.stats()["limited"] == 0
@@ -0,0 +1,61 @@
+import asyncio
+
+from agent_framework import AgentThread, ChatMessage, Role
+
+from session_backends import SQLiteSessionBackend
+from session_store import SESSION_OVERHEAD_BYTES, SessionStore
+
+
+async def add_exchange(thread: AgentThread, text: str) -> None:
+    await thread.on_new_messages([
+        ChatMessage(role=Role.USER, text=text),
+        ChatMessage(role=Role.ASSISTANT, text=text * 20),
+    ])
+
+
+def test_session_evicted_for_memory_mid_turn_is_still_persisted(tmp_path):
+    async def scenario():
+        backend = SQLiteSessionBackend(str(tmp_path / "sessions.db"))
+        store = SessionStore(max_bytes=4000, backend=backend)
+        store.deserialize_thread = AgentThread.deserialize
+
+        answering = store.create(AgentThread())
+        store.pin(answering)
+        # Other customers' turns push the store over its budget while the answer is generated
+        for i in range(5):
+            other = store.create(AgentThread())
+            await add_exchange(store.get(other), f"other customer {i} ")
+            await store.update_size(other)
+        assert answering in store
+
+        await add_exchange(store.get(answering), "answered while others were busy ")
+        await store.update_size(answering)
+        store.unpin(answering)
+        await store.flush()
+        return backend.message_count(answering)
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_unpinned_sessions_are_evicted_least_recently_used_first():
+    async def scenario():
+        store = SessionStore(max_bytes=4000)
+        first = store.create(AgentThread())
+        for i in range(5):
+            other = store.create(AgentThread())
+            await add_exchange(store.get(other), f"other customer {i} ")
+            await store.update_size(other)
+        return first in store, store.evictions["memory"]
+
+    kept, evicted = asyncio.run(scenario())
+    assert not kept
+    assert evicted > 0
+
+
+def test_sessions_without_messages_count_against_the_budget():
+    store = SessionStore(max_bytes=100 * SESSION_OVERHEAD_BYTES)
+    for _ in range(1000):
+        store.create(AgentThread())
+    assert len(store) == 100
+    assert store.stats()["total_bytes"] == 100 * SESSION_OVERHEAD_BYTES
+    assert store.evictions["memory"] == 900
@@ -0,0 +1,96 @@
+"""
+Tool execution: worker threads for blocking tools, and per-tool timeouts.
+
+agent_framework already runs the tool calls of one model response
+concurrently (asyncio.gather), but a synchronous tool runs on the event loop:
+while it waits, every other chat on the server waits too, and the calls of one
+response run one after another. Today's tools are dictionary lookups that
+finish in microseconds, so they stay inline. A tool that does real I/O (a
+price or tank-level lookup) is declared with @io_tool: an async function is
+awaited on the loop as is, and a synchronous one runs in a dedicated thread
+pool (TOOL_THREADS), so several calls overlap and a turn's tool time is that
+of its slowest tool rather than the sum.
+
+Every tool call is bounded by a timeout (ToolTimeoutMiddleware in
+middleware.py): the one given to @io_tool, or TOOL_TIMEOUT_SECONDS. A call
+that runs out of time returns a short note the model can pass on, instead of
+holding the turn. A timed-out thread can't be interrupted and finishes in
+the background; only its result is dropped.
+"""
+
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+DEFAULT_TIMEOUT_SECONDS = 10.0
+
+TIMEOUT_RESULT = (
+    "The {tool} lookup took too long and was stopped. Tell the customer the information isn't available "
+    "right now and offer our phone number, +1 519-235-0853."
+)
+
+# Timeouts declared with @io_tool, by tool name
+_timeouts: dict[str, float] = {}
+_executor: ThreadPoolExecutor | None = None
+
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    """The thread pool for blocking tools, kept apart from the default one used by session and usage flushes."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get("TOOL_THREADS", "8")), thread_name_prefix="tool"
+        )
+    return _executor
+
+
+def tool_timeout(name: str) -> float:
+    return _timeouts.get(name) or float(os.environ.get("TOOL_TIMEOUT_SECONDS", DEFAULT_TIMEOUT_SECONDS))
+
+
+def io_tool(timeout: float | None = None):
+    """Declare a tool that waits on I/O: sync functions run in the tool thread pool, async ones on the loop."""
+    def decorator(func):
+        if timeout is not None:
+            _timeouts[func.__name__] = timeout
+        if inspect.iscoroutinefunction(func):
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            # Copy the context so the tool sees the same context variables (e.g. the turn's usage)
+            call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(get_tool_executor(), call)
+        return wrapper
+    return decorator
+
+
+@dataclass
+class ToolExecutionStats:
+    calls: int = 0
+    timeouts: int = 0
+    in_flight: int = 0
+    # Most tool calls running at once; above 1 means calls overlapped
+    max_in_flight: int = 0
+
+    def started(self) -> None:
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def finished(self, timed_out: bool = False) -> None:
+        self.in_flight -= 1
+        if timed_out:
+            self.timeouts += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+        }
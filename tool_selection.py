@@ -0,0 +1,175 @@
+"""
+Per-turn tool subsetting for the Coolman Fuels agent.
+
+Every model round trip sends the JSON schemas of all twelve tools and the full
+system instructions, even for "what's your email". The selector picks the
+tools a turn is likely to need from keyword patterns on the customer's message
+(plus any community name it mentions), the previous question, and the tools
+called in the previous turn, so a follow-up like "what about Goderich?" keeps
+the service area tools. When nothing matches, or so many tools match that the
+saving is small, it returns None and the full set is sent: a missing tool
+costs a worse answer, an extra one only a few tokens.
+
+The instructions can be trimmed as well: sections that only matter for tools
+not offered this turn are left out. The thread itself is never modified - only
+what is sent upstream (see ToolSubsetMiddleware in middleware.py).
+"""
+
+import re
+from dataclasses import dataclass
+
+from response_cache import normalize_message
+
+# Offered on every subset turn: a small schema that covers general questions
+ALWAYS_SELECTED = ("get_company_info",)
+
+# Patterns on the normalized message that make a tool relevant
+TOOL_PATTERNS = {
+    "get_company_info": [
+        r"\babout (?:you|coolman|the company|your company)\b",
+        r"\b(?:who (?:are|is) (?:you|coolman)|history|family owned|founded|since when|dave moore|how long)\b",
+    ],
+    "get_products_list": [
+        r"\b(?:products?|sell|carry|stock|gas|gasoline|diesel|dyed|lubricants?|oil|def|exhaust fluid)\b",
+        r"\b(?:antifreeze|washer fluid|fluids?|propane|fuels?)\b",
+    ],
+    "get_services_list": [
+        r"\b(?:services?|deliver|delivery|deliveries|automatic|degree day|on demand|emergency|run out)\b",
+        r"\b(?:rent|rental|rentals|equipment|pumps?|pay|payment|payments|budget|equal billing|schedule|order)\b",
+    ],
+    "get_contact_info": [
+        r"\b(?:contact|phone|call|number|e ?mail|address|hours|open|reach|talk to|speak to|office|located)\b",
+    ],
+    "check_service_area": [
+        r"\b(?:deliver|service|serve|come|go|drive)s? (?:out )?(?:to|in|into|near|around|out to)\b",
+        r"\b(?:in|within|part of|outside|cover) (?:your|the) (?:service |delivery )?(?:area|territory|zone|range)\b",
+        r"\b(?:i live|im|i am|we are|were|located|farm is|house is) (?:in|near|outside|north of|south of|east of|west of)\b",
+        r"\bwhat about\b",
+    ],
+    "get_service_area_details": [
+        r"\b(?:service area|delivery area|territory|coverage|counties|county|areas|regions?|communities|towns)\b",
+        r"\bwhere (?:do|can) you (?:deliver|service|serve|go)\b",
+    ],
+    "get_fleet_card_info": [
+        r"\b(?:fleet|cardlock|card lock|petro pass|petropass|cards?|comdata|efs|bvd|ipn)\b",
+    ],
+    "get_residential_heating_info": [
+        r"\b(?:heat|heating|furnace|home|house|residential|tank|tanks|water heater|fireplace|winter|propane)\b",
+    ],
+    "get_new_customer_requirements": [
+        r"\b(?:new customer|sign up|signup|get started|start service|switch|become a customer|set up|setup)\b",
+        r"\b(?:inspection|inspector|inspect|first delivery|open an account|requirements?)\b",
+    ],
+    "get_commercial_solutions": [
+        r"\b(?:commercial|business|businesses|farm|farms|farmer|agricultur\w*|construction|trucking|transport)\b",
+        r"\b(?:fleet|bulk|industr\w*|mining|forestry|manufacturing|aviation|marine)\b",
+    ],
+    "get_credit_application_link": [
+        r"\b(?:credit|apply|application|account|financing)\b",
+    ],
+    "navigate_website": [
+        r"\b(?:website|web site|page|link|url|privacy|terms|online|site)\b",
+    ],
+}
+
+# Tools that need the service area check when a message names a community
+PLACE_TOOLS = ("check_service_area",)
+
+# Instruction sections ("## Heading:") only worth sending when one of these tools is offered
+SECTION_TOOLS = {
+    "Service Territory Knowledge": {"check_service_area", "get_service_area_details"},
+    # Enumerates every tool; misleading when only a few are offered
+    "Your Capabilities": set(),
+}
+
+_COMPILED = {
+    name: [re.compile(pattern) for pattern in patterns]
+    for name, patterns in TOOL_PATTERNS.items()
+}
+_SECTION = re.compile(r"^## (?P<heading>[^\n:]+):?", re.MULTILINE)
+
+
+def split_sections(instructions: str) -> list[tuple[str | None, str]]:
+    """Split instructions into (heading, text) sections; the intro has no heading."""
+    sections = []
+    starts = [m.start() for m in _SECTION.finditer(instructions)]
+    intro_end = starts[0] if starts else len(instructions)
+    sections.append((None, instructions[:intro_end]))
+    for start, end in zip(starts, starts[1:] + [len(instructions)]):
+        text = instructions[start:end]
+        sections.append((_SECTION.match(text).group("heading").strip(), text))
+    return sections
+
+
+def trim_instructions(instructions: str, selected) -> str:
+    """Drop the instruction sections that only matter for tools not selected."""
+    selected = set(selected)
+    return "".join(
+        text for heading, text in split_sections(instructions)
+        if heading not in SECTION_TOOLS or SECTION_TOOLS[heading] & selected
+    )
+
+
+class ToolSelector:
+    """Picks the tools relevant to a turn, or None when the full set should be sent."""
+
+    def __init__(self, tool_names, max_tools: int = 6, find_place=None):
+        # Registration order, so subsets keep the order the full set is sent in
+        self.tool_names = list(tool_names)
+        self.max_tools = max_tools
+        # Returns a known community named in a message, or None
+        self.find_place = find_place
+
+    def match(self, message: str) -> set[str]:
+        """Tools whose patterns match a message."""
+        normalized = normalize_message(message)
+        matched = {
+            name for name, patterns in _COMPILED.items()
+            if any(pattern.search(normalized) for pattern in patterns)
+        }
+        if self.find_place is not None and self.find_place(message):
+            matched.update(PLACE_TOOLS)
+        return matched
+
+    def select(self, message: str, previous_message: str | None = None, recent_tools=()) -> list[str] | None:
+        """Return the tool names to offer for a turn, or None for the full set."""
+        matched = self.match(message)
+        if not matched:
+            # Nothing recognizable ("how much is it?"): don't guess
+            return None
+        if previous_message:
+            matched |= self.match(previous_message)
+        matched |= set(recent_tools)
+        matched.update(ALWAYS_SELECTED)
+        selected = [name for name in self.tool_names if name in matched]
+        if len(selected) > self.max_tools or len(selected) == len(self.tool_names):
+            return None
+        return selected
+
+
+@dataclass
+class ToolSelectionStats:
+    """Tool subsetting outcomes across model round trips."""
+    round_trips: int = 0
+    subset_round_trips: int = 0
+    tools_sent: int = 0
+    schema_tokens_saved: int = 0
+    instruction_tokens_saved: int = 0
+
+    def record(self, offered: int, sent: int, schema_tokens_saved: int = 0, instruction_tokens_saved: int = 0) -> None:
+        self.round_trips += 1
+        if sent < offered:
+            self.subset_round_trips += 1
+        self.tools_sent += sent
+        self.schema_tokens_saved += schema_tokens_saved
+        self.instruction_tokens_saved += instruction_tokens_saved
+
+    def as_dict(self) -> dict:
+        return {
+            "round_trips": self.round_trips,
+            "subset_round_trips": self.subset_round_trips,
+            "full_set_round_trips": self.round_trips - self.subset_round_trips,
+            "avg_tools_sent": round(self.tools_sent / self.round_trips, 1) if self.round_trips else 0,
+            "schema_tokens_saved": self.schema_tokens_saved,
+            "instruction_tokens_saved": self.instruction_tokens_saved,
+        }
@@ -0,0 +1,195 @@
+"""
+Shared HTTP connection pool for the upstream model endpoint.
+
+All model clients share one keep-alive pool with explicit limits, optional
+HTTP/2 and connect/read/total timeouts. The transport is instrumented with
+httpcore trace events, so per-request connection reuse and TLS handshake time
+can be reported. Connections are pre-warmed at startup to keep handshakes off
+the first customer request.
+"""
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+import httpx
+
+GITHUB_MODELS_URL = "https://models.github.ai/inference"
+
+
+def model_base_url() -> str:
+    """Upstream OpenAI-compatible endpoint; MODEL_BASE_URL points it at e.g. a local fake server."""
+    return os.environ.get("MODEL_BASE_URL", GITHUB_MODELS_URL)
+
+
+@dataclass
+class ConnectionStats:
+    requests: int = 0
+    new_connections: int = 0
+    reused_connections: int = 0
+    tls_handshakes: int = 0
+    handshake_seconds: float = 0.0
+    http2_requests: int = 0
+    total_timeouts: int = 0
+    prewarmed: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "reuse_ratio": round(self.reused_connections / self.requests, 4) if self.requests else 0.0,
+            "tls_handshakes": self.tls_handshakes,
+            "avg_handshake_ms": round(self.handshake_seconds / self.tls_handshakes * 1000, 1) if self.tls_handshakes else 0.0,
+            "http2_requests": self.http2_requests,
+            "total_timeouts": self.total_timeouts,
+            "prewarmed": self.prewarmed,
+        }
+
+
+class _DeadlineStream(httpx.AsyncByteStream):
+    """Response body that fails with ReadTimeout once the request's total deadline passes."""
+
+    def __init__(self, stream, deadline: float, stats: ConnectionStats):
+        self._stream = stream
+        self._deadline = deadline
+        self._stats = stats
+
+    async def __aiter__(self):
+        iterator = self._stream.__aiter__()
+        while True:
+            remaining = self._deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                chunk = await asyncio.wait_for(iterator.__anext__(), remaining)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                self._stats.total_timeouts += 1
+                raise httpx.ReadTimeout("Upstream request exceeded its total timeout")
+            yield chunk
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Transport wrapper recording connection reuse and enforcing a total timeout."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, stats: ConnectionStats, total_timeout: float):
+        self._transport = transport
+        self._stats = stats
+        self._total_timeout = total_timeout
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        stats = self._stats
+        deadline = time.monotonic() + self._total_timeout
+        state = {"new": False, "tls_started": None, "http2": False}
+
+        async def trace(event_name: str, info: dict):
+            if event_name == "connection.connect_tcp.started":
+                state["new"] = True
+            elif event_name == "connection.start_tls.started":
+                state["tls_started"] = time.monotonic()
+            elif event_name == "connection.start_tls.complete" and state["tls_started"] is not None:
+                stats.tls_handshakes += 1
+                stats.handshake_seconds += time.monotonic() - state["tls_started"]
+            elif event_name.startswith("http2.send_request_headers"):
+                state["http2"] = True
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            response = await asyncio.wait_for(self._transport.handle_async_request(request), self._total_timeout)
+        except asyncio.TimeoutError:
+            stats.total_timeouts += 1
+            raise httpx.ReadTimeout("Upstream request exceeded its total timeout", request=request)
+
+        stats.requests += 1
+        if state["new"]:
+            stats.new_connections += 1
+        else:
+            stats.reused_connections += 1
+        if state["http2"]:
+            stats.http2_requests += 1
+        response.stream = _DeadlineStream(response.stream, deadline, stats)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+connection_stats = ConnectionStats()
+_http_client: httpx.AsyncClient | None = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_upstream_http_client() -> httpx.AsyncClient:
+    """Return the process-wide upstream HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        return _http_client
+
+    http2 = os.environ.get("UPSTREAM_HTTP2", "true").lower() == "true"
+    if http2 and not _http2_available():
+        print("⚠️ UPSTREAM_HTTP2 requested but the 'h2' package is not installed - using HTTP/1.1")
+        http2 = False
+
+    max_connections = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", "20"))
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=int(os.environ.get("UPSTREAM_MAX_KEEPALIVE", str(max_connections))),
+        keepalive_expiry=float(os.environ.get("UPSTREAM_KEEPALIVE_SECONDS", "120")),
+    )
+    timeout = httpx.Timeout(
+        connect=float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "5")),
+        read=float(os.environ.get("UPSTREAM_READ_TIMEOUT", "30")),
+        write=10.0,
+        pool=float(os.environ.get("UPSTREAM_POOL_TIMEOUT", "10")),
+    )
+    transport = InstrumentedTransport(
+        httpx.AsyncHTTPTransport(http2=http2, limits=limits),
+        connection_stats,
+        total_timeout=float(os.environ.get("UPSTREAM_TOTAL_TIMEOUT", "60")),
+    )
+    _http_client = httpx.AsyncClient(transport=transport, timeout=timeout)
+    return _http_client
+
+
+async def prewarm_connections(base_url: str | None = None, count: int | None = None) -> int:
+    """Open keep-alive connections to the upstream host ahead of the first request."""
+    base_url = base_url or model_base_url()
+    if count is None:
+        count = int(os.environ.get("UPSTREAM_PREWARM_CONNECTIONS", "2"))
+    if count <= 0:
+        return 0
+
+    parts = urlsplit(base_url)
+    origin = f"{parts.scheme}://{parts.netloc}/"
+    client = get_upstream_http_client()
+
+    async def warm():
+        # Any response leaves a pooled connection behind; the status is irrelevant
+        response = await client.head(origin)
+        await response.aclose()
+
+    results = await asyncio.gather(*(warm() for _ in range(count)), return_exceptions=True)
+    warmed = sum(1 for r in results if not isinstance(r, Exception))
+    connection_stats.prewarmed += warmed
+    return warmed
+
+
+async def close_upstream_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
@@ -0,0 +1,312 @@
+"""
+Token accounting per session, tool, endpoint and day.
+
+The free tier has hard quotas, so we need to know where tokens go. The model
+reports prompt, completion and cached prompt tokens at the end of every round
+trip; UpstreamMetricsMiddleware adds them to the TurnUsage of the turn in
+progress, along with the tools whose results made that round trip necessary
+(a turn with no tool calls takes one round trip, each batch of tool calls adds
+one more). The web API and the CLI start a TurnUsage per turn through a
+context variable, so the middleware needs no reference to the request.
+
+Finished turns are added to in-memory counters keyed by (day, dimension, key)
+for the whole service, each session, each tool and each endpoint. A periodic
+flush adds them to the backend in one batch - SQLite alongside the sessions,
+so totals survive restarts and add up across worker processes.
+"""
+
+import asyncio
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+
+from session_backends import open_database
+
+FIELDS = ("turns", "round_trips", "prompt_tokens", "completion_tokens", "cached_tokens", "tool_calls")
+# Sessions listed in a usage report; their ids are shortened, since a full id resumes the conversation
+TOP_SESSIONS = 10
+SESSION_ID_PREFIX = 8
+
+
+def today() -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime())
+
+
+def _add(totals: dict, **counts) -> None:
+    for name, value in counts.items():
+        if value:
+            totals[name] = totals.get(name, 0) + value
+
+
+@dataclass
+class TurnUsage:
+    """Round trips and tokens of one chat turn."""
+    round_trips: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    tool_calls: dict[str, int] = field(default_factory=dict)
+    # Per tool: the round trips its results triggered, and their tokens
+    tools: dict[str, dict] = field(default_factory=dict)
+
+    def add_round_trip(self, details=None, triggered_by=()) -> None:
+        prompt = getattr(details, "input_token_count", None) or 0
+        completion = getattr(details, "output_token_count", None) or 0
+        cached = (getattr(details, "additional_counts", None) or {}).get("prompt/cached_tokens", 0) or 0
+        self.round_trips += 1
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+        self.cached_tokens += cached
+        for name in set(triggered_by):
+            _add(self.tools.setdefault(name, {}), round_trips=1, prompt_tokens=prompt,
+                 completion_tokens=completion, cached_tokens=cached)
+
+    def add_tool_call(self, name: str) -> None:
+        self.tool_calls[name] = self.tool_calls.get(name, 0) + 1
+
+    def totals(self) -> dict:
+        return {
+            "turns": 1,
+            "round_trips": self.round_trips,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "tool_calls": sum(self.tool_calls.values()),
+        }
+
+    def summary(self) -> str:
+        return (f"🔢 {self.round_trips} round trip{'s' if self.round_trips != 1 else ''}, "
+                f"{self.prompt_tokens} prompt ({self.cached_tokens} cached) / {self.completion_tokens} completion tokens")
+
+
+_current_turn: contextvars.ContextVar[TurnUsage | None] = contextvars.ContextVar("current_turn", default=None)
+
+
+def start_turn() -> TurnUsage:
+    """Start accounting a turn in the current context (each request runs in its own)."""
+    turn = TurnUsage()
+    _current_turn.set(turn)
+    return turn
+
+
+def record_round_trip(details=None, triggered_by=()) -> None:
+    """Add a model round trip to the turn in progress, if one is being accounted."""
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.add_round_trip(details, triggered_by)
+
+
+def record_tool_call(name: str) -> None:
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.add_tool_call(name)
+
+
+class MemoryUsageBackend:
+    """Usage totals kept in this process only (SESSION_BACKEND=memory)."""
+
+    def __init__(self):
+        self._rows: dict[tuple[str, str, str], dict] = {}
+
+    def add_many(self, rows: list[tuple[str, str, str, dict]]) -> None:
+        for day, kind, key, counts in rows:
+            _add(self._rows.setdefault((day, kind, key), dict.fromkeys(FIELDS, 0)), **counts)
+
+    def query(self, kind: str, since_day: str, key: str | None = None) -> list[tuple[str, str, dict]]:
+        return [
+            (day, row_key, dict(counts))
+            for (day, row_kind, row_key), counts in self._rows.items()
+            if row_kind == kind and day >= since_day and (key is None or row_key == key)
+        ]
+
+    def delete_before(self, day: str) -> int:
+        old = [row for row in self._rows if row[0] < day]
+        for row in old:
+            del self._rows[row]
+        return len(old)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteUsageBackend:
+    """Usage totals in a SQLite table, incremented by each flush."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = open_database(self.path)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                " day TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL,"
+                + "".join(f" {name} INTEGER NOT NULL DEFAULT 0," for name in FIELDS)
+                + " PRIMARY KEY (day, kind, key)) WITHOUT ROWID"
+            )
+            self._connection = connection
+        return self._connection
+
+    def add_many(self, rows: list[tuple[str, str, str, dict]]) -> None:
+        columns = ", ".join(FIELDS)
+        updates = ", ".join(f"{name} = {name} + excluded.{name}" for name in FIELDS)
+        values = [(day, kind, key, *(counts.get(name, 0) for name in FIELDS)) for day, kind, key, counts in rows]
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(
+                    f"INSERT INTO usage (day, kind, key, {columns}) VALUES (?, ?, ?{', ?' * len(FIELDS)}) "
+                    f"ON CONFLICT(day, kind, key) DO UPDATE SET {updates}",
+                    values,
+                )
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def query(self, kind: str, since_day: str, key: str | None = None) -> list[tuple[str, str, dict]]:
+        sql = f"SELECT day, key, {', '.join(FIELDS)} FROM usage WHERE kind = ? AND day >= ?"
+        params = [kind, since_day]
+        if key is not None:
+            sql += " AND key = ?"
+            params.append(key)
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+        return [(day, row_key, dict(zip(FIELDS, counts))) for day, row_key, *counts in rows]
+
+    def delete_before(self, day: str) -> int:
+        with self._lock:
+            return self._connect().execute("DELETE FROM usage WHERE day < ?", (day,)).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+def create_usage_backend():
+    """Store usage next to the sessions: in SQLite, or in memory with SESSION_BACKEND=memory."""
+    if os.environ.get("SESSION_BACKEND", "sqlite").lower() == "memory":
+        return MemoryUsageBackend()
+    return SQLiteUsageBackend(os.environ.get("SESSION_DB_PATH", "data/sessions.db"))
+
+
+class UsageLedger:
+    """Aggregates finished turns in memory and flushes them to a usage backend."""
+
+    def __init__(self, backend=None, retention_days: int = 30):
+        self.backend = backend if backend is not None else MemoryUsageBackend()
+        self.retention_days = retention_days
+        # Counts added since the last flush, by (day, kind, key)
+        self._pending: dict[tuple[str, str, str], dict] = {}
+        self.turns_recorded = 0
+        self.flushes = 0
+        self.flush_errors = 0
+
+    def record_turn(self, session_id: str | None, endpoint: str, turn: TurnUsage) -> None:
+        day = today()
+        totals = turn.totals()
+        keys = [("total", ""), ("endpoint", endpoint)]
+        if session_id:
+            keys.append(("session", session_id))
+        for kind, key in keys:
+            _add(self._pending.setdefault((day, kind, key), {}), **totals)
+        for name in set(turn.tool_calls) | set(turn.tools):
+            _add(self._pending.setdefault((day, "tool", name), {}), turns=1,
+                 tool_calls=turn.tool_calls.get(name, 0), **turn.tools.get(name, {}))
+        self.turns_recorded += 1
+
+    async def flush(self) -> int:
+        """Add the pending counts to the backend in one batch."""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        rows = [(day, kind, key, counts) for (day, kind, key), counts in pending.items()]
+        try:
+            await asyncio.to_thread(self.backend.add_many, rows)
+        except Exception as e:
+            # Keep the counts for the next flush, merged with anything recorded since
+            for row_key, counts in pending.items():
+                _add(self._pending.setdefault(row_key, {}), **counts)
+            self.flush_errors += 1
+            print(f"⚠️ Failed to persist token usage: {e}")
+            return 0
+        self.flushes += 1
+        return len(rows)
+
+    async def run_flusher(self, interval_seconds: float = 30) -> None:
+        """Background task that periodically flushes usage and deletes days past retention."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await self.flush()
+            cutoff = time.strftime("%Y-%m-%d", time.gmtime(time.time() - self.retention_days * 86400))
+            try:
+                await asyncio.to_thread(self.backend.delete_before, cutoff)
+            except Exception as e:
+                print(f"⚠️ Failed to delete old token usage: {e}")
+
+    async def close(self) -> None:
+        await self.flush()
+        await asyncio.to_thread(self.backend.close)
+
+    async def _query(self, kind: str, days: int, key: str | None = None) -> list[tuple[str, str, dict]]:
+        since = time.strftime("%Y-%m-%d", time.gmtime(time.time() - (days - 1) * 86400))
+        return await asyncio.to_thread(self.backend.query, kind, since, key)
+
+    async def report(self, days: int = 7) -> dict:
+        """Totals per day, endpoint and tool, and the costliest sessions, over the last days."""
+        await self.flush()
+        by_day = {day: counts for day, _, counts in await self._query("total", days)}
+
+        def merged(rows) -> dict:
+            result = {}
+            for _, key, counts in rows:
+                _add(result.setdefault(key, dict.fromkeys(FIELDS, 0)), **counts)
+            return result
+
+        endpoints = merged(await self._query("endpoint", days))
+        tools = merged(await self._query("tool", days))
+        sessions = merged(await self._query("session", days))
+        top = sorted(sessions.items(), key=lambda item: -item[1].get("prompt_tokens", 0))[:TOP_SESSIONS]
+        return {
+            "days": dict(sorted(by_day.items())),
+            "endpoints": endpoints,
+            "tools": dict(sorted(tools.items(), key=lambda item: -item[1].get("prompt_tokens", 0))),
+            "top_sessions": [{"session": session_id[:SESSION_ID_PREFIX], **counts} for session_id, counts in top],
+            "sessions": len(sessions),
+        }
+
+    async def session_usage(self, session_id: str, days: int = 30) -> dict:
+        """A session's totals, overall and per day."""
+        await self.flush()
+        rows = await self._query("session", days, session_id)
+        total = dict.fromkeys(FIELDS, 0)
+        for _, _, counts in rows:
+            _add(total, **counts)
+        return {"total": total, "days": {day: counts for day, _, counts in sorted(rows)}}
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "turns_recorded": self.turns_recorded,
+            "pending_rows": len(self._pending),
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+        }
+
+
+async def track_usage(ledger: UsageLedger, endpoint: str, session_id: str | None, events):
+    """Pass a turn's (event, data) stream through, accounting its round trips and tokens."""
+    turn = start_turn()
+    try:
+        async for event in events:
+            yield event
+    finally:
+        ledger.record_turn(session_id, endpoint, turn)
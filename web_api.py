@@ -1,16 +1,49 @@
-from fastapi import FastAPI, HTTPException
+# Started first so the report covers this module's own imports
+from startup import StartupReport
+startup_report = StartupReport()
+
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.requests import HTTPConnection
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import AsyncIterator
+import asyncio
+import json
+import math
 import os
+import time
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from coolman_agent import create_coolman_agent
-from agent_framework import AgentThread
+from coolman_agent import (
+    compaction_stats,
+    create_coolman_agent,
+    get_thread_messages,
+    hedge_stats,
+    record_exchange,
+    refresh_knowledge_base,
+    retrieval_stats,
+    tool_execution_stats,
+    tool_results,
+    tool_selection_stats,
+)
+from admission import AdmissionController, BusyError
+from assets import AssetStore
+from coalesce import SingleFlight
+from disconnect import DisconnectStats, cancel_on_disconnect
+from intent_router import IntentRouter
+from metrics import observe_turn, record_error, register_session_store, render_metrics
+from rate_limit import RATE_LIMITED_MESSAGE, RateLimiter, acquire_all
+from response_cache import ResponseCache, normalize_message
+from session_backends import create_session_backend
+from session_store import SessionStore
+from upstream import close_upstream_http_client, connection_stats, prewarm_connections
+from usage import UsageLedger, create_usage_backend, track_usage
+
+startup_report.mark("imports")
 
 app = FastAPI(title="Coolman Fuels API")
 
@@ -24,9 +57,92 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store active agent and sessions
+# The chat widget and embed page, read and precompressed once, served with ETags
+assets = AssetStore(os.path.dirname(os.path.abspath(__file__)))
+assets.add("chat_widget.html")
+assets.add("embed_instructions.html")
+
+# Store active agent and sessions. The agent is created by a background warm-up;
+# requests that arrive first wait up to AGENT_READY_TIMEOUT_SECONDS for it.
 agent = None
-sessions = {}
+agent_ready = asyncio.Event()
+startup_error = None
+AGENT_READY_TIMEOUT_SECONDS = float(os.getenv("AGENT_READY_TIMEOUT_SECONDS", "30"))
+background_tasks = set()
+# With several worker processes (WEB_CONCURRENCY) a session's next message can land on
+# any worker, so sessions are shared through the backend unless routing is sticky
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+session_affinity = os.getenv("SESSION_AFFINITY", "false").lower() == "true"
+sessions = SessionStore(
+    max_bytes=int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024))),
+    idle_ttl_seconds=float(os.getenv("SESSION_IDLE_TTL_SECONDS", "3600")),
+    backend=create_session_backend(),
+    shared=workers > 1 and not session_affinity,
+)
+sweeper_task = None
+flusher_task = None
+register_session_store(sessions)
+
+# Token usage per session, tool, endpoint and day, flushed next to the sessions
+usage_ledger = UsageLedger(
+    create_usage_backend(),
+    retention_days=int(os.getenv("USAGE_RETENTION_DAYS", "30")),
+)
+usage_flusher_task = None
+
+# Answers to first-turn questions, invalidated when the knowledge base changes.
+# The version check also re-renders the precomputed tool outputs on a change.
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+    version_fn=refresh_knowledge_base,
+)
+
+# Answers simple lookups (phone, hours, "do you deliver to X") without the model.
+# Set INTENT_ROUTER_THRESHOLD above 1 to send everything to the model.
+intent_router = IntentRouter(threshold=float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.8")))
+
+# Adaptive upstream concurrency limit; excess requests wait briefly, then get a busy reply.
+# The configured limits are for the whole service, so each worker process gets its share.
+admission = AdmissionController(
+    initial_limit=max(1, int(os.getenv("UPSTREAM_CONCURRENCY", "4")) // workers),
+    max_limit=max(1, int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "16")) // workers),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10")),
+    latency_target=float(os.getenv("ADMISSION_LATENCY_TARGET_SECONDS", "4")),
+    max_retries=int(os.getenv("RATE_LIMIT_MAX_RETRIES", "2")),
+    retry_budget_seconds=float(os.getenv("RATE_LIMIT_RETRY_BUDGET_SECONDS", "10")),
+)
+
+# Per-client token buckets, so one script can't drain the shared model quota or fill the
+# session store: new sessions per IP, and messages per session and per IP (looser, for offices
+# behind one address). Set RATE_LIMIT_ENABLED=false to turn them off, e.g. for load tests.
+rate_limits_enabled = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+session_limiter = RateLimiter(
+    rate=float(os.getenv("RATE_LIMIT_SESSIONS_PER_MINUTE", "6")) / 60 if rate_limits_enabled else 0,
+    burst=float(os.getenv("RATE_LIMIT_SESSION_BURST", "10")),
+)
+message_limiter = RateLimiter(
+    rate=float(os.getenv("RATE_LIMIT_MESSAGES_PER_MINUTE", "10")) / 60 if rate_limits_enabled else 0,
+    burst=float(os.getenv("RATE_LIMIT_MESSAGE_BURST", "5")),
+)
+ip_message_limiter = RateLimiter(
+    rate=float(os.getenv("RATE_LIMIT_IP_MESSAGES_PER_MINUTE", "60")) / 60 if rate_limits_enabled else 0,
+    burst=float(os.getenv("RATE_LIMIT_IP_MESSAGE_BURST", "30")),
+)
+# Proxies in front of the app that append to X-Forwarded-For (1 for Render and Railway)
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
+# Concurrent identical first-turn questions share one upstream generation
+in_flight_questions = SingleFlight()
+
+# Model turns cancelled because the client disconnected, and the tokens that saved
+disconnect_stats = DisconnectStats()
+
+# WebSocket chat: heartbeat interval, and how long a socket may stay open without a message
+WS_HEARTBEAT_SECONDS = float(os.getenv("WS_HEARTBEAT_SECONDS", "20"))
+WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "900"))
+websocket_stats = {"open": 0, "connections": 0, "messages": 0, "heartbeat_timeouts": 0}
 
 class ChatRequest(BaseModel):
     message: str
@@ -35,101 +151,535 @@ class ChatRequest(BaseModel):
 class SessionResponse(BaseModel):
     session_id: str
 
+def import_agent_modules():
+    """The deferred heavy imports: agent_framework, openai and the agent middleware"""
+    import agent_framework.openai  # noqa: F401
+    import middleware  # noqa: F401
+
+async def warm_up():
+    """Create the agent in the background, so the server answers health checks while it loads"""
+    global agent, startup_error
+    try:
+        # In a worker thread the imports hold the GIL in slices, not the event loop for a second
+        await asyncio.to_thread(import_agent_modules)
+        startup_report.mark("agent_framework_import")
+        # Rate-limit retries are handled by the admission layer rather than the SDK
+        agent = await create_coolman_agent(max_retries=0)
+        sessions.deserialize_thread = agent.deserialize_thread
+        startup_report.mark("agent")
+    except Exception as e:
+        startup_error = str(e)
+        print(f"❌ Failed to initialize the agent: {e}")
+        return
+    finally:
+        agent_ready.set()
+    print("✅ Coolman Fuels Agent initialized")
+    print(startup_report.summary())
+    # Open upstream connections now so TLS handshakes stay off the first chat
+    await prewarm_connections()
+    startup_report.mark("prewarm")
+
 @app.on_event("startup")
 async def startup_event():
-    global agent
-    agent = await create_coolman_agent()
-    print("✅ Coolman Fuels Agent initialized")
+    global sweeper_task, flusher_task, usage_flusher_task
+    if workers > 1 and sessions.backend is None and not session_affinity:
+        print("⚠️ SESSION_BACKEND=memory with several workers - follow-up messages may lose their context")
+    sweeper_task = asyncio.create_task(
+        sessions.run_sweeper(float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60")))
+    )
+    flusher_task = asyncio.create_task(
+        sessions.run_flusher(float(os.getenv("SESSION_FLUSH_INTERVAL_SECONDS", "2")))
+    )
+    usage_flusher_task = asyncio.create_task(
+        usage_ledger.run_flusher(float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "30")))
+    )
+    warm_up_task = asyncio.create_task(warm_up())
+    background_tasks.add(warm_up_task)
+    warm_up_task.add_done_callback(background_tasks.discard)
+    startup_report.mark("server_start")
+
+async def require_agent():
+    """Return the agent, waiting for the warm-up if a request arrives during a cold start"""
+    if agent is None and not agent_ready.is_set():
+        try:
+            await asyncio.wait_for(agent_ready.wait(), AGENT_READY_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=503,
+                detail="The assistant is starting up. Please try again in a few seconds.",
+                headers={"Retry-After": "5"},
+            )
+    if agent is None:
+        raise HTTPException(status_code=500, detail="Agent not initialized")
+    return agent
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    global sessions
-    sessions.clear()
+    for task in (sweeper_task, flusher_task, usage_flusher_task):
+        if task:
+            task.cancel()
+    # Persist the turns and usage of the last flush interval before exiting
+    await sessions.close()
+    await usage_ledger.close()
+    await close_upstream_http_client()
     print("👋 Shutting down Coolman Fuels Agent...")
 
+def client_ip(connection: HTTPConnection) -> str:
+    """The client's address: the entry the last trusted proxy added to X-Forwarded-For"""
+    forwarded = [hop.strip() for hop in connection.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    if TRUSTED_PROXY_HOPS and forwarded:
+        return forwarded[-min(TRUSTED_PROXY_HOPS, len(forwarded))]
+    return connection.client.host if connection.client else "unknown"
+
+def rate_limit_retry_after(limiter: RateLimiter, key: str, kind: str) -> int:
+    """Take a token from the client's bucket; 0 if allowed, otherwise whole seconds to wait"""
+    retry_after = limiter.acquire(key)
+    if not retry_after:
+        return 0
+    record_error(f"rate_limited_{kind}")
+    return max(1, math.ceil(retry_after))
+
+def message_retry_after(ip: str, session_id: str | None) -> int:
+    """Charge a chat message to its session and IP; seconds to wait if either is over its limit
+
+    Nothing is charged unless both allow it, so a message rejected for its IP
+    doesn't use up its session's allowance, or the other way round.
+    """
+    limits = [(ip_message_limiter, ip, "ip_messages")]
+    if session_id:
+        limits.insert(0, (message_limiter, session_id, "messages"))
+    waits = acquire_all([(limiter, key) for limiter, key, _ in limits])
+    for (_, _, kind), wait in zip(limits, waits):
+        if wait:
+            record_error(f"rate_limited_{kind}")
+    retry_after = max(waits)
+    return max(1, math.ceil(retry_after)) if retry_after else 0
+
+def raise_if_rate_limited(retry_after: int):
+    """Reject the request with 429 and Retry-After if the client is over a limit"""
+    if retry_after:
+        raise HTTPException(status_code=429, detail=RATE_LIMITED_MESSAGE, headers={"Retry-After": str(retry_after)})
+
 @app.post("/session/new")
-async def new_session():
+async def new_session(request: Request):
     """Create a new chat session"""
-    # Limit active sessions to prevent memory issues
-    if len(sessions) > 1000:
-        # Remove oldest sessions
-        oldest_keys = list(sessions.keys())[:100]
-        for key in oldest_keys:
-            del sessions[key]
-    
-    session_id = os.urandom(16).hex()
-    sessions[session_id] = agent.get_new_thread()
+    await require_agent()
+    raise_if_rate_limited(rate_limit_retry_after(session_limiter, client_ip(request), "sessions"))
+    session_id = sessions.create(agent.get_new_thread())
     return {"session_id": session_id}
 
+@app.get("/session/{session_id}/stats")
+async def session_stats(session_id: str):
+    """Report the estimated history size and idle time of a session"""
+    await sessions.load(session_id)
+    stats = sessions.session_stats(session_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return stats
+
+@app.get("/session/{session_id}/usage")
+async def session_usage(session_id: str, days: int = 30):
+    """Report the model round trips and tokens a session has used, in total and per day"""
+    report = await usage_ledger.session_usage(session_id, days)
+    if not report["days"]:
+        raise HTTPException(status_code=404, detail="No usage recorded for this session")
+    return report
+
+async def get_or_create_session(session_id: str | None, ip: str | None = None):
+    """Return (session_id, thread), starting a new session if the id is unknown
+    
+    A new session counts against the client IP's session limit, when given.
+    """
+    thread = await sessions.load(session_id)
+    if thread is not None:
+        return session_id, thread
+    if ip is not None:
+        raise_if_rate_limited(rate_limit_retry_after(session_limiter, ip, "sessions"))
+    thread = agent.get_new_thread()
+    return sessions.create(thread), thread
+
+async def generate_answer(message: str, thread) -> AsyncIterator[tuple[str, dict]]:
+    """Stream the model's answer for a turn through admission control and 429 retries
+    
+    If the turn is cancelled (the client disconnected), the upstream stream is
+    closed, the admission slot released, and any partial answer recorded in the
+    thread, which the agent only updates once an answer is complete.
+    """
+    emitted = False
+    tool_call_ids = set()
+    answer = ""
+    # Chunks streamed across every round trip of the turn, about one completion token each
+    streamed_tokens = 0
+    try:
+        async with admission.slot():
+            attempt = 0
+            waited = 0.0
+            while True:
+                started = time.monotonic()
+                first_chunk = True
+                try:
+                    async for chunk in agent.run_stream(message, thread=thread):
+                        if first_chunk:
+                            first_chunk = False
+                            admission.on_first_token(time.monotonic() - started)
+                        if chunk.text or any(getattr(c, "type", None) == "function_call" for c in chunk.contents or []):
+                            streamed_tokens += 1
+                        for content in chunk.contents or []:
+                            if getattr(content, "type", None) == "function_call" and content.name:
+                                if content.call_id not in tool_call_ids:
+                                    tool_call_ids.add(content.call_id)
+                                    emitted = True
+                                    yield "tool_call", {"name": content.name}
+                        if chunk.text:
+                            emitted = True
+                            answer += chunk.text
+                            yield "delta", {"text": chunk.text}
+                    disconnect_stats.record_completed(streamed_tokens)
+                    return
+                except Exception as e:
+                    # Rate-limited before any output: wait out Retry-After and try again
+                    delay = admission.retry_delay(e, attempt, waited, emitted=emitted)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    waited += delay
+                    await asyncio.sleep(delay)
+    except asyncio.CancelledError:
+        disconnect_stats.record_cancelled(answer, streamed_tokens)
+        if answer:
+            await record_exchange(thread, message, answer)
+        raise
+
+async def run_turn(message: str, session_id: str, thread) -> AsyncIterator[tuple[str, dict]]:
+    """Run one chat turn, yielding (event, data) pairs as the answer is produced"""
+    # Pinned so a memory eviction can't drop the session before the turn is saved
+    sessions.pin(session_id)
+    try:
+        async for event in answer_turn(message, session_id, thread):
+            yield event
+    finally:
+        sessions.unpin(session_id)
+
+async def answer_turn(message: str, session_id: str, thread) -> AsyncIterator[tuple[str, dict]]:
+    """The turn itself: a routed, cached, coalesced or generated answer"""
+    # Simple lookups get a templated answer, recorded so the thread stays consistent
+    routed = intent_router.route(message)
+    if routed is not None:
+        await record_exchange(thread, message, routed.answer)
+        await sessions.update_size(session_id)
+        yield "delta", {"text": routed.answer}
+        return
+    
+    first_turn = not await get_thread_messages(thread)
+    if not first_turn:
+        try:
+            async for event in generate_answer(message, thread):
+                yield event
+        finally:
+            # Also after a disconnect, so a partial answer is counted and persisted
+            await sessions.update_size(session_id)
+        return
+    
+    # First-turn questions can be answered from the cache without the model
+    cached = response_cache.get(message)
+    if cached is not None:
+        await record_exchange(thread, message, cached)
+        await sessions.update_size(session_id)
+        yield "delta", {"text": cached}
+        return
+    
+    # Identical first-turn questions already in flight share one generation.
+    # The leader's thread is updated by the agent; followers record the answer.
+    key = normalize_message(message)
+    flight, leader = in_flight_questions.join(key)
+    if leader:
+        in_flight_questions.run(key, flight, generate_answer(message, thread))
+    
+    response_text = ""
+    try:
+        async for event, data in flight.subscribe():
+            if event == "delta":
+                response_text += data["text"]
+            yield event, data
+    except asyncio.CancelledError:
+        # The client disconnected. A follower keeps what it was shown; the leader's thread
+        # is updated by the generation, which runs on while anyone else is waiting for it.
+        if not leader and response_text:
+            await record_exchange(thread, message, response_text)
+        elif leader and flight.abandoned:
+            # Cancelled with us as its last subscriber: let it record the partial answer first
+            await flight.wait()
+        await sessions.update_size(session_id)
+        raise
+    
+    if leader:
+        response_cache.put(message, response_text)
+    else:
+        await record_exchange(thread, message, response_text)
+    await sessions.update_size(session_id)
+
+async def stream_turn(endpoint: str, message: str, session_id: str, thread) -> AsyncIterator[tuple[str, dict]]:
+    """Run a turn for a streaming endpoint: its events, then `done`, or `error` if the turn fails"""
+    try:
+        async for event in observe_turn(endpoint, track_usage(
+            usage_ledger, endpoint, session_id, run_turn(message, session_id, thread)
+        )):
+            yield event
+    except BusyError as e:
+        record_error(f"busy_{e.reason}")
+        yield "error", {"detail": str(e), "busy": True, "retry_after": e.retry_after}
+        return
+    except Exception as e:
+        record_error(type(e).__name__)
+        print(f"Error streaming chat: {e}")
+        yield "error", {"detail": "Error processing your message. Please try again."}
+        return
+    yield "done", {"session_id": session_id}
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """Send a message and get a response"""
-    if not agent:
-        raise HTTPException(status_code=500, detail="Agent not initialized")
+    await require_agent()
     
     if not request.message or not request.message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
+    raise_if_rate_limited(message_retry_after(client_ip(http_request), request.session_id))
     
     try:
-        # Get or create session
-        if request.session_id and request.session_id in sessions:
-            thread = sessions[request.session_id]
-            session_id = request.session_id
-        else:
-            thread = agent.get_new_thread()
-            session_id = os.urandom(16).hex()
-            sessions[session_id] = thread
+        session_id, thread = await get_or_create_session(request.session_id, client_ip(http_request))
         
         # Get response
+        # A client that gives up waiting cancels the turn
         response_text = ""
-        async for chunk in agent.run_stream(request.message, thread=thread):
-            if chunk.text:
-                response_text += chunk.text
+        async for event, data in cancel_on_disconnect(http_request.receive, observe_turn("chat", track_usage(
+            usage_ledger, "chat", session_id, run_turn(request.message, session_id, thread)
+        ))):
+            if event == "delta":
+                response_text += data["text"]
         
         return {
             "response": response_text,
             "session_id": session_id
         }
+    except BusyError as e:
+        record_error(f"busy_{e.reason}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
+    except HTTPException:
+        raise
     except Exception as e:
+        record_error(type(e).__name__)
         print(f"Error processing chat: {e}")
         raise HTTPException(status_code=500, detail="Error processing your message. Please try again.")
 
 @app.post("/chat/stream")
-async def chat_stream(request: ChatRequest):
-    """Send a message and stream the response"""
-    if not agent:
-        raise HTTPException(status_code=500, detail="Agent not initialized")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """Send a message and stream the response as Server-Sent Events
     
-    # Get or create session
-    if request.session_id and request.session_id in sessions:
-        thread = sessions[request.session_id]
-    else:
-        thread = agent.get_new_thread()
-        session_id = os.urandom(16).hex()
-        sessions[session_id] = thread
+    Events: `session` (session id, sent first), `tool_call` (tool name),
+    `delta` (answer text), then `done`, or `error` if the turn fails.
+    """
+    await require_agent()
+    
+    if not request.message or not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    raise_if_rate_limited(message_retry_after(client_ip(http_request), request.session_id))
+    
+    session_id, thread = await get_or_create_session(request.session_id, client_ip(http_request))
     
     async def generate():
-        async for chunk in agent.run_stream(request.message, thread=thread):
-            if chunk.text:
-                yield chunk.text
+        yield sse_event("session", {"session_id": session_id})
+        turn = stream_turn("chat_stream", request.message, session_id, thread)
+        async for event, data in cancel_on_disconnect(http_request.receive, turn):
+            yield sse_event(event, data)
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/chat/ws")
+async def chat_ws(websocket: WebSocket, session_id: str | None = None):
+    """Chat over one WebSocket bound to a session
+    
+    Client frames are JSON: `{"message": ...}` per turn, `{"type": "ping"}` or
+    `{"type": "pong"}`. Server frames carry the /chat/stream events with their
+    data inline (`{"event": "delta", "text": ...}`): `session` first (and again
+if the session expired and a turn had to start a new one), then per
+    turn `tool_call`, `delta` and `done` or `error`, plus `ping` heartbeats
+    every WS_HEARTBEAT_SECONDS. Sockets that stop answering, or send no message
+    for WS_IDLE_TIMEOUT_SECONDS, are closed; the widget reconnects on its next
+    message.
+    """
+    # Browsers don't apply CORS to WebSockets, so check the origin here; other clients send none
+    origin = websocket.headers.get("origin")
+    if origin and "*" not in allowed_origins and origin not in allowed_origins:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    
+    async def send(event: str, data: dict | None = None):
+        # The turn and the heartbeat both send; keep their frames whole
+        async with send_lock:
+            await websocket.send_text(json.dumps({"event": event, **(data or {})}))
+    
+    ip = client_ip(websocket)
+    try:
+        await require_agent()
+        session_id, _ = await get_or_create_session(session_id, ip)
+    except HTTPException as e:
+        retry_after = int((e.headers or {}).get("Retry-After", "5"))
+        await send("error", {"detail": e.detail, "busy": True, "retry_after": retry_after})
+        await websocket.close(code=1013)
+        return
+    await send("session", {"session_id": session_id})
+    
+    websocket_stats["connections"] += 1
+    websocket_stats["open"] += 1
+    messages: asyncio.Queue = asyncio.Queue()
+    last_received = last_message = time.monotonic()
+    answering = False
+    
+    async def answer():
+        nonlocal answering, session_id
+        # One turn at a time; messages sent meanwhile wait their turn
+        while True:
+            message = await messages.get()
+            answering = True
+            try:
+                # Looked up per turn, in case the store evicted the session while the socket was idle;
+                # if it had expired the turn starts a new one, and the client must use its id from now on
+                current_id, thread = await get_or_create_session(session_id)
+                if current_id != session_id:
+                    session_id = current_id
+                    await send("session", {"session_id": session_id})
+                async for event, data in stream_turn("chat_ws", message, session_id, thread):
+                    await send(event, data)
+            finally:
+                answering = False
     
-    from fastapi.responses import StreamingResponse
-    return StreamingResponse(generate(), media_type="text/plain")
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_SECONDS)
+            now = time.monotonic()
+            if now - last_received > 3 * WS_HEARTBEAT_SECONDS:
+                websocket_stats["heartbeat_timeouts"] += 1
+                await websocket.close(code=1001)
+                return
+            if now - last_message > WS_IDLE_TIMEOUT_SECONDS and messages.empty() and not answering:
+                await websocket.close(code=1000)
+                return
+            await send("ping")
+    
+    answer_task = asyncio.create_task(answer())
+    heartbeat_task = asyncio.create_task(heartbeat())
+    try:
+        while True:
+            try:
+                frame = json.loads(await websocket.receive_text())
+            except ValueError:
+                await send("error", {"detail": "Frames must be JSON"})
+                continue
+            last_received = time.monotonic()
+            if not isinstance(frame, dict):
+                await send("error", {"detail": "Frames must be JSON objects"})
+            elif frame.get("type") == "ping":
+                await send("pong")
+            elif frame.get("type") == "pong":
+                continue
+            elif isinstance(frame.get("message"), str) and frame["message"].strip():
+                last_message = last_received
+                retry_after = message_retry_after(ip, session_id)
+                if retry_after:
+                    await send("error", {"detail": RATE_LIMITED_MESSAGE, "busy": True, "retry_after": retry_after})
+                    continue
+                websocket_stats["messages"] += 1
+                messages.put_nowait(frame["message"])
+            else:
+                await send("error", {"detail": "Message cannot be empty"})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        answer_task.cancel()
+        heartbeat_task.cancel()
+        websocket_stats["open"] -= 1
 
 @app.get("/")
 async def root():
     return {"message": "Coolman Fuels API is running"}
 
 @app.get("/chat_widget.html")
-async def get_chat_widget():
+async def get_chat_widget(request: Request):
     """Serve the chat widget HTML file"""
-    return FileResponse("chat_widget.html", media_type="text/html")
+    return assets.response("chat_widget.html", request.headers)
+
+@app.get("/embed_instructions.html")
+async def get_embed_instructions(request: Request):
+    """Serve the page explaining how to embed the chat widget"""
+    return assets.response("embed_instructions.html", request.headers)
+
+@app.get("/usage")
+async def usage_report(days: int = 7):
+    """Token usage per day, endpoint and tool, and the costliest sessions, over the last days"""
+    return await usage_ledger.report(max(1, min(days, usage_ledger.retention_days)))
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, token and error counters"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the agent is created, 503 while warming up or if startup failed"""
+    if agent is not None:
+        return {"ready": True}
+    return JSONResponse(
+        status_code=503,
+        content={"ready": False, "error": startup_error} if startup_error else {"ready": False},
+        headers={"Retry-After": "1"},
+    )
 
 @app.get("/health")
 async def health():
-    return {
-        "status": "healthy", 
+    """Liveness: answers as soon as the server is up, before the agent is ready"""
+    body = {
+        "status": "unhealthy" if startup_error else "healthy",
         "agent_ready": agent is not None,
         "active_sessions": len(sessions),
+        "session_store": sessions.stats(),
+        "prompt_size": compaction_stats.as_dict(),
+        "tool_selection": tool_selection_stats.as_dict(),
+        "retrieval": retrieval_stats.as_dict(),
+        "hedging": hedge_stats.as_dict(),
+        "tool_execution": tool_execution_stats.as_dict(),
+        "response_cache": response_cache.stats(),
+        "intent_router": intent_router.stats(),
+        "upstream_connections": connection_stats.as_dict(),
+        "admission": admission.stats(),
+        "coalescing": in_flight_questions.stats(),
+        "disconnects": disconnect_stats.as_dict(),
+        "rate_limits": {
+            "sessions": session_limiter.stats(),
+            "messages": message_limiter.stats(),
+            "ip_messages": ip_message_limiter.stats(),
+        },
+        "websocket": websocket_stats,
+        "usage": usage_ledger.stats(),
+        "assets": assets.stats(),
+        "knowledge_base_version": tool_results.version,
+        "startup": startup_report.as_dict(),
         "service": "Coolman Fuels AI Agent"
     }
+    if startup_error:
+        return JSONResponse(status_code=503, content=body)
+    return body